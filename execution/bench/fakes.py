@@ -0,0 +1,140 @@
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+class LatencyModel:
+    """
+    Log-normal latency with the given median and p99 (ms), plus an error rate.
+    """
+    def __init__(self, median_ms=0.0, p99_ms=None, error_rate=0.0, seed=None):
+        self.median_ms = median_ms
+        self.p99_ms = p99_ms if p99_ms is not None else median_ms
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        # p99 of a log-normal sits 2.326 sigma above the median
+        if median_ms > 0 and self.p99_ms > median_ms:
+            self.sigma = math.log(self.p99_ms / median_ms) / 2.326
+        else:
+            self.sigma = 0.0
+
+    def sample(self):
+        """Returns (delay seconds, should_fail)."""
+        with self._lock:
+            if self.median_ms <= 0:
+                delay = 0.0
+            else:
+                delay = self.median_ms * math.exp(self._random.gauss(0, self.sigma)) / 1000
+            return delay, self._random.random() < self.error_rate
+
+    def wait(self, what):
+        delay, fail = self.sample()
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise ConnectionError(f"Fake {what} error (injected)") # Transient, like a dropped connection
+
+class FakeOpenAI:
+    """
+    Stands in for openai.OpenAI: chat.completions.create returns canned classification
+    JSON / drafts. `review_rate` of classifications come back intent UNKNOWN.
+    """
+    def __init__(self, latency=None, review_rate=0.0, seed=None):
+        self.latency = latency or LatencyModel()
+        self.review_rate = review_rate
+        self._random = random.Random(seed)
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model=None, messages=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+            unknown = self._random.random() < self.review_rate
+        self.latency.wait("OpenAI")
+
+        system = messages[0]["content"]
+        classification = {
+            "language": "EN",
+            "language_confidence": 0.97,
+            "risk": "LOW",
+            "risk_reason": "NONE",
+            "intent": "UNKNOWN" if unknown else "KNOWN",
+        }
+        if "- draft:" in system: # Single-call classify + draft
+            draft = "" if unknown else "Thanks for reaching out! What day works for you?"
+            content = json.dumps(dict(classification, draft=draft))
+        elif "classification engine" in system:
+            content = json.dumps(classification)
+        else:
+            content = "Thanks for reaching out! What day/time works for you?"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+class FakeTwilioTransport:
+    """
+    In-process TwilioConnector transport with injected latency/errors.
+    """
+    name = "fake"
+
+    def __init__(self, latency=None):
+        self.latency = latency or LatencyModel()
+        self.sent = 0
+        self._lock = threading.Lock()
+
+    def send(self, to_number, body, from_number):
+        self.latency.wait("Twilio")
+        with self._lock:
+            self.sent += 1
+            return f"SMFAKE{self.sent:026d}"
+
+class FakeTwilioServer:
+    """
+    Local HTTP server answering the Messages API (POST .../Messages.json), for the
+    REST transport via TWILIO_BASE_URL / RestTransport(base_url=...).
+    """
+    def __init__(self, latency=None, host="127.0.0.1", port=0):
+        latency = latency or LatencyModel()
+        counter = {"sent": 0}
+        lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # keep-alive
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                try:
+                    latency.wait("Twilio")
+                    with lock:
+                        counter["sent"] += 1
+                        sid = f"SMFAKE{counter['sent']:026d}"
+                    status, payload = 201, {"sid": sid, "status": "queued"}
+                except Exception as e:
+                    status, payload = 500, {"code": 20500, "message": str(e), "status": 500}
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.counter = counter
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://{host}:{self.server.server_port}"
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-twilio", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+        return False
@@ -0,0 +1,410 @@
+"""
+Offline load test for the webhook -> enrich -> approve -> send pipeline.
+
+Drives /twilio/inbound through the Flask test client with synthetic Twilio payloads
+(bursts, duplicate MessageSids, media, owner commands) against fake OpenAI/Twilio
+backends, on a throwaway SQLite file. Nothing leaves the machine.
+
+    python -m execution.bench.load_test --messages 2000 --rate 200 --openai-ms 400 --openai-p99-ms 2500
+    python -m execution.bench.load_test --save-baseline .tmp/bench_baseline.json
+    python -m execution.bench.load_test --baseline .tmp/bench_baseline.json   # exit 1 on regression
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from execution.bench.fakes import LatencyModel, FakeOpenAI, FakeTwilioTransport, FakeTwilioServer
+
+OWNER = "+15550000000"
+BUSINESS = "+15559990000"
+BODIES = [
+    "What are your hours on {day}?",
+    "Can I book an appointment for {day}?",
+    "How much does a consultation cost?",
+    "Do you have availability {day} afternoon?",
+    "Hi, is parking available near you?",
+    "Can I reschedule to {day} morning? Order {n}",
+    "Thanks! See you {day}.",
+]
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test for the MILO pipeline.")
+    parser.add_argument("--messages", type=int, default=500, help="Inbound customer messages to send")
+    parser.add_argument("--customers", type=int, default=100, help="Distinct customer numbers (threads)")
+    parser.add_argument("--rate", type=float, default=0, help="Target inbound messages/sec (0 = as fast as possible)")
+    parser.add_argument("--burst", type=int, default=1, help="Messages sent back-to-back per tick")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent webhook clients")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.05, help="Share of payloads re-sent with a used MessageSid")
+    parser.add_argument("--media-ratio", type=float, default=0.05, help="Share of payloads carrying media")
+    parser.add_argument("--approve-ratio", type=float, default=0.8, help="Drafts approved (A)")
+    parser.add_argument("--edit-ratio", type=float, default=0.1, help="Drafts edited (E); the rest are rejected (R)")
+    parser.add_argument("--openai-ms", type=float, default=50, help="Fake OpenAI median latency")
+    parser.add_argument("--openai-p99-ms", type=float, default=None, help="Fake OpenAI p99 latency (default: median)")
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--review-rate", type=float, default=0.1, help="Classifications returned as intent UNKNOWN")
+    parser.add_argument("--twilio-ms", type=float, default=20, help="Fake Twilio median latency")
+    parser.add_argument("--twilio-p99-ms", type=float, default=None)
+    parser.add_argument("--twilio-error-rate", type=float, default=0.0)
+    parser.add_argument("--twilio-http", action="store_true", help="Send through the REST transport to a local fake Twilio server")
+    parser.add_argument("--send-rate", type=float, default=1000, help="Token bucket rate for the sender (real default: 1/s)")
+    parser.add_argument("--pipeline", choices=["two_call", "single_call"], default=None, help="Override ENRICH_PIPELINE")
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds to wait for each drain phase")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--work-dir", default=None, help="Where the throwaway DB goes (default: temp dir)")
+    parser.add_argument("--output", default=None, help="Write the JSON report here")
+    parser.add_argument("--baseline", default=None, help="Compare against this report; exit 1 on regression")
+    parser.add_argument("--save-baseline", default=None, help="Store this run's report as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression vs baseline")
+    parser.add_argument("--verbose", action="store_true", help="Keep INFO logging on during the run")
+    return parser.parse_args(argv)
+
+def build_workload(args, rng):
+    """
+    Customer webhook payloads in send order. Duplicates re-use an earlier MessageSid
+    (Twilio retries); media payloads carry one MediaUrl.
+    """
+    customers = [f"+1555{n:07d}" for n in range(1, args.customers + 1)]
+    payloads = []
+    for n in range(args.messages):
+        if payloads and rng.random() < args.duplicate_ratio:
+            payloads.append(dict(rng.choice(payloads)))
+            continue
+        body = rng.choice(BODIES).format(day=rng.choice(DAYS), n=n)
+        payload = {"MessageSid": f"SMBENCH{n:026d}", "From": rng.choice(customers), "To": BUSINESS, "Body": body, "NumMedia": "0"}
+        if rng.random() < args.media_ratio:
+            payload.update({"NumMedia": "1", "MediaUrl0": f"https://example.com/media/{n}.jpg"})
+        payloads.append(payload)
+    return payloads
+
+def percentile(samples, q):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[index]
+
+def histogram_quantile(q, bounds, counts):
+    """
+    Prometheus-style quantile estimate from (non-cumulative) bucket counts: linear within the bucket.
+    """
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    cumulative = 0
+    lower = 0.0
+    for bound, count in zip(bounds + (float("inf"),), counts):
+        if cumulative + count >= rank and count:
+            if bound == float("inf"):
+                return lower # Above the last finite bucket
+            return lower + (bound - lower) * (rank - cumulative) / count
+        cumulative += count
+        lower = bound
+    return lower
+
+def snapshot_stages():
+    from execution.utils.metrics import STAGE_SECONDS, STAGE_ERRORS
+    snapshot = {}
+    for (stage,), child in list(STAGE_SECONDS._children.items()):
+        with child._lock:
+            errors = STAGE_ERRORS.labels(stage).value
+            snapshot[stage] = (list(child.counts), child.count, child.sum, errors)
+    return snapshot
+
+def stage_report(before, after, bounds):
+    report = {}
+    for stage, (counts, count, total, errors) in sorted(after.items()):
+        prev_counts, prev_count, prev_total, prev_errors = before.get(stage, ([0] * len(counts), 0, 0.0, 0))
+        delta = [a - b for a, b in zip(counts, prev_counts)]
+        n = count - prev_count
+        if not n:
+            continue
+        report[stage] = {
+            "count": n,
+            "errors": errors - prev_errors,
+            "mean_ms": round((total - prev_total) / n * 1000, 2),
+            **{f"p{int(q * 100)}_ms": _ms(histogram_quantile(q, bounds, delta)) for q in (0.5, 0.95, 0.99)},
+        }
+    return report
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+def db_bytes(path):
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+
+def _wait_until(predicate, timeout, interval=0.05):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(interval)
+    return predicate()
+
+@contextmanager
+def _patched(stack):
+    """Yields set(obj, name, value), undone on exit."""
+    def set_attr(obj, name, value):
+        original = getattr(obj, name)
+        setattr(obj, name, value)
+        stack.callback(setattr, obj, name, original)
+    yield set_attr
+
+def run_benchmark(args):
+    # Imported here so --help works without touching the DB/config
+    import execution.config as config
+    import execution.utils.db as db_module
+    import execution.jobs.job_02_enrich as job_02
+    import execution.jobs.job_03_act as job_03
+    import execution.run as run
+    import execution.connectors.twilio as twilio_connector
+    from execution.connectors.twilio import shared_connector, RestTransport
+    from execution.utils.audit import flush_audit
+    from execution.utils.metrics import STAGE_SECONDS
+
+    rng = random.Random(args.seed)
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="milo-bench-")
+    os.makedirs(work_dir, exist_ok=True)
+    db_path = os.path.join(work_dir, "bench.db")
+    for path in (db_path, db_path + "-wal", db_path + "-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+
+    openai_latency = LatencyModel(args.openai_ms, args.openai_p99_ms, args.openai_error_rate, seed=args.seed)
+    twilio_latency = LatencyModel(args.twilio_ms, args.twilio_p99_ms, args.twilio_error_rate, seed=args.seed + 1)
+    fake_openai = FakeOpenAI(openai_latency, review_rate=args.review_rate, seed=args.seed)
+    payloads = build_workload(args, rng)
+
+    with ExitStack() as stack:
+        set_attr = stack.enter_context(_patched(stack))
+        set_attr(config, "DATABASE_PATH", db_path)
+        set_attr(db_module, "DATABASE_PATH", db_path)
+        set_attr(job_02, "openai_client", fake_openai)
+        set_attr(job_02, "OWNER_PHONE_NUMBER", OWNER)
+        set_attr(run, "OWNER_PHONE_NUMBER", OWNER)
+        set_attr(job_03, "ENABLE_SENDING", True)
+        set_attr(twilio_connector, "TWILIO_SEND_RATE", args.send_rate)
+        set_attr(twilio_connector, "TWILIO_SEND_BURST", max(1.0, args.send_rate / 10))
+        if args.pipeline:
+            set_attr(job_02, "ENRICH_PIPELINE", args.pipeline)
+        if args.twilio_http:
+            server = stack.enter_context(FakeTwilioServer(twilio_latency))
+            transport = RestTransport("ACbench", "bench", base_url=server.base_url)
+        else:
+            transport = FakeTwilioTransport(twilio_latency)
+        set_attr(shared_connector(), "transport", transport)
+        if not args.verbose:
+            milo_logger = logging.getLogger("MILO")
+            stack.callback(milo_logger.setLevel, milo_logger.level)
+            milo_logger.setLevel(logging.WARNING)
+
+        db_module.init_db()
+        job_02.classification_cache.reset()
+        db_start = db_bytes(db_path)
+        stages_before = snapshot_stages()
+
+        stop = threading.Event()
+        sender = threading.Thread(target=job_03.run_polling_loop, args=(stop,), name="bench-sender", daemon=True)
+        sender.start()
+        stack.callback(sender.join, 5)
+        stack.callback(job_03.wake_outbound_sender)
+        stack.callback(stop.set)
+        job_02.enrichment_pool.start()
+
+        local = threading.local()
+        webhook_ms = []
+        owner_ms = []
+        failures = {"webhook": 0, "owner": 0}
+        lock = threading.Lock()
+
+        def post(payload, samples, kind):
+            client = getattr(local, "client", None)
+            if client is None:
+                client = local.client = run.app.test_client()
+            started = time.perf_counter()
+            response = client.post("/twilio/inbound", data=payload)
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                samples.append(elapsed)
+                if response.status_code != 200:
+                    failures[kind] += 1
+
+        # Phase 1: inbound load (paced in bursts when --rate is set)
+        load_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="bench-client") as pool:
+            futures = []
+            tick = args.burst / args.rate if args.rate else 0
+            for index in range(0, len(payloads), args.burst):
+                if tick:
+                    delay = load_start + (index // args.burst) * tick - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                for payload in payloads[index:index + args.burst]:
+                    futures.append(pool.submit(post, payload, webhook_ms, "webhook"))
+            for future in futures:
+                future.result()
+        load_seconds = time.perf_counter() - load_start
+
+        # Phase 2: enrichment drains (pool, then a sweep for anything shed under backpressure)
+        job_02.enrichment_pool.join()
+        job_02.process_enrichment()
+        enrich_seconds = time.perf_counter() - load_start
+
+        # Phase 3: owner commands, then the sender drains
+        drafts = [r["id"] for r in db_module.get_connection().execute(
+            "SELECT id FROM messages WHERE type = 'DRAFT' AND status = 'DRAFT_PENDING_APPROVAL' ORDER BY timestamp, id")]
+        commands = []
+        for draft_id in drafts:
+            roll = rng.random()
+            if roll < args.approve_ratio:
+                commands.append(f"A {draft_id}")
+            elif roll < args.approve_ratio + args.edit_ratio:
+                commands.append(f"E {draft_id} Thanks, we can do Friday at 10.")
+            else:
+                commands.append(f"R {draft_id}")
+        approve_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="bench-owner") as pool:
+            for future in [pool.submit(post, {"From": OWNER, "To": BUSINESS, "Body": body, "MessageSid": f"SMOWNER{n:026d}"}, owner_ms, "owner")
+                           for n, body in enumerate(commands)]:
+                future.result()
+
+        def outbound_empty():
+            row = db_module.get_connection().execute(
+                "SELECT count(*) FROM messages WHERE status IN ('APPROVED_TO_SEND', 'SENDING')").fetchone()
+            return row[0] == 0
+        drained = _wait_until(outbound_empty, args.timeout)
+        send_seconds = time.perf_counter() - approve_start
+        total_seconds = time.perf_counter() - load_start
+
+        stop.set()
+        job_03.wake_outbound_sender()
+        flush_audit()
+        conn = db_module.get_connection()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        statuses = {r["status"]: r["n"] for r in conn.execute("SELECT status, count(*) AS n FROM messages GROUP BY status")}
+        inbound = conn.execute("SELECT count(*) FROM messages WHERE type = 'INBOUND'").fetchone()[0]
+        audit_rows = conn.execute("SELECT count(*) FROM audit_log").fetchone()[0]
+        sent = statuses.get("SENT", 0)
+        db_end = db_bytes(db_path)
+        stages = stage_report(stages_before, snapshot_stages(), STAGE_SECONDS.buckets)
+
+    return {
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "save_baseline")},
+        "workload": {
+            "payloads": len(payloads),
+            "unique_inbound": inbound,
+            "duplicates": len(payloads) - inbound,
+            "owner_commands": len(commands),
+        },
+        "throughput": {
+            "ingest_per_s": round(len(payloads) / load_seconds, 1) if load_seconds else None,
+            "enriched_per_s": round(inbound / enrich_seconds, 1) if enrich_seconds else None,
+            "sent_per_s": round(sent / send_seconds, 1) if send_seconds and sent else None,
+            "pipeline_seconds": round(total_seconds, 2),
+        },
+        "webhook_ms": {f"p{int(q * 100)}": _round(percentile(webhook_ms, q)) for q in (0.5, 0.95, 0.99)},
+        "owner_command_ms": {f"p{int(q * 100)}": _round(percentile(owner_ms, q)) for q in (0.5, 0.95, 0.99)},
+        "stages": stages,
+        "db": {
+            "start_bytes": db_start,
+            "end_bytes": db_end,
+            "bytes_per_message": round((db_end - db_start) / max(1, inbound), 1),
+            "audit_rows": audit_rows,
+        },
+        "outcome": {
+            "statuses": statuses,
+            "drained": drained,
+            "http_errors": failures,
+            "openai_calls": fake_openai.calls,
+        },
+    }
+
+def _round(value):
+    return None if value is None else round(value, 2)
+
+# (path, higher_is_better, absolute slack) checked against the baseline
+COMPARED = [
+    (("throughput", "ingest_per_s"), True, 0),
+    (("throughput", "enriched_per_s"), True, 0),
+    (("throughput", "sent_per_s"), True, 0),
+    (("webhook_ms", "p95"), False, 1.0),
+    (("webhook_ms", "p99"), False, 2.0),
+    (("db", "bytes_per_message"), False, 64),
+]
+
+def compare(report, baseline, tolerance):
+    """
+    Returns regressions as (metric, baseline, current) for values worse than baseline by
+    more than `tolerance` (relative) plus the metric's absolute slack.
+    """
+    checks = list(COMPARED)
+    for stage in baseline.get("stages", {}):
+        if stage in report.get("stages", {}):
+            checks.append((("stages", stage, "p95_ms"), False, 1.0))
+
+    regressions = []
+    for path, higher_is_better, slack in checks:
+        old, new = baseline, report
+        for key in path:
+            old = (old or {}).get(key)
+            new = (new or {}).get(key)
+        if old is None or new is None:
+            continue
+        if higher_is_better:
+            worse = new < old * (1 - tolerance) - slack
+        else:
+            worse = new > old * (1 + tolerance) + slack
+        if worse:
+            regressions.append((".".join(path), old, new))
+    return regressions
+
+def print_report(report, out=sys.stdout):
+    t, w = report["throughput"], report["webhook_ms"]
+    print(f"Workload: {report['workload']}", file=out)
+    print(f"Throughput: ingest {t['ingest_per_s']}/s, enrich {t['enriched_per_s']}/s, send {t['sent_per_s']}/s, "
+          f"pipeline {t['pipeline_seconds']}s", file=out)
+    print(f"Webhook latency ms: p50 {w['p50']}  p95 {w['p95']}  p99 {w['p99']}", file=out)
+    print(f"{'stage':<24}{'count':>8}{'err':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}", file=out)
+    for stage, s in report["stages"].items():
+        print(f"{stage:<24}{s['count']:>8}{s['errors']:>6}{_fmt(s['p50_ms']):>10}{_fmt(s['p95_ms']):>10}{_fmt(s['p99_ms']):>10}", file=out)
+    d = report["db"]
+    print(f"DB: {d['start_bytes']} -> {d['end_bytes']} bytes ({d['bytes_per_message']} B/msg), {d['audit_rows']} audit rows", file=out)
+    print(f"Outcome: {report['outcome']}", file=out)
+
+def _fmt(value):
+    return "-" if value is None else f"{value:.1f}"
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run_benchmark(args)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for metric, old, new in regressions:
+            print(f"REGRESSION {metric}: {old} -> {new}")
+        if regressions:
+            return 1
+        print(f"No regressions vs {args.baseline} (tolerance {args.tolerance:.0%})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""
+Cold-start report: per-module import cost and time until /health answers.
+
+Each run is a fresh interpreter (`python -X importtime`), so nothing is cached from
+the calling process. Flags SDKs that should stay off the import path (they load on
+first use).
+
+    python -m execution.bench.startup
+    python -m execution.bench.startup --top 40 --output .tmp/startup.json
+    python -m execution.bench.startup --budget-ms 1500   # exit 1 if slower, or if a lazy SDK is imported eagerly
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# Only imported when first used; seeing them at startup is a regression
+LAZY_MODULES = ("openai", "twilio", "requests")
+
+# Runs in the child: import the app, then one /health request
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import execution.run as run
+imported = time.perf_counter()
+status = run.app.test_client().get("/health").status_code
+healthy = time.perf_counter()
+print(json.dumps({"import_ms": (imported - start) * 1000, "healthy_ms": (healthy - start) * 1000,
+                  "status": status, "modules": sorted(sys.modules)}))
+"""
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Startup import cost and time-to-healthy.")
+    parser.add_argument("--top", type=int, default=20, help="Slowest modules to list")
+    parser.add_argument("--budget-ms", type=float, default=None, help="Fail when time-to-healthy exceeds this")
+    parser.add_argument("--output", default=None, help="Write the JSON report here")
+    return parser.parse_args(argv)
+
+def parse_importtime(stderr):
+    """
+    `-X importtime` lines -> {module: (self_us, cumulative_us)}.
+    """
+    costs = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = [f.strip() for f in line[len("import time:"):].split("|")]
+        if len(fields) != 3 or not fields[0].isdigit(): # Header row
+            continue
+        costs[fields[2].strip()] = (int(fields[0]), int(fields[1]))
+    return costs
+
+def by_package(costs):
+    """Self time summed per top-level package (ms), slowest first."""
+    totals = {}
+    for module, (self_us, _) in costs.items():
+        package = module.split(".")[0]
+        totals[package] = totals.get(package, 0) + self_us
+    return {k: round(v / 1000, 1) for k, v in sorted(totals.items(), key=lambda kv: -kv[1])}
+
+def measure(top=20):
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", PROBE],
+                            capture_output=True, text=True, env=env, check=True)
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+    costs = parse_importtime(result.stderr)
+    slowest = sorted(costs.items(), key=lambda kv: -kv[1][1])[:top]
+    return {
+        "import_ms": round(probe["import_ms"], 1),
+        "healthy_ms": round(probe["healthy_ms"], 1),
+        "health_status": probe["status"],
+        "modules_loaded": len(probe["modules"]),
+        "eager_lazy_modules": [m for m in LAZY_MODULES if m in probe["modules"]],
+        "packages_ms": by_package(costs),
+        "slowest_cumulative_ms": {m: round(cum / 1000, 1) for m, (_, cum) in slowest},
+    }
+
+def print_report(report, top=20, out=sys.stdout):
+    print(f"Import execution.run: {report['import_ms']} ms; /health {report['health_status']} after {report['healthy_ms']} ms "
+          f"({report['modules_loaded']} modules)", file=out)
+    print(f"{'package':<32}{'self ms':>10}", file=out)
+    for package, ms in list(report["packages_ms"].items())[:top]:
+        print(f"{package:<32}{ms:>10.1f}", file=out)
+    print(f"{'module (slowest cumulative)':<48}{'ms':>10}", file=out)
+    for module, ms in report["slowest_cumulative_ms"].items():
+        print(f"{module:<48}{ms:>10.1f}", file=out)
+    if report["eager_lazy_modules"]:
+        print(f"WARNING imported at startup (should load on first use): {', '.join(report['eager_lazy_modules'])}", file=out)
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = measure(args.top)
+    print_report(report, args.top)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.budget_ms is not None:
+        if report["healthy_ms"] > args.budget_ms or report["eager_lazy_modules"]:
+            print(f"REGRESSION startup {report['healthy_ms']} ms (budget {args.budget_ms} ms)")
+            return 1
+        print(f"Startup within budget ({report['healthy_ms']} <= {args.budget_ms} ms)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,29 +7,120 @@ load_dotenv()
 TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER")
+TWILIO_SEND_RATE = float(os.getenv("TWILIO_SEND_RATE", "1")) # Messages/sec per sending number (long code: 1, toll-free: 3, short code: 100)
+TWILIO_SEND_BURST = float(os.getenv("TWILIO_SEND_BURST", "1")) # Token bucket capacity per sending number
+if TWILIO_SEND_RATE <= 0 or TWILIO_SEND_BURST < 1: # Fail at startup, not on every send
+    raise ValueError(f"TWILIO_SEND_RATE must be > 0 and TWILIO_SEND_BURST >= 1 (got {TWILIO_SEND_RATE}, {TWILIO_SEND_BURST})")
+TWILIO_RATE_STATE_PATH = os.getenv("TWILIO_RATE_STATE_PATH") # Send budget shared by all processes (flock); default: DATABASE_PATH + ".sendrate"
+TWILIO_TRANSPORT = os.getenv("TWILIO_TRANSPORT", "auto") # "auto" (rest if credentials set, else mock) | "rest" | "mock"
+TWILIO_BASE_URL = os.getenv("TWILIO_BASE_URL") # Override the API host (e.g. http://127.0.0.1:8099 fake Twilio for load tests)
+TWILIO_POOL_SIZE = int(os.getenv("TWILIO_POOL_SIZE", "16")) # Keep-alive connections to the API (>= SEND_WORKERS)
+TWILIO_CONNECT_TIMEOUT = float(os.getenv("TWILIO_CONNECT_TIMEOUT", "3.05")) # Seconds
+TWILIO_READ_TIMEOUT = float(os.getenv("TWILIO_READ_TIMEOUT", "10")) # Seconds
 
 # Owner Config
 OWNER_PHONE_NUMBER = os.getenv("OWNER_PHONE_NUMBER")
+OWNER_NOTIFY_PENDING_TTL = int(os.getenv("OWNER_NOTIFY_PENDING_TTL", "600")) # Seconds before a PENDING notification (sender crashed mid-send) can be retried
 
 # System Config
 DATABASE_PATH = os.getenv("DATABASE_PATH", "execution/milo.db")
 BASE_URL = os.getenv("BASE_URL", "http://localhost:5000")
-POLLING_INTERVAL = 15  # Seconds
+POLLING_INTERVAL = 15  # Seconds (safety-net poll; approvals wake the sender immediately)
+POLLING_MAX_INTERVAL = 120 # Seconds (poll backs off to this while the outbound queue is empty)
 LOG_PATH = ".tmp/execution.log"
+
+# Logging
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_LEVELS = os.getenv("LOG_LEVELS", "") # Per-module overrides, e.g. "jobs.job_02_enrich=DEBUG,utils.db=WARNING"
+LOG_ROTATION = os.getenv("LOG_ROTATION", "size") # "size" (LOG_MAX_BYTES) | "midnight" (daily)
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "7")) # Rotated files kept (gzipped)
+METRICS_DIR = os.getenv("METRICS_DIR", "") # Set (gunicorn.conf.py): workers export snapshots here and /metrics merges them
+METRICS_EXPORT_INTERVAL = 5 # Seconds between snapshot exports (staleness of other workers' numbers)
+LOG_PER_PROCESS = os.getenv("LOG_PER_PROCESS", "false").lower() == "true" # One file per PID (set by gunicorn.conf.py: workers must not rotate a shared file)
+
+# SQLite Tuning
+DB_BUSY_TIMEOUT = 5.0 # Seconds to wait on a locked database
+DB_CACHE_SIZE_KB = 16000 # Page cache per connection
+DB_MMAP_SIZE = 128 * 1024 * 1024 # Bytes of the DB file memory-mapped for reads
+DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", "256")) # Prepared statements kept per connection
+DB_LOCK_RETRIES = 3 # BEGIN IMMEDIATE retries (after busy_timeout) before giving up
 ENABLE_SENDING = os.getenv("ENABLE_SENDING", "false").lower() == "true"
 
+# Production Server (gunicorn -c execution/gunicorn.conf.py; WEB_WORKERS / WEB_THREADS / PORT are read there)
+LEADER_LOCK_PATH = os.getenv("LEADER_LOCK_PATH") # flock held by the process running the background loops; default: DATABASE_PATH + ".leader"
+LEADER_RETRY_INTERVAL = 5 # Seconds between standby attempts to take over leadership
+WAKE_CHECK_INTERVAL = 1.0 # Seconds; sender checks for approvals committed by other processes (PRAGMA data_version)
+
+# Outbound Sender
+SEND_WORKERS = int(os.getenv("SEND_WORKERS", "4")) # Threads (receivers) sent in parallel
+SEND_COMMIT_BATCH = 50 # Send results per status/audit commit
+SEND_COMMIT_INTERVAL = 0.25 # Seconds; flush partial batches at least this often
+SEND_CLAIM_BATCH = int(os.getenv("SEND_CLAIM_BATCH", "100")) # Rows leased per claim
+SEND_LEASE_SECONDS = int(os.getenv("SEND_LEASE_SECONDS", "120")) # Lease on a SENDING row; renewed before each send, reclaimable after expiry
+
+# Audit Log Writer (group commit)
+AUDIT_BATCH_SIZE = 200 # Rows per group commit
+AUDIT_FLUSH_INTERVAL = 0.5 # Seconds; queued audit rows are committed at least this often
+AUDIT_QUEUE_SIZE = 10000 # Pending rows before record() flushes inline
+
+# Daily Report (job_04_report)
+REPORT_BATCH_SIZE = 5000 # Source rows folded into the rollups per transaction
+REPORT_INTERVAL = 900 # Seconds between incremental rollup updates
+REPORT_DIGEST_HOUR = int(os.getenv("REPORT_DIGEST_HOUR", "8")) # UTC hour after which yesterday's SMS digest is sent
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN") # Bearer token for /reports (and other admin endpoints); unset = disabled
+
+# Retention (job_05_retention)
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "90")) # Terminal drafts (SENT, REJECTED, FAILED_SEND) and imported history older than this move to the archive
+AUDIT_RETENTION_DAYS = int(os.getenv("AUDIT_RETENTION_DAYS", "180")) # Audit events older than this move to the archive
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR") # Yearly archive files (milo-archive-YYYY.db); default: archive/ next to DATABASE_PATH
+RETENTION_BATCH_SIZE = 500 # Rows moved per (short) write transaction
+RETENTION_PAUSE = 0.2 # Seconds between batches, so webhook writes interleave
+RETENTION_INTERVAL = 6 * 3600 # Seconds between retention runs
+VACUUM_STEP_PAGES = 1000 # Free pages returned to the OS per incremental_vacuum step
+
+# Enrichment Worker Pool
+ENRICH_WORKERS = int(os.getenv("ENRICH_WORKERS", "4"))
+ENRICH_QUEUE_SIZE = int(os.getenv("ENRICH_QUEUE_SIZE", "100")) # Per worker
+ENRICH_SUBMIT_TIMEOUT = 0.05 # Seconds to wait for a queue slot before shedding to the sweep
+ENRICH_SWEEP_INTERVAL = 60 # Seconds between safety-net sweeps of the RECEIVED backlog
+ENRICH_CONCURRENCY = int(os.getenv("ENRICH_CONCURRENCY", "8")) # Max threads enriched in parallel when draining the backlog
+ENRICH_LEASE_SECONDS = 300 # Lease on an inbound row being enriched (across processes); reclaimable after expiry
+ENRICH_BACKLOG_PAGE = int(os.getenv("ENRICH_BACKLOG_PAGE", "100")) # Rows per page (and per checkpoint) when draining the backlog
+
 # OpenAI Config
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL = "gpt-4o-mini" # Cost effective, fast
 MAX_TOKENS = 150
-OPENAI_TIMEOUT = 10 # Seconds
+DRAFT_TEMPERATURE = 0.3 # Reply drafting, in both pipelines (classification alone runs at 0)
+OPENAI_TIMEOUT = 10 # Seconds; upper bound for the adaptive timeout
+OPENAI_MIN_TIMEOUT = 2.0 # Seconds; lower bound for the adaptive timeout
+OPENAI_TIMEOUT_PERCENTILE = 0.99 # Timeout = OPENAI_TIMEOUT_MULTIPLIER x this percentile of recent latencies
+OPENAI_TIMEOUT_MULTIPLIER = 2.0
+OPENAI_RETRIES = int(os.getenv("OPENAI_RETRIES", "2")) # Retries of timeouts / 429 / 5xx (jittered exponential backoff)
+OPENAI_BACKOFF_BASE = 0.5 # Seconds
+OPENAI_BACKOFF_MAX = 4.0 # Seconds
+OPENAI_HEDGE = os.getenv("OPENAI_HEDGE", "false").lower() == "true" # Second request when the first is slower than p95
+OPENAI_BREAKER_FAILURES = 5 # Consecutive transient failures that open the circuit
+OPENAI_BREAKER_RESET = int(os.getenv("OPENAI_BREAKER_RESET", "30")) # Seconds the circuit stays open before a probe
+# Local Pre-classifier (offline NEEDS_REVIEW routing before OpenAI)
+PRECLASSIFY_ENABLED = os.getenv("PRECLASSIFY_ENABLED", "true").lower() == "true"
+PRECLASSIFY_MAX_CHARS = 1000 # Longer messages always go to a human
+
+# Classification Cache (normalized body -> classification)
+CLASSIFY_CACHE_ENABLED = os.getenv("CLASSIFY_CACHE_ENABLED", "true").lower() == "true"
+CLASSIFY_CACHE_SIZE = 5000 # In-memory LRU entries
+CLASSIFY_CACHE_DB_SIZE = 100000 # Persistent (SQLite) entries
+CLASSIFY_CACHE_TTL = 7 * 24 * 3600 # Seconds
+CLASSIFY_CACHE_MAX_CHARS = 160 # Only short texts (one SMS segment) are cached
+ENRICH_PIPELINE = os.getenv("ENRICH_PIPELINE", "two_call") # "two_call" (classify, then draft) | "single_call" (classify + draft in one response)
 
-# Initialize Client (Safe)
-openai_client = None
-if OPENAI_API_KEY:
-    try:
-        from openai import OpenAI
-        openai_client = OpenAI(api_key=OPENAI_API_KEY)
-    except ImportError:
-        pass # Handle inside specific modules or log warning later
+# Inbound MessageSid dedup (webhook fast path; the messages primary key stays authoritative)
+DEDUP_RECENT_SIZE = int(os.getenv("DEDUP_RECENT_SIZE", "50000")) # Recently stored MessageSids kept in memory
+DEDUP_BLOOM_ENABLED = os.getenv("DEDUP_BLOOM_ENABLED", "true").lower() == "true"
+DEDUP_BLOOM_CAPACITY = int(os.getenv("DEDUP_BLOOM_CAPACITY", "1000000")) # ~1.8 MB at the error rate below
+DEDUP_BLOOM_ERROR_RATE = 0.001
 
+# Bulk history import (execution/import_history.py, POST /admin/import)
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000")) # Rows per transaction
+IMPORT_MAX_ERRORS_REPORTED = 20 # Invalid rows listed in the result (all are counted)
@@ -0,0 +1,27 @@
+import threading
+from execution.config import OPENAI_API_KEY
+from execution.utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_openai_client():
+    """
+    Process-wide OpenAI client, built on first use (the SDK import is the slowest part
+    of cold start). None when OPENAI_API_KEY is unset or the package is missing.
+    """
+    global _client
+    if _client is None and OPENAI_API_KEY:
+        with _client_lock:
+            if _client is None:
+                try:
+                    from openai import OpenAI
+                except ImportError:
+                    logger.error("openai package not installed; enrichment disabled")
+                    return None
+                # Resilient (openai_guard) is the only retry layer: SDK retries would multiply attempts
+                # under it and hide failures from the breaker and the adaptive timeouts
+                _client = OpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+    return _client
@@ -1,36 +1,169 @@
-from twilio.rest import Client
+import asyncio
+import threading
+import time
 from execution.config import (
-    TWILIO_ACCOUNT_SID, 
-    TWILIO_AUTH_TOKEN, 
-    TWILIO_PHONE_NUMBER
+    TWILIO_ACCOUNT_SID,
+    TWILIO_AUTH_TOKEN,
+    TWILIO_PHONE_NUMBER,
+    TWILIO_SEND_RATE,
+    TWILIO_SEND_BURST,
+    TWILIO_RATE_STATE_PATH,
+    TWILIO_TRANSPORT,
+    TWILIO_BASE_URL,
+    TWILIO_POOL_SIZE,
+    TWILIO_CONNECT_TIMEOUT,
+    TWILIO_READ_TIMEOUT
 )
-from execution.utils.logging import logger
+from execution.utils.db import database_path
+from execution.utils.logging import get_logger
+from execution.utils.metrics import timed
+from execution.utils.ratelimit import bucket_for
 
-class TwilioConnector:
-    def __init__(self):
-        if not TWILIO_ACCOUNT_SID or not TWILIO_AUTH_TOKEN:
+logger = get_logger(__name__)
+
+class MockTransport:
+    """
+    No network: logs the message and returns a fixed SID (no credentials / local dev).
+    """
+    name = "mock"
+
+    def send(self, to_number, body, from_number):
+        logger.info(f"[MOCK] Sending SMS to {to_number}: {body}")
+        return "mock_sid_123"
+
+class RestTransport:
+    """
+    twilio.rest.Client on one pooled keep-alive requests session.
+    `base_url` points the Messages API at another host (e.g. a fake Twilio server in load tests).
+    The twilio/requests imports happen here, not at module import (they dominate cold start).
+    """
+    name = "rest"
+
+    def __init__(self, account_sid, auth_token, base_url=None, pool_size=TWILIO_POOL_SIZE,
+                 connect_timeout=TWILIO_CONNECT_TIMEOUT, read_timeout=TWILIO_READ_TIMEOUT):
+        from requests.adapters import HTTPAdapter
+        from twilio.rest import Client
+        from twilio.http.http_client import TwilioHttpClient
+        http_client = TwilioHttpClient(pool_connections=True)
+        http_client.timeout = (connect_timeout, read_timeout) # requests accepts (connect, read); the constructor only takes one float
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        http_client.session.mount("https://", adapter)
+        http_client.session.mount("http://", adapter)
+        self.client = Client(account_sid, auth_token, http_client=http_client)
+        if base_url:
+            self.client.api.base_url = base_url.rstrip("/")
+            self.name = f"rest ({base_url})"
+
+    def send(self, to_number, body, from_number):
+        message = self.client.messages.create(body=body, from_=from_number, to=to_number)
+        return message.sid
+
+def build_transport(kind=None, base_url=None):
+    """
+    Transport for TWILIO_TRANSPORT: "mock", "rest", or "auto" (rest when credentials are set).
+    """
+    kind = (kind or TWILIO_TRANSPORT).lower()
+    base_url = base_url if base_url is not None else TWILIO_BASE_URL
+    has_credentials = bool(TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN)
+
+    if kind == "mock" or (kind == "auto" and not has_credentials and not base_url):
+        if kind == "auto":
             logger.warning("Twilio credentials missing. Connector in mock mode.")
-            self.client = None
-        else:
-            self.client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+        return MockTransport()
+    if kind not in ("rest", "auto"):
+        raise ValueError(f"Unknown TWILIO_TRANSPORT: {kind}")
+    # A fake server does not check credentials
+    return RestTransport(TWILIO_ACCOUNT_SID or "ACfake", TWILIO_AUTH_TOKEN or "fake", base_url=base_url)
+
+class TwilioConnector:
+    """
+    Without an explicit transport, build_transport() runs on first use, so constructing
+    the connector (at job module import) costs nothing.
+    """
+    def __init__(self, transport=None):
+        self._transport = transport
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0}
+
+    @property
+    def transport(self):
+        if self._transport is None:
+            with self._lock:
+                if self._transport is None:
+                    self._transport = build_transport()
+        return self._transport
+
+    @transport.setter
+    def transport(self, transport):
+        self._transport = transport
+
+    @property
+    def client(self):
+        """The underlying twilio Client (None in mock mode)."""
+        return getattr(self.transport, "client", None)
 
     def send_sms(self, to_number, body):
         """
-        Sends an SMS via Twilio.
+        Sends an SMS via Twilio, after taking a token from the sending number's budget
+        (customer replies, owner alerts and digests alike).
         Returns the SID if successful, None if failed (exceptions logged).
         """
-        if not self.client:
-            logger.info(f"[MOCK] Sending SMS to {to_number}: {body}")
-            return "mock_sid_123"
-
+        if self.transport.name != "mock": # No carrier behind the mock
+            self._throttle()
+        start = time.perf_counter()
         try:
-            message = self.client.messages.create(
-                body=body,
-                from_=TWILIO_PHONE_NUMBER,
-                to=to_number
-            )
-            logger.info(f"Twilio message sent. SID: {message.sid}")
-            return message.sid
+            with timed("twilio_send"):
+                sid = self.transport.send(to_number, body, TWILIO_PHONE_NUMBER)
         except Exception as e:
+            self._record((time.perf_counter() - start) * 1000, error=True)
             logger.error(f"Failed to send Twilio SMS: {e}")
             raise e
+        elapsed_ms = self._record((time.perf_counter() - start) * 1000)
+        if self.transport.name != "mock":
+            logger.info(f"Twilio message sent. SID: {sid} ({elapsed_ms:.0f}ms)")
+        return sid
+
+    def _throttle(self):
+        """Blocks for a send token: TWILIO_SEND_RATE per number, shared by every process on this DB."""
+        path = TWILIO_RATE_STATE_PATH or f"{database_path()}.sendrate"
+        bucket_for(TWILIO_PHONE_NUMBER, TWILIO_SEND_RATE, TWILIO_SEND_BURST, path=path).acquire()
+
+    async def send_sms_async(self, to_number, body):
+        """
+        Awaitable send_sms. Runs the blocking call on the default executor, so many
+        sends can be in flight at once; they share the transport's connection pool.
+        """
+        return await asyncio.to_thread(self.send_sms, to_number, body)
+
+    def _record(self, elapsed_ms, error=False):
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["errors"] += int(error)
+            self.stats["total_ms"] += elapsed_ms
+            self.stats["max_ms"] = max(self.stats["max_ms"], elapsed_ms)
+        return elapsed_ms
+
+    def latency_summary(self):
+        """Snapshot of call count, errors and mean/max latency (ms)."""
+        with self._lock:
+            calls = self.stats["calls"]
+            return {
+                "transport": self._transport.name if self._transport else "not built",
+                "calls": calls,
+                "errors": self.stats["errors"],
+                "avg_ms": round(self.stats["total_ms"] / calls, 1) if calls else None,
+                "max_ms": round(self.stats["max_ms"], 1),
+            }
+
+_shared = None
+_shared_lock = threading.Lock()
+
+def shared_connector():
+    """
+    Process-wide connector, so every job reuses one connection pool.
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = TwilioConnector()
+        return _shared
@@ -0,0 +1,27 @@
+# Production server: gunicorn -c execution/gunicorn.conf.py execution.run:app
+# Read from the environment directly: the master must not import the app (no SQLite
+# connections or logging threads across fork). Each worker imports it after the fork.
+import os
+
+# Workers inherit this: each logs to its own execution.<pid>.log and rotates only that file
+os.environ.setdefault("LOG_PER_PROCESS", "true")
+# Workers export metric snapshots here; /metrics on any worker merges them
+os.environ.setdefault("METRICS_DIR", ".tmp/metrics")
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_WORKERS", "2"))
+threads = int(os.getenv("WEB_THREADS", "8")) # Webhooks mostly wait on SQLite / Twilio
+worker_class = "gthread"
+timeout = 30
+graceful_timeout = 20
+preload_app = False
+
+def on_starting(server):
+    # Master, before forking: snapshots from a previous run must not be summed into this one
+    import shutil
+    shutil.rmtree(os.environ["METRICS_DIR"], ignore_errors=True)
+
+def post_worker_init(worker):
+    # DB init, audit writer, enrichment pool and leader election (background loops in one worker only)
+    from execution.run import start_worker
+    start_worker()
@@ -0,0 +1,41 @@
+"""
+Bulk import of existing conversation history (Twilio message-log exports) for onboarding.
+
+    python -m execution.import_history exports/messages-2025-*.csv
+    python -m execution.import_history history.json --format json --batch-size 10000
+
+Rows are stored with status IMPORTED: visible in thread history, never enriched or sent.
+Ids already in the database are skipped, so re-running an import is safe.
+"""
+import argparse
+import json
+import os
+import sys
+from execution.utils.db import init_db
+from execution.jobs.job_06_import import import_stream, detect_format, FORMATS
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import message history (CSV, JSON, JSON Lines).")
+    parser.add_argument("paths", nargs="+", help="Export files to import")
+    parser.add_argument("--format", choices=FORMATS, default=None, help="Default: from the file extension")
+    parser.add_argument("--batch-size", type=int, default=None, help="Rows per transaction (default IMPORT_BATCH_SIZE)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    init_db()
+    failed = False
+    for path in args.paths:
+        fmt = args.format or detect_format(path)
+        if fmt is None:
+            print(f"{path}: unknown format, pass --format", file=sys.stderr)
+            failed = True
+            continue
+        with open(path, "rb") as f:
+            stats = import_stream(f, fmt, source=os.path.basename(path), batch_size=args.batch_size, actor="CLI")
+        print(json.dumps(stats, indent=2))
+        failed = failed or stats["invalid"] > 0
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,20 @@
+import json
 from datetime import datetime, timezone
-import uuid
-from execution.utils.db import get_db_connection
-from execution.utils.logging import logger
+from execution.utils.db import get_connection, transaction
+from execution.utils.audit import audit_row, insert_audit
+from execution.utils.cache import thread_controls, message_sids
+from execution.utils.metrics import timed, INGEST_DEDUP
+from execution.utils.logging import get_logger
 
+logger = get_logger(__name__)
+
+@timed("ingest")
 def ingest_message(payload):
     """
     Ingests an inbound message from Twilio webhook.
-    Idempotent based on MessageSid.
+    Idempotent based on MessageSid: recent duplicates (Twilio retries) are answered from
+    memory; otherwise INSERT OR IGNORE on the primary key decides.
+    Returns the MessageSid if a new message was stored, None otherwise.
     """
     message_sid = payload.get('MessageSid')
     sender = payload.get('From')
@@ -14,61 +22,58 @@ def ingest_message(payload):
     num_media = int(payload.get('NumMedia', 0))
     media_url = payload.get('MediaUrl0') # Keep it simple for MVP
     
-    conn = get_db_connection()
-    c = conn.cursor()
-    
-    # Idempotency Check
-    c.execute("SELECT id FROM messages WHERE id = ?", (message_sid,))
-    if c.fetchone():
-        logger.info(f"Duplicate MessageSid {message_sid}. Ignoring.")
-        conn.close()
-        return
+    # Idempotency Check (memory first; a Bloom-filter "maybe" is confirmed with a read, not the write lock)
+    if message_sids.seen(message_sid):
+        return _duplicate(message_sid, "duplicate_memory")
+    if message_sids.might_exist(message_sid):
+        if get_connection().execute("SELECT 1 FROM messages WHERE id = ?", (message_sid,)).fetchone():
+            message_sids.add(message_sid)
+            return _duplicate(message_sid, "duplicate_db")
         
-    # Thread Control Check
+    # Thread Control Check (in-memory; enrichment routes paused threads to NEEDS_REVIEW)
     # Thread ID is just the sender phone number for MVP
     thread_id = sender
-    c.execute("SELECT paused FROM thread_controls WHERE thread_id = ?", (thread_id,))
-    row = c.fetchone()
-    if row and row['paused']:
+    if thread_controls.is_paused(thread_id):
         logger.info(f"Thread {thread_id} is PAUSED. Logging only.")
-        # We still save it, but we might want a different status? 
-        # Directive says "Status=RECEIVED (Log only, do not draft)".
-        # We'll save as RECEIVED, enrich job handles the "do not draft" logic via paused check logic or we handle it here?
-        # Logic says: "Enrich routes messages". So we save as RECEIVED here.
-        pass
 
     media_json = "{}" 
     if num_media > 0 and media_url:
-        media_json = f'{{"url": "{media_url}"}}'
+        media_json = json.dumps({"url": media_url})
 
     # Insert
     try:
         now_ui = datetime.now(timezone.utc).isoformat()
-        c.execute("""
-            INSERT INTO messages (id, thread_id, sender, receiver, body, media, status, type, timestamp, draft_version)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            message_sid,
-            thread_id,
-            sender,
-            payload.get('To'),
-            body,
-            media_json,
-            "RECEIVED",
-            "INBOUND",
-            now_ui,
-            0 # Inbound ver is 0
-        ))
+        with transaction() as conn:
+            inserted = conn.execute("""
+                INSERT OR IGNORE INTO messages (id, thread_id, sender, receiver, body, media, status, type, timestamp, draft_version)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                message_sid,
+                thread_id,
+                sender,
+                payload.get('To'),
+                body,
+                media_json,
+                "RECEIVED",
+                "INBOUND",
+                now_ui,
+                0 # Inbound ver is 0
+            )).rowcount == 1
+            if inserted: # Audit Log: same commit as the row it describes
+                insert_audit(conn, [audit_row("MESSAGE_RECEIVED", {"sid": message_sid}, timestamp=now_ui)])
+        message_sids.add(message_sid)
+        if not inserted: # Stored meanwhile (concurrent retry, another worker)
+            return _duplicate(message_sid, "duplicate_db")
+        INGEST_DEDUP.inc("new")
         
-        # Audit Log
-        audit_id = str(uuid.uuid4())
-        c.execute("INSERT INTO audit_log (id, event, actor, metadata, timestamp) VALUES (?, ?, ?, ?, ?)",
-                  (audit_id, "MESSAGE_RECEIVED", "SYSTEM", f'{{"sid": "{message_sid}"}}', now_ui))
-        
-        conn.commit()
         logger.info(f"Ingested message {message_sid} from {sender}")
+        return message_sid
         
     except Exception as e:
         logger.error(f"Error ingesting message: {e}")
-    finally:
-        conn.close()
+        return None
+
+def _duplicate(message_sid, result):
+    INGEST_DEDUP.inc(result)
+    logger.info(f"Duplicate MessageSid {message_sid}. Ignoring.")
+    return None
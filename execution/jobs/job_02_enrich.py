@@ -1,100 +1,365 @@
+import time
 import uuid
 import json
-from datetime import datetime, timezone
-from execution.utils.db import get_db_connection
-from execution.utils.logging import logger
-from execution.config import openai_client, OPENAI_MODEL, MAX_TOKENS, OPENAI_TIMEOUT, OWNER_PHONE_NUMBER
-from execution.connectors.twilio import TwilioConnector
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from execution.utils.db import get_connection, transaction, DatabaseBusyError
+from execution.utils.logging import get_logger
+from execution.utils.audit import record_audit, audit_row, insert_audit
+from execution.utils.metrics import timed, ENRICH_ROUTES
+from execution.utils.workers import KeyedWorkerPool
+from execution.utils.cache import ClassificationCache, thread_controls
+from execution.utils.preclassify import preclassify
+from execution.utils.leader import PROCESS_ID
+from execution.utils.resilience import Resilient, CircuitBreaker, AdaptiveTimeout, CircuitOpenError, is_transient
+from execution.config import (
+    OPENAI_MODEL, MAX_TOKENS, DRAFT_TEMPERATURE, OPENAI_TIMEOUT, OWNER_PHONE_NUMBER, OWNER_NOTIFY_PENDING_TTL,
+    OPENAI_MIN_TIMEOUT, OPENAI_TIMEOUT_PERCENTILE, OPENAI_TIMEOUT_MULTIPLIER, OPENAI_RETRIES,
+    OPENAI_BACKOFF_BASE, OPENAI_BACKOFF_MAX, OPENAI_HEDGE, OPENAI_BREAKER_FAILURES, OPENAI_BREAKER_RESET,
+    ENRICH_WORKERS, ENRICH_QUEUE_SIZE, ENRICH_SUBMIT_TIMEOUT, ENRICH_SWEEP_INTERVAL, ENRICH_CONCURRENCY, ENRICH_LEASE_SECONDS, ENRICH_BACKLOG_PAGE,
+    ENRICH_PIPELINE, CLASSIFY_CACHE_ENABLED, CLASSIFY_CACHE_SIZE, CLASSIFY_CACHE_DB_SIZE,
+    CLASSIFY_CACHE_TTL, CLASSIFY_CACHE_MAX_CHARS, PRECLASSIFY_ENABLED, PRECLASSIFY_MAX_CHARS
+)
+from execution.connectors.twilio import shared_connector
+from execution.connectors.openai import get_openai_client
 
-twilio_client = TwilioConnector()
+logger = get_logger(__name__)
 
-def process_enrichment():
+twilio_client = shared_connector() # Transport is built on first send
+openai_client = None # Override (tests, load bench); otherwise the lazily built shared client
+
+def llm_client():
+    """The OpenAI client to use: the override if set, else get_openai_client()."""
+    return openai_client or get_openai_client()
+
+CLASSIFY_SYSTEM_PROMPT = """You are a classification engine. Analyze the inbound text.
+Return ONLY a JSON object with keys:
+- language: "EN", "ES", or "UNCLEAR"
+- language_confidence: Float 0.0 to 1.0
+- risk: "LOW" (normal business) or "HIGH" (harmful, legal threat, emergency, sensitive)
+- risk_reason: "PAYMENT", "LEGAL", "HARASSMENT", "MEDICAL", "MINOR", "REFUND", "THREAT", "OTHER", "NONE"
+- intent: "KNOWN" (scheduling, pricing, faq) or "UNKNOWN" (confusing, unrelated)
+"""
+
+CLASSIFY_AND_DRAFT_PROMPT = CLASSIFY_SYSTEM_PROMPT + """- draft: A polite, neutral business reply in the detected language (English for EN, Spanish for ES).
+  Reference business context generically (do not invent facts). Ask NO MORE than ONE question.
+  If intent is KNOWN but details are missing, end with a simple next step. Keep it short (1-2 sentences).
+  Use "" if language is UNCLEAR, risk is HIGH or intent is UNKNOWN.
+"""
+
+def classification_version():
+    """Model, pipeline and the prompt that produces the cached classification."""
+    prompt = CLASSIFY_AND_DRAFT_PROMPT if ENRICH_PIPELINE == "single_call" else CLASSIFY_SYSTEM_PROMPT
+    return f"{OPENAI_MODEL}\n{ENRICH_PIPELINE}\n{prompt}"
+
+# Keyed on model + active pipeline prompt, so prompt or pipeline changes invalidate old entries
+classification_cache = ClassificationCache(
+    classification_version,
+    max_entries=CLASSIFY_CACHE_SIZE,
+    db_max_entries=CLASSIFY_CACHE_DB_SIZE,
+    ttl=CLASSIFY_CACHE_TTL,
+    max_chars=CLASSIFY_CACHE_MAX_CHARS
+)
+
+# OpenAI calls go through a circuit breaker with adaptive timeouts and jittered retries.
+# While the circuit is open, messages stay RECEIVED and the sweep retries them later.
+def _alert_openai_down():
+    hour = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H")
+    send_owner_sms(get_connection(), "OPENAI_DOWN", f"OPENAI:{hour}", # At most one alert per hour
+                   "MILO: OpenAI is failing. New messages are held and will be drafted when it recovers.")
+
+openai_guard = Resilient(
+    "openai",
+    CircuitBreaker(OPENAI_BREAKER_FAILURES, OPENAI_BREAKER_RESET, on_open=_alert_openai_down),
+    lambda: AdaptiveTimeout(OPENAI_TIMEOUT, OPENAI_MIN_TIMEOUT, OPENAI_TIMEOUT,
+                            percentile=OPENAI_TIMEOUT_PERCENTILE, multiplier=OPENAI_TIMEOUT_MULTIPLIER),
+    retries=OPENAI_RETRIES,
+    backoff_base=OPENAI_BACKOFF_BASE,
+    backoff_max=OPENAI_BACKOFF_MAX,
+    hedge=OPENAI_HEDGE
+)
+
+def llm_create(operation, **kwargs):
+    """
+    llm_client().chat.completions.create through openai_guard (timeout chosen per attempt).
+    """
+    client = llm_client()
+    return openai_guard.call(operation, lambda timeout: client.chat.completions.create(timeout=timeout, **kwargs))
+
+# Thread ids with a message being enriched in this process (pool workers + sweeps)
+_inflight = set()
+_inflight_lock = threading.Lock()
+
+def _claim(thread_id):
+    with _inflight_lock:
+        if thread_id in _inflight:
+            return False
+        _inflight.add(thread_id)
+        return True
+
+def _release(thread_id):
+    with _inflight_lock:
+        _inflight.discard(thread_id)
+
+BACKLOG_JOB = "enrich_backlog"
+
+# Backlog workers live as long as the process: created on first use (per concurrency), reused by every sweep
+_backlog_pools = {}
+_backlog_pools_lock = threading.Lock()
+
+def backlog_pool(workers):
+    with _backlog_pools_lock:
+        pool = _backlog_pools.get(workers)
+        if pool is None:
+            pool = _backlog_pools[workers] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="enrich-backlog")
+        return pool
+
+def process_enrichment(concurrency=None, page_size=None):
+    """
+    Drains the RECEIVED backlog oldest first, ENRICH_BACKLOG_PAGE rows at a time
+    (keyset pagination on (timestamp, id), so memory stays bounded however large it is).
+    Within a page, different threads are enriched in parallel (up to ENRICH_CONCURRENCY);
+    messages within a thread are always enriched sequentially, oldest first.
+    Each message commits as it goes and the cursor is checkpointed after every page, so
+    a crash mid-backlog resumes where it stopped. Rows still RECEIVED behind the cursor
+    (deferred, or leased by another process) are retried on the next pass.
+    """
+    concurrency = ENRICH_CONCURRENCY if concurrency is None else concurrency
+    page_size = page_size or ENRICH_BACKLOG_PAGE
+
+    conn = get_connection()
+    cursor, processed = load_checkpoint(conn, BACKLOG_JOB)
+    if cursor:
+        logger.info(f"Resuming backlog after {cursor[0]} / {cursor[1]} ({processed} done)")
+    resumed = cursor is not None
+
+    while True:
+        page = _backlog_page(conn, cursor, page_size)
+        if not page:
+            break
+        threads = {}
+        for r in page:
+            threads.setdefault(r['thread_id'], []).append(r['id'])
+
+        if concurrency <= 1 or len(threads) == 1:
+            _enrich_thread([r['id'] for r in page]) # Strictly chronological
+        else:
+            pool = backlog_pool(concurrency)
+            logger.info(f"Enriching {len(page)} messages across {len(threads)} threads")
+            for future in [pool.submit(_enrich_thread, ids) for ids in threads.values()]:
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"Backlog enrichment worker failed: {e}")
+
+        cursor = (page[-1]['timestamp'], page[-1]['id'])
+        processed += len(page)
+        save_checkpoint(conn, BACKLOG_JOB, cursor, processed)
+        if len(page) < page_size:
+            break
+
+    if processed or resumed:
+        save_checkpoint(conn, BACKLOG_JOB, None, processed) # Pass complete: next one starts from the oldest row
+        logger.info(f"Backlog pass complete: {processed} messages")
+
+def _backlog_page(conn, cursor, page_size):
+    """Next page of RECEIVED inbound rows after cursor (served by idx_messages_queue)."""
+    if cursor is None:
+        return conn.execute("""SELECT id, thread_id, timestamp FROM messages
+                               WHERE status = 'RECEIVED' AND type = 'INBOUND'
+                               ORDER BY timestamp, id LIMIT ?""", (page_size,)).fetchall()
+    return conn.execute("""SELECT id, thread_id, timestamp FROM messages
+                           WHERE status = 'RECEIVED' AND type = 'INBOUND' AND (timestamp, id) > (?, ?)
+                           ORDER BY timestamp, id LIMIT ?""", (*cursor, page_size)).fetchall()
+
+def load_checkpoint(conn, job):
+    """
+    (cursor, processed) for job. cursor is (timestamp, id) of the last row handled by an
+    unfinished pass, or None when the last pass completed.
+    """
+    row = conn.execute("SELECT cursor_timestamp, cursor_id, processed FROM job_checkpoints WHERE job = ?", (job,)).fetchone()
+    if row is None or row['cursor_id'] is None:
+        return None, 0
+    return (row['cursor_timestamp'], row['cursor_id']), row['processed']
+
+def save_checkpoint(conn, job, cursor, processed):
+    ts, msg_id = cursor or (None, None)
+    conn.execute("""INSERT INTO job_checkpoints (job, cursor_timestamp, cursor_id, processed, updated_at) VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(job) DO UPDATE SET cursor_timestamp = excluded.cursor_timestamp, cursor_id = excluded.cursor_id,
+                                                   processed = excluded.processed, updated_at = excluded.updated_at""",
+                 (job, ts, msg_id, processed, datetime.now(timezone.utc).isoformat()))
+
+def _enrich_thread(ids):
+    """
+    Enriches the given RECEIVED messages in order, on this worker's connection
+    (one thread's messages, or a whole page when draining serially).
+    """
+    conn = get_connection()
+    for msg_id in ids:
+        _enrich_claimed(conn, msg_id)
+
+def enrich_message(msg_id):
+    """
+    Enriches a single RECEIVED message. Entry point for the enrichment pool.
+    Then carries on with the thread's next RECEIVED message, if any: one ingested by
+    another worker while this thread was leased here was refused there.
+    """
+    conn = get_connection()
+    while msg_id:
+        _enrich_claimed(conn, msg_id)
+        msg_id = _next_in_thread(conn, msg_id)
+
+def _next_in_thread(conn, msg_id):
+    """Oldest RECEIVED inbound message of msg_id's thread, once msg_id itself has moved on."""
+    row = conn.execute("""SELECT n.id FROM messages m JOIN messages n ON n.thread_id = m.thread_id
+                          WHERE m.id = ? AND m.status != 'RECEIVED' AND n.status = 'RECEIVED' AND n.type = 'INBOUND'
+                          ORDER BY n.timestamp, n.id LIMIT 1""", (msg_id,)).fetchone()
+    return row['id'] if row else None
+
+def _enrich_claimed(conn, msg_id):
+    """
+    Claims msg_id's thread in-process (a pool worker and the sweep never enrich one thread
+    at the same time), then leases the row in the DB (other web workers may hold the thread),
+    re-reads it and enriches it if still RECEIVED.
+    Writes commit per step, so concurrent enrichers never wait on a long write lock.
+    """
+    row = conn.execute("SELECT thread_id FROM messages WHERE id = ?", (msg_id,)).fetchone()
+    if row is None:
+        return
+    thread_id = row['thread_id']
+    if not _claim(thread_id):
+        logger.info(f"Thread {thread_id} already being enriched. Skipping {msg_id}.")
+        return
+    try:
+        if not _lease(conn, msg_id):
+            logger.info(f"Message {msg_id} waits on its thread (older message pending, or leased elsewhere). Skipping.")
+            return
+        try:
+            row = conn.execute("SELECT * FROM messages WHERE id = ? AND status = 'RECEIVED' AND type = 'INBOUND'", (msg_id,)).fetchone()
+            if row:
+                enrich_row(conn, row)
+        finally:
+            conn.execute("UPDATE messages SET lease_owner = NULL, lease_expires_at = NULL WHERE id = ? AND lease_owner = ?",
+                         (msg_id, PROCESS_ID))
+    finally:
+        _release(thread_id)
+
+def _lease(conn, msg_id):
+    """
+    Leases a RECEIVED inbound row for ENRICH_LEASE_SECONDS (single autocommit UPDATE).
+    Refused while an older message of the same thread is still RECEIVED, or another process
+    holds a live lease in the thread: a thread is drafted by one process at a time, oldest first.
+    An expired lease (enricher died) can be taken over.
+    """
+    now = time.time()
+    return conn.execute("""UPDATE messages SET lease_owner = ?, lease_expires_at = ?
+                           WHERE id = ? AND status = 'RECEIVED' AND type = 'INBOUND'
+                             AND (lease_owner IS NULL OR lease_owner = ? OR lease_expires_at < ?)
+                             AND NOT EXISTS (SELECT 1 FROM messages o
+                                             WHERE o.thread_id = messages.thread_id AND o.id != messages.id
+                                               AND o.status = 'RECEIVED' AND o.type = 'INBOUND'
+                                               AND ((o.timestamp, o.id) < (messages.timestamp, messages.id)
+                                                    OR (o.lease_owner != ? AND o.lease_expires_at >= ?)))""",
+                        (PROCESS_ID, now + ENRICH_LEASE_SECONDS, msg_id, PROCESS_ID, now, PROCESS_ID, now)).rowcount == 1
+
+# Per-message OpenAI usage, tallied on the enriching thread and audited as LLM_USAGE
+_llm_usage = threading.local()
+
+def _track_llm(response=None, cache_hit=False):
+    tally = getattr(_llm_usage, "tally", None)
+    if tally is None:
+        return
+    if cache_hit:
+        tally["cache_hits"] += 1
+        return
+    usage = getattr(response, "usage", None)
+    tally["calls"] += 1
+    for field in ("prompt_tokens", "completion_tokens"):
+        value = getattr(usage, field, None)
+        if isinstance(value, int):
+            tally[field] += value
+
+@timed("enrich")
+def enrich_row(conn, row):
     """
-    Scans for RECEIVED messages and generates drafts using OpenAI.
+    Routes one RECEIVED inbound row to DRAFT_PENDING_APPROVAL or NEEDS_REVIEW.
     """
-    conn = get_db_connection()
+    _llm_usage.tally = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cache_hits": 0}
+    try:
+        _route_row(conn, row)
+    finally:
+        tally, _llm_usage.tally = _llm_usage.tally, None
+        if tally["calls"] or tally["cache_hits"]:
+            record_audit("LLM_USAGE", dict(tally, msg_id=row['id']))
+
+def _route_row(conn, row):
     c = conn.cursor()
+    msg_id = row['id']
+    sender = row['sender']
+    body = row['body'] or ""
+    media = row['media']
+    thread_id = row['thread_id']
     
-    # Find RECEIVED messages
-    c.execute("SELECT * FROM messages WHERE status = 'RECEIVED' AND type = 'INBOUND'")
-    rows = c.fetchall()
-    
-    for row in rows:
-        msg_id = row['id']
-        sender = row['sender']
-        body = row['body'] or ""
-        media = row['media']
-        thread_id = row['thread_id']
+    # Thread Paused Check
+    with timed("pause_check"):
+        paused = thread_controls.is_paused(thread_id)
+    if paused:
+         logger.info(f"Thread {thread_id} paused. Routing {msg_id} to NEEDS_REVIEW.")
+         ENRICH_ROUTES.inc("paused")
+         route_to_review(msg_id, "Thread Paused")
+         notify_owner(conn, "NEEDS_REVIEW", f"Thread Paused", msg_id, sender)
+         return
+
+    # Rule 3: Media/Body Check
+    if media != "{}" or not body.strip():
+        logger.info(f"Message {msg_id} has media or empty body. Routing to NEEDS_REVIEW.")
+        ENRICH_ROUTES.inc("media_or_empty")
+        route_to_review(msg_id, "Media/Empty Body context")
+        notify_owner(conn, "NEEDS_REVIEW", "Media/Empty Body context", msg_id, sender)
+        return
+
+    # Local Pre-classification (opt-out, risk keywords, foreign script): no LLM needed
+    if PRECLASSIFY_ENABLED:
+        with timed("preclassify"):
+            reason = preclassify(body, PRECLASSIFY_MAX_CHARS)
+        if reason:
+            logger.info(f"Pre-classified {msg_id}: {reason}. Needs Review.")
+            ENRICH_ROUTES.inc("preclassified")
+            route_to_review(msg_id, reason)
+            notify_owner(conn, "NEEDS_REVIEW", reason, msg_id, sender, body)
+            return
         
-        # Thread Paused Check
-        c.execute("SELECT paused FROM thread_controls WHERE thread_id = ?", (thread_id,))
-        tc = c.fetchone()
-        if tc and tc['paused']:
-             logger.info(f"Thread {thread_id} paused. Routing {msg_id} to NEEDS_REVIEW.")
-             update_status(conn, msg_id, "NEEDS_REVIEW")
-             notify_owner(conn, "NEEDS_REVIEW", f"Thread Paused", msg_id, sender)
-             continue
-
-        # Rule 3: Media/Body Check
-        if media != "{}" or not body.strip():
-            logger.info(f"Message {msg_id} has media or empty body. Routing to NEEDS_REVIEW.")
-            update_status(conn, msg_id, "NEEDS_REVIEW")
-            notify_owner(conn, "NEEDS_REVIEW", "Media/Empty Body context", msg_id, sender)
-            continue
-            
-        # AI Classification & Drafting
-        try:
-            if not openai_client:
-                 raise Exception("OpenAI Client not initialized (Missing Key)")
+    # AI Classification & Drafting
+    try:
+        if not llm_client():
+             raise Exception("OpenAI Client not initialized (Missing Key)")
 
-            # 1. Classification
-            classification = classify_message(body)
-            
-            lang = classification.get("language", "UNCLEAR")
-            confidence = classification.get("language_confidence", 0.0)
-            risk = classification.get("risk", "HIGH") # Fail safe
-            risk_reason = classification.get("risk_reason", "NONE")
-            intent = classification.get("intent", "UNKNOWN")
-            
-            logger.info(f"Classified {msg_id}: Lang={lang} ({confidence}), Risk={risk} ({risk_reason}), Intent={intent}")
-
-            # Guardrails (Strict)
-            # Language Check
-            if lang not in ["EN", "ES"] or lang == "UNCLEAR":
-                logger.info(f"Language {lang} not supported/unclear. Needs Review.")
-                update_status(conn, msg_id, "NEEDS_REVIEW")
-                notify_owner(conn, "NEEDS_REVIEW", f"Language {lang} (Conf: {confidence})", msg_id, sender, body)
-                continue
-                
-            if confidence < 0.75:
-                 logger.info(f"Language Confidence Low ({confidence}). Needs Review.")
-                 update_status(conn, msg_id, "NEEDS_REVIEW")
-                 notify_owner(conn, "NEEDS_REVIEW", f"Low Confidence ({confidence})", msg_id, sender, body)
-                 continue
-
-            # Risk Check
-            if risk == "HIGH":
-                logger.info(f"Risk HIGH ({risk_reason}) for {msg_id}. Needs Review.")
-                update_status(conn, msg_id, "NEEDS_REVIEW")
-                notify_owner(conn, "NEEDS_REVIEW", f"Risk HIGH ({risk_reason})", msg_id, sender, body)
-                continue
+        # 1. Classification (+ candidate draft in single-call mode)
+        classification, draft_body = classify_with_cache(body)
+        
+        lang = classification.get("language", "UNCLEAR")
+        intent = classification.get("intent", "UNKNOWN")
+
+        # Guardrails (Strict). Any candidate draft is discarded when one trips.
+        reason = check_guardrails(msg_id, classification)
+        if reason:
+            ENRICH_ROUTES.inc("guardrail")
+            route_to_review(msg_id, reason)
+            notify_owner(conn, "NEEDS_REVIEW", reason, msg_id, sender, body)
+            return
             
-            # Intent Check    
-            if intent == "UNKNOWN":
-                logger.info(f"Intent UNKNOWN for {msg_id}. Needs Review.")
-                update_status(conn, msg_id, "NEEDS_REVIEW")
-                notify_owner(conn, "NEEDS_REVIEW", "Intent UNKNOWN", msg_id, sender, body)
-                continue
-                
-            # 2. Drafting
+        # 2. Drafting
+        if not draft_body:
             draft_body = generate_draft(body, lang, intent)
 
-            # Generate Draft
-            draft_id = str(uuid.uuid4())
-            now_ui = datetime.now(timezone.utc).isoformat()
-        
-            # Save Draft
-            c.execute("""
+        # Generate Draft
+        draft_id = str(uuid.uuid4())
+        now_ui = datetime.now(timezone.utc).isoformat()
+    
+        # Save Draft + Inbound Status (atomically)
+        with transaction() as conn:
+            conn.execute("""
                 INSERT INTO messages (id, thread_id, in_reply_to_id, sender, receiver, body, media, status, type, timestamp, draft_version)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """, (
@@ -111,40 +376,62 @@ def process_enrichment():
                 1
             ))
             
-            update_status(conn, msg_id, "DRAFT_PENDING_APPROVAL") 
-            logger.info(f"Generated draft {draft_id} for message {msg_id}")
-            
-            # Notify Owner (Draft Ready)
-            notify_owner(conn, "DRAFT_READY", draft_body, msg_id, sender)
+            update_status(conn, msg_id, "DRAFT_PENDING_APPROVAL")
+            insert_audit(conn, [routed_row(msg_id, "DRAFT_PENDING_APPROVAL", draft_id=draft_id, timestamp=now_ui)])
+        logger.info(f"Generated draft {draft_id} for message {msg_id}")
+        ENRICH_ROUTES.inc("drafted")
+        
+        # Notify Owner (Draft Ready)
+        notify_owner(conn, "DRAFT_READY", draft_body, msg_id, sender)
+
+    except Exception as e:
+        if isinstance(e, (CircuitOpenError, DatabaseBusyError)) or is_transient(e):
+            # OpenAI unhealthy, or the draft write lost the lock: no draft, no owner alert.
+            # Stays RECEIVED for the next sweep.
+            logger.warning(f"Deferring {msg_id}: {e}")
+            ENRICH_ROUTES.inc("deferred")
+            return
+        logger.error(f"AI Enrichment failed for {msg_id}: {e}")
+        ENRICH_ROUTES.inc("error")
+        route_to_review(msg_id, f"Enrichment Exception: {str(e)}")
+        notify_owner(conn, "NEEDS_REVIEW", f"Enrichment Exception: {str(e)}", msg_id, sender)
+
+# Background Enrichment (webhook enqueues, workers enrich; same thread_id -> same worker)
+enrichment_pool = KeyedWorkerPool(
+    "enrich",
+    enrich_message,
+    workers=ENRICH_WORKERS,
+    queue_size=ENRICH_QUEUE_SIZE,
+    submit_timeout=ENRICH_SUBMIT_TIMEOUT
+)
+
+def enqueue_enrichment(msg_id, thread_id):
+    """
+    Hands a freshly ingested message to the enrichment pool.
+    Returns False when the pool is saturated; the message stays RECEIVED
+    and is picked up by the next sweep.
+    """
+    return enrichment_pool.submit(thread_id, msg_id)
 
+def run_enrichment_sweep_loop():
+    """
+    Safety net for messages the pool shed or missed (restarts, saturation).
+    Runs indefinitely (blocking), so should be threaded.
+    """
+    logger.info(f"Starting Enrichment Sweep Loop... Interval: {ENRICH_SWEEP_INTERVAL}s")
+    while True:
+        try:
+            process_enrichment()
         except Exception as e:
-            logger.error(f"AI Enrichment failed for {msg_id}: {e}")
-            update_status(conn, msg_id, "NEEDS_REVIEW")
-            notify_owner(conn, "NEEDS_REVIEW", f"Enrichment Exception: {str(e)}", msg_id, sender)
-            
-    conn.commit()
-    conn.close()
+            logger.error(f"Enrichment sweep crash: {e}")
+
+        time.sleep(ENRICH_SWEEP_INTERVAL)
 
+@timed("notify_owner")
 def notify_owner(conn, event_type, context, msg_id, thread_phone, body_snippet=None):
     """
     Sends operational SMS to OWNER_PHONE_NUMBER. Bypasses ENABLE_SENDING.
     """
-    if not OWNER_PHONE_NUMBER:
-        logger.warning("No OWNER_PHONE_NUMBER set. Skipping notification.")
-        return
-
-    # Idempotency Check (Session-based via Audit Log)
-    c = conn.cursor()
-    # Check if we already notified for this msg_id + event
-    # We look for standard event string
-    audit_event = f"OWNER_NOTIFIED_{event_type}"
-    c.execute("SELECT id FROM audit_log WHERE event = ? AND metadata LIKE ?", (audit_event, f'%"{msg_id}"%'))
-    if c.fetchone():
-        logger.info(f"Skipping duplicate notification {event_type} for {msg_id}")
-        return
-
-    logger.info(f"OWNER_NOTIFY_ATTEMPT: {event_type} for {msg_id}")
-    
     prefix = "DRAFT READY" if event_type == "DRAFT_READY" else "NEEDS REVIEW"
     
     # Construct Message
@@ -159,59 +446,167 @@ def notify_owner(conn, event_type, context, msg_id, thread_phone, body_snippet=N
         truncated_draft = (context[:100] + '...') if len(context) > 100 else context
         message_lines.append(f"Draft: {truncated_draft}")
         message_lines.append("Reply A <id>, R <id>, E <id> <text>")
+        metadata = None
     else:
         # Context is reason
         message_lines.append(f"Reason: {context}")
         if body_snippet:
              start = (body_snippet[:50] + '...') if len(body_snippet) > 50 else body_snippet
              message_lines.append(f"Snippet: {start}")
+        metadata = {"reason": context[:200]}
              
-    full_body = "\n".join(message_lines)
+    send_owner_sms(conn, event_type, msg_id, "\n".join(message_lines), metadata)
+
+def send_owner_sms(conn, event_type, msg_id, full_body, metadata=None):
+    """
+    Sends full_body to the owner at most once per (msg_id, event_type).
+    Returns the SID, or None if skipped or failed.
+    """
+    if not OWNER_PHONE_NUMBER:
+        logger.warning("No OWNER_PHONE_NUMBER set. Skipping notification.")
+        return None
+
+    # Idempotency: reserve (msg_id, event_type) in the notification ledger.
+    # A PK conflict means we already notified (or another worker is notifying), unless the
+    # reservation is a PENDING row older than OWNER_NOTIFY_PENDING_TTL: its sender died mid-send.
+    c = conn.cursor()
+    audit_event = f"OWNER_NOTIFIED_{event_type}"
+    now = datetime.now(timezone.utc)
+    c.execute("""INSERT INTO owner_notifications (msg_id, event_type, status, created_at) VALUES (?, ?, 'PENDING', ?)
+                 ON CONFLICT(msg_id, event_type) DO UPDATE SET created_at = excluded.created_at
+                 WHERE owner_notifications.status = 'PENDING' AND owner_notifications.created_at < ?""",
+              (msg_id, event_type, now.isoformat(), (now - timedelta(seconds=OWNER_NOTIFY_PENDING_TTL)).isoformat()))
+    if c.rowcount == 0:
+        logger.info(f"Skipping duplicate notification {event_type} for {msg_id}")
+        return None
+
+    logger.info(f"OWNER_NOTIFY_ATTEMPT: {event_type} for {msg_id}")
     
+    # The reservation is already committed (autocommit), so no lock is held during the send
     try:
         # Send SMS (Operational - Force Send)
+        started = time.monotonic()
         sid = twilio_client.send_sms(OWNER_PHONE_NUMBER, full_body)
+        send_ms = int((time.monotonic() - started) * 1000)
         
-        logger.info(f"OWNER_NOTIFY_OK: SID={sid}")
+        logger.info(f"OWNER_NOTIFY_OK: SID={sid} ({send_ms}ms)")
         
-        # Audit Log
-        audit_id = str(uuid.uuid4())
+        # Ledger (dedup source) + Audit Log (buffered)
         now_ui = datetime.now(timezone.utc).isoformat()
-        c.execute("INSERT INTO audit_log (id, event, actor, metadata, timestamp) VALUES (?, ?, ?, ?, ?)",
-                  (audit_id, audit_event, "SYSTEM", json.dumps({"msg_id": msg_id, "sid": sid}), now_ui))
-        # Note: We commit in the main loop, but if we want to secure this log, we rely on main loop commit
+        c.execute("UPDATE owner_notifications SET status = 'SENT', sid = ?, sent_at = ?, send_ms = ? WHERE msg_id = ? AND event_type = ?",
+                  (sid, now_ui, send_ms, msg_id, event_type))
+        record_audit(audit_event, dict(metadata or {}, msg_id=msg_id, sid=sid), timestamp=now_ui)
+        return sid
         
     except Exception as e:
         logger.error(f"OWNER_NOTIFY_FAIL: {e}")
+        # Free the reservation so the next attempt can notify
+        c.execute("DELETE FROM owner_notifications WHERE msg_id = ? AND event_type = ? AND status = 'PENDING'", (msg_id, event_type))
+        return None
+
+def check_guardrails(msg_id, classification):
+    """
+    Applies the strict routing guardrails to a classification.
+    Returns the NEEDS_REVIEW reason for the owner, or None if drafting may proceed.
+    """
+    lang = classification.get("language", "UNCLEAR")
+    confidence = classification.get("language_confidence", 0.0)
+    risk = classification.get("risk", "HIGH") # Fail safe
+    risk_reason = classification.get("risk_reason", "NONE")
+    intent = classification.get("intent", "UNKNOWN")
+    
+    logger.info(f"Classified {msg_id}: Lang={lang} ({confidence}), Risk={risk} ({risk_reason}), Intent={intent}")
+
+    # Language Check
+    if lang not in ["EN", "ES"] or lang == "UNCLEAR":
+        logger.info(f"Language {lang} not supported/unclear. Needs Review.")
+        return f"Language {lang} (Conf: {confidence})"
+        
+    if confidence < 0.75:
+        logger.info(f"Language Confidence Low ({confidence}). Needs Review.")
+        return f"Low Confidence ({confidence})"
+
+    # Risk Check
+    if risk == "HIGH":
+        logger.info(f"Risk HIGH ({risk_reason}) for {msg_id}. Needs Review.")
+        return f"Risk HIGH ({risk_reason})"
+    
+    # Intent Check    
+    if intent == "UNKNOWN":
+        logger.info(f"Intent UNKNOWN for {msg_id}. Needs Review.")
+        return "Intent UNKNOWN"
+
+    return None
+
+@timed("classify")
+def classify_with_cache(body):
+    """
+    Returns (classification, candidate_draft). Cache hits skip OpenAI for the
+    classification; the draft (if any) is only produced on single-call misses.
+    """
+    if CLASSIFY_CACHE_ENABLED:
+        cached = classification_cache.get(body)
+        if cached is not None:
+            _track_llm(cache_hit=True)
+            return cached, ""
 
+    if ENRICH_PIPELINE == "single_call":
+        result = classify_and_draft(body)
+        draft_body = (result.pop("draft", None) or "").strip()
+    else:
+        result = classify_message(body)
+        draft_body = ""
+
+    if CLASSIFY_CACHE_ENABLED:
+        classification_cache.put(body, result)
+    return result, draft_body
+
+@timed("llm_classify")
 def classify_message(body):
     """
     Returns strict JSON: {language, language_confidence, risk, risk_reason, intent}
     """
-    system_prompt = """You are a classification engine. Analyze the inbound text.
-Return ONLY a JSON object with keys:
-- language: "EN", "ES", or "UNCLEAR"
-- language_confidence: Float 0.0 to 1.0
-- risk: "LOW" (normal business) or "HIGH" (harmful, legal threat, emergency, sensitive)
-- risk_reason: "PAYMENT", "LEGAL", "HARASSMENT", "MEDICAL", "MINOR", "REFUND", "THREAT", "OTHER", "NONE"
-- intent: "KNOWN" (scheduling, pricing, faq) or "UNKNOWN" (confusing, unrelated)
-"""
-    response = openai_client.chat.completions.create(
+    response = llm_create(
+        "classify",
         model=OPENAI_MODEL,
         messages=[
-            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": CLASSIFY_SYSTEM_PROMPT},
             {"role": "user", "content": body}
         ],
         max_tokens=MAX_TOKENS,
-        temperature=0,
-        timeout=OPENAI_TIMEOUT
+        temperature=0
     )
+    _track_llm(response)
     
-    content = response.choices[0].message.content.strip()
+    return _parse_json(response.choices[0].message.content)
+
+@timed("llm_classify_and_draft")
+def classify_and_draft(body):
+    """
+    Single-call pipeline: classification fields plus a candidate reply in one JSON response.
+    Returns strict JSON: {language, language_confidence, risk, risk_reason, intent, draft}
+    """
+    response = llm_create(
+        "classify_and_draft",
+        model=OPENAI_MODEL,
+        messages=[
+            {"role": "system", "content": CLASSIFY_AND_DRAFT_PROMPT},
+            {"role": "user", "content": body}
+        ],
+        max_tokens=MAX_TOKENS * 2, # Classification + reply
+        temperature=DRAFT_TEMPERATURE, # Same reply style as two_call; the classification is sampled at it too
+        response_format={"type": "json_object"}
+    )
+    _track_llm(response)
+    return _parse_json(response.choices[0].message.content)
+
+def _parse_json(content):
+    content = content.strip()
     if content.startswith("```json"):
         content = content[7:-3]
     return json.loads(content)
 
+@timed("llm_draft")
 def generate_draft(body, lang, intent):
     """
     Generates a polite business reply.
@@ -225,19 +620,35 @@ Rules:
 3. If intent is KNOWN but details are missing, end with a simple next step (e.g. "What day/time works for you?").
 4. Keep it short (1-2 sentences).
 """
-    response = openai_client.chat.completions.create(
+    response = llm_create(
+        "draft",
         model=OPENAI_MODEL,
         messages=[
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": body}
         ],
         max_tokens=MAX_TOKENS,
-        temperature=0.3,
-        timeout=OPENAI_TIMEOUT
+        temperature=DRAFT_TEMPERATURE
     )
+    _track_llm(response)
     return response.choices[0].message.content.strip()
 
 def update_status(conn, msg_id, status):
     c = conn.cursor()
     c.execute("UPDATE messages SET status = ? WHERE id = ?", (status, msg_id))
 
+def routed_row(msg_id, status, reason=None, draft_id=None, timestamp=None):
+    """MESSAGE_ROUTED audit row: the enrichment outcome, whether or not the owner is notified."""
+    metadata = {"msg_id": msg_id, "status": status}
+    if reason is not None:
+        metadata["reason"] = reason[:200]
+    if draft_id is not None:
+        metadata["draft_id"] = draft_id
+    return audit_row("MESSAGE_ROUTED", metadata, timestamp=timestamp)
+
+def route_to_review(msg_id, reason):
+    """Moves a message to NEEDS_REVIEW and records why, in one commit."""
+    with transaction() as conn:
+        update_status(conn, msg_id, "NEEDS_REVIEW")
+        insert_audit(conn, [routed_row(msg_id, "NEEDS_REVIEW", reason)])
+
@@ -1,78 +1,276 @@
 import time
-import uuid
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-from execution.utils.db import get_db_connection
-from execution.utils.logging import logger
-from execution.connectors.twilio import TwilioConnector
-from execution.config import POLLING_INTERVAL, ENABLE_SENDING
+from execution.utils.db import get_connection, transaction
+from execution.utils.logging import get_logger
+from execution.utils.audit import audit_row, insert_audit
+from execution.utils.metrics import timed, APPROVAL_TO_SEND
+from execution.utils.leader import PROCESS_ID
+from execution.connectors.twilio import shared_connector
+from execution.config import (
+    POLLING_INTERVAL, POLLING_MAX_INTERVAL, ENABLE_SENDING,
+    SEND_WORKERS, SEND_COMMIT_BATCH, SEND_COMMIT_INTERVAL,
+    SEND_CLAIM_BATCH, SEND_LEASE_SECONDS, WAKE_CHECK_INTERVAL
+)
 
-twilio = TwilioConnector()
+logger = get_logger(__name__)
 
-def run_polling_loop():
+twilio = shared_connector()
+
+# Lease owner for rows this process claims (unique per process)
+SENDER_ID = PROCESS_ID
+
+# Set by owner approvals so the sender runs immediately instead of waiting for the next poll
+_outbound_wakeup = threading.Event()
+
+def wake_outbound_sender():
+    """
+    Signals the polling loop that new APPROVED_TO_SEND rows were committed.
+    """
+    _outbound_wakeup.set()
+
+class _ExternalCommits:
     """
-    Poller that checks for APPROVED_TO_SEND messages and sends them.
-    Runs indefinitely (blocking), so should be threaded.
+    Detects approvals committed by other processes (e.g. other web workers): PRAGMA data_version
+    changes when another connection commits, and only then is the queue index probed.
+    """
+    def __init__(self):
+        self.seen = None
+
+    def approvals_pending(self):
+        conn = get_connection()
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self.seen:
+            return False
+        self.seen = version
+        return conn.execute("SELECT 1 FROM messages WHERE status = 'APPROVED_TO_SEND' LIMIT 1").fetchone() is not None
+
+def run_polling_loop(stop_event=None):
+    """
+    Sender loop: drains APPROVED_TO_SEND when woken by an approval, in this process
+    (wake_outbound_sender) or another one (checked every WAKE_CHECK_INTERVAL).
+    The timed poll is a safety net for missed signals; it starts at POLLING_INTERVAL
+    and backs off to POLLING_MAX_INTERVAL while the queue stays empty.
+    Runs until stop_event is set (forever by default), so should be threaded.
     """
     logger.info(f"Starting Polling Loop... Sending Enabled: {ENABLE_SENDING}")
-    while True:
+    interval = POLLING_INTERVAL
+    external = _ExternalCommits()
+    while not (stop_event and stop_event.is_set()):
+        processed = 0
         try:
-            process_outbound_queue()
+            processed = process_outbound_queue()
         except Exception as e:
             logger.error(f"Polling loop crash: {e}")
         
-        time.sleep(POLLING_INTERVAL)
+        interval = POLLING_INTERVAL if processed else min(interval * 2, POLLING_MAX_INTERVAL)
+        deadline = time.monotonic() + interval
+        while not (stop_event and stop_event.is_set()):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if _outbound_wakeup.wait(min(WAKE_CHECK_INTERVAL, remaining)):
+                logger.info("Polling loop woken by approval.")
+                break
+            try:
+                if external.approvals_pending():
+                    logger.info("Polling loop woken by approval in another process.")
+                    break
+            except Exception as e:
+                logger.error(f"Approval check failed: {e}")
+        _outbound_wakeup.clear()
+
+def approval_latency_ms(conn, msg_id, sent_at):
+    """
+    Milliseconds from the owner's latest APPROVE of msg_id to sent_at, or None.
+    """
+    row = conn.execute("SELECT timestamp FROM approvals WHERE draft_id = ? AND action = 'APPROVE' ORDER BY timestamp DESC LIMIT 1",
+                       (msg_id,)).fetchone()
+    if not row or not row['timestamp']:
+        return None
+    approved_at = datetime.fromisoformat(row['timestamp'])
+    return int((sent_at - approved_at).total_seconds() * 1000)
 
 def process_outbound_queue():
-    conn = get_db_connection()
-    c = conn.cursor()
-    
-    # Criteria: APPROVED_TO_SEND
-    c.execute("SELECT * FROM messages WHERE status = 'APPROVED_TO_SEND'")
-    rows = c.fetchall()
-    
-    if rows:
-        logger.info(f"Found {len(rows)} messages to send.")
-    
+    """
+    Sends every APPROVED_TO_SEND message. Returns the number of rows claimed.
+    Rows are leased in batches (claim_outbound), so several sender processes can
+    drain the queue against the same DB without double-sending.
+    Threads are sent in parallel (SEND_WORKERS), each thread in order, under a
+    per-sending-number token bucket. Results are written in batched commits.
+    """
+    # Kill Switch Check
+    if not ENABLE_SENDING:
+        now_ui = datetime.now(timezone.utc).isoformat()
+        with transaction() as conn:
+            # Reset status to stop loop
+            blocked = [r['id'] for r in conn.execute(
+                "UPDATE messages SET status = 'NEEDS_REVIEW' WHERE status = 'APPROVED_TO_SEND' RETURNING id").fetchall()]
+            # Log Audit
+            insert_audit(conn, [audit_row("SEND_BLOCKED_KILL_SWITCH", {"msg_id": msg_id}, timestamp=now_ui) for msg_id in blocked])
+        for msg_id in blocked:
+            logger.warning(f"SEND BLOCKED (Kill Switch) for {msg_id}")
+        return len(blocked)
+
+    total = 0
+    while True:
+        rows = claim_outbound(SEND_CLAIM_BATCH)
+        if not rows:
+            break
+        logger.info(f"Claimed {len(rows)} messages to send.")
+        _send_claimed(rows)
+        total += len(rows)
+        if len(rows) < SEND_CLAIM_BATCH:
+            break
+    return total
+
+@timed("send_claim")
+def claim_outbound(limit, owner=SENDER_ID):
+    """
+    Atomically leases up to `limit` rows to `owner`, oldest first: APPROVED_TO_SEND rows,
+    plus SENDING rows whose lease expired (their sender died). Claimed rows are SENDING.
+    """
+    now = time.time()
+    with transaction() as conn:
+        rows = conn.execute("""
+            UPDATE messages SET status = 'SENDING', lease_owner = ?, lease_expires_at = ?
+            WHERE id IN (
+                SELECT id FROM messages
+                WHERE status = 'APPROVED_TO_SEND' OR (status = 'SENDING' AND lease_expires_at < ?)
+                ORDER BY timestamp, id LIMIT ?
+            )
+            RETURNING *""", (owner, now + SEND_LEASE_SECONDS, now, limit)).fetchall()
+    # RETURNING order is unspecified
+    return sorted(rows, key=lambda r: (r['timestamp'] or '', r['id']))
+
+# Send workers live as long as the process: created on first send, reused by every claim batch
+_send_pool = None
+_send_pool_lock = threading.Lock()
+
+def send_pool():
+    global _send_pool
+    with _send_pool_lock:
+        if _send_pool is None:
+            _send_pool = ThreadPoolExecutor(max_workers=SEND_WORKERS, thread_name_prefix="send")
+        return _send_pool
+
+def _send_claimed(rows, owner=SENDER_ID):
+    # Group per thread, preserving order
+    threads = {}
+    for row in rows:
+        threads.setdefault(row['thread_id'] or row['receiver'], []).append(row)
+
+    results = queue.Queue()
+    pending = []
+    received = 0
+    last_flush = time.monotonic()
+    pool = send_pool()
+    futures = [pool.submit(_send_thread, thread_rows, results, owner) for thread_rows in threads.values()]
+    while True:
+        try:
+            pending.append(results.get(timeout=SEND_COMMIT_INTERVAL))
+            received += 1
+        except queue.Empty:
+            pass
+        # One result per row; the futures check guards against a worker dying early
+        finished = received == len(rows) or (all(f.done() for f in futures) and results.empty())
+        if pending and (finished or len(pending) >= SEND_COMMIT_BATCH or time.monotonic() - last_flush >= SEND_COMMIT_INTERVAL):
+            _record_send_results(pending, owner)
+            pending = []
+            last_flush = time.monotonic()
+        if finished:
+            break
+
+def _reserve_send(msg_id, owner):
+    """
+    Renews owner's lease on msg_id and records the attempt in outbound_sends, in one transaction.
+    Returns (None, None) to go ahead, or (outcome, sid) when the draft must not be sent:
+    LEASE_LOST (another sender holds it), ALREADY_SENT (a previous attempt succeeded),
+    OUTCOME_UNKNOWN (a previous attempt started but never recorded a result).
+    """
+    now = time.time()
+    with transaction() as conn:
+        renewed = conn.execute("UPDATE messages SET lease_expires_at = ? WHERE id = ? AND status = 'SENDING' AND lease_owner = ?",
+                               (now + SEND_LEASE_SECONDS, msg_id, owner)).rowcount
+        if not renewed:
+            return "LEASE_LOST", None
+        # Retry only after a known failure (or an owner re-approval of an unknown outcome)
+        reserved = conn.execute("""
+            INSERT INTO outbound_sends (draft_id, lease_owner, status, attempted_at) VALUES (?, ?, 'SENDING', ?)
+            ON CONFLICT(draft_id) DO UPDATE SET
+                lease_owner = excluded.lease_owner, status = 'SENDING', sid = NULL, error = NULL,
+                attempted_at = excluded.attempted_at, completed_at = NULL
+            WHERE outbound_sends.status IN ('FAILED', 'UNKNOWN')""",
+            (msg_id, owner, datetime.now(timezone.utc).isoformat())).rowcount
+        if reserved:
+            return None, None
+        prior = conn.execute("SELECT status, sid FROM outbound_sends WHERE draft_id = ?", (msg_id,)).fetchone()
+        if prior['status'] == 'SENT':
+            return "ALREADY_SENT", prior['sid']
+        return "OUTCOME_UNKNOWN", None
+
+def _send_thread(rows, results, owner=SENDER_ID):
+    """
+    Sends one thread's messages in order. Runs on a send worker.
+    Each send is preceded by a lease renewal + ledger reservation; results are
+    recorded by the caller in batches.
+    """
     for row in rows:
         msg_id = row['id']
-        receiver = row['receiver']
-        body = row['body']
-        
-        # Kill Switch Check
-        if not ENABLE_SENDING:
-            logger.warning(f"SEND BLOCKED (Kill Switch) for {msg_id}")
-            now_ui = datetime.now(timezone.utc).isoformat()
-            
-            # Log Audit
-            audit_id = str(uuid.uuid4())
-            c.execute("INSERT INTO audit_log (id, event, actor, metadata, timestamp) VALUES (?, ?, ?, ?, ?)",
-                      (audit_id, "SEND_BLOCKED_KILL_SWITCH", "SYSTEM", f'{{"msg_id": "{msg_id}"}}', now_ui))
-            
-            # Reset status to stop loop
-            c.execute("UPDATE messages SET status = 'NEEDS_REVIEW' WHERE id = ?", (msg_id,))
-            conn.commit()
+        try:
+            outcome, sid = _reserve_send(msg_id, owner)
+        except Exception as e:
+            # Nothing reserved: the lease lapses and the row is reclaimed later
+            logger.error(f"Could not reserve send for {msg_id}: {e}")
+            outcome, sid = "LEASE_LOST", None
+        if outcome:
+            logger.warning(f"Not sending {msg_id}: {outcome}")
+            results.put((msg_id, outcome, sid, None, datetime.now(timezone.utc)))
             continue
-
         try:
-            # Send
-            sid = twilio.send_sms(receiver, body)
-            
-            # Update DB
-            now_ui = datetime.now(timezone.utc).isoformat()
-            new_status = 'SENT'
-            
-            c.execute("UPDATE messages SET status = ?, timestamp = ? WHERE id = ?", (new_status, now_ui, msg_id))
-            
-            # Audit
-            audit_id = str(uuid.uuid4())
-            c.execute("INSERT INTO audit_log (id, event, actor, metadata, timestamp) VALUES (?, ?, ?, ?, ?)",
-                      (audit_id, "MESSAGE_SENT", "SYSTEM", f'{{"sid": "{sid}", "msg_id": "{msg_id}"}}', now_ui))
-            
-            conn.commit()
-            
+            sid = twilio.send_sms(row['receiver'], row['body'])
+            results.put((msg_id, "SENT", sid, None, datetime.now(timezone.utc)))
         except Exception as e:
             logger.error(f"Failed to send {msg_id}: {e}")
-            c.execute("UPDATE messages SET status = 'FAILED_SEND' WHERE id = ?", (msg_id,))
-            conn.commit()
-            
-    conn.close()
+            results.put((msg_id, "FAILED", None, str(e), datetime.now(timezone.utc)))
+
+@timed("send_record")
+def _record_send_results(results, owner=SENDER_ID):
+    """
+    Writes a batch of send outcomes (status, ledger + audit) in one transaction and releases the leases.
+    """
+    conn = get_connection()
+    updates, ledger, audits = [], [], []
+    for msg_id, outcome, sid, error, at in results:
+        now_ui = at.isoformat()
+        if outcome == "SENT":
+            latency_ms = approval_latency_ms(conn, msg_id, at)
+            if latency_ms is not None:
+                logger.info(f"Approval-to-send latency for {msg_id}: {latency_ms}ms")
+                APPROVAL_TO_SEND.observe(latency_ms / 1000)
+            updates.append(('SENT', now_ui, msg_id, owner))
+            ledger.append(('SENT', sid, None, now_ui, msg_id, owner))
+            audits.append(audit_row("MESSAGE_SENT", {"sid": sid, "msg_id": msg_id, "approval_to_send_ms": latency_ms}, timestamp=now_ui))
+        elif outcome == "FAILED":
+            updates.append(('FAILED_SEND', None, msg_id, owner))
+            ledger.append(('FAILED', None, error, now_ui, msg_id, owner))
+            audits.append(audit_row("SEND_FAILED", {"msg_id": msg_id, "error": error}, timestamp=now_ui))
+        elif outcome == "ALREADY_SENT":
+            # Sent by an earlier attempt whose status update was lost; never resend
+            updates.append(('SENT', None, msg_id, owner))
+            audits.append(audit_row("SEND_DEDUPLICATED", {"sid": sid, "msg_id": msg_id}, timestamp=now_ui))
+        elif outcome == "OUTCOME_UNKNOWN":
+            # The customer may or may not have it: leave it to the owner (re-approve to resend)
+            updates.append(('FAILED_SEND', None, msg_id, owner))
+            ledger.append(('UNKNOWN', None, "Previous send attempt has no recorded result", now_ui, msg_id, None))
+            audits.append(audit_row("SEND_OUTCOME_UNKNOWN", {"msg_id": msg_id}, timestamp=now_ui))
+        # LEASE_LOST: the row belongs to another sender now; nothing to write
+
+    with transaction() as conn:
+        conn.executemany("""UPDATE messages SET status = ?, timestamp = COALESCE(?, timestamp), lease_owner = NULL, lease_expires_at = NULL
+                            WHERE id = ? AND lease_owner = ?""", updates)
+        conn.executemany("""UPDATE outbound_sends SET status = ?, sid = ?, error = ?, completed_at = ?
+                            WHERE draft_id = ? AND lease_owner IS COALESCE(?, lease_owner)""", ledger)
+        insert_audit(conn, audits) # Same commit as the status change
@@ -1,7 +1,235 @@
-from execution.utils.logging import logger
+import re
+import time
+import json
+from datetime import datetime, timedelta, timezone
+from execution.utils.db import get_connection, transaction
+from execution.utils.logging import get_logger
+from execution.config import REPORT_BATCH_SIZE, REPORT_INTERVAL, REPORT_DIGEST_HOUR
+from execution.jobs.job_02_enrich import send_owner_sms
 
-def generate_daily_report():
+logger = get_logger(__name__)
+
+UPSERT_ROLLUP = """
+    INSERT INTO report_daily (day, metric, key, count, total, max) VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(day, metric, key) DO UPDATE SET
+        count = report_daily.count + excluded.count,
+        total = report_daily.total + excluded.total,
+        max = coalesce(max(report_daily.max, excluded.max), report_daily.max, excluded.max)
+"""
+
+# Source tables folded into report_daily, each by rowid high-water mark (append-only tables)
+SOURCES = {
+    "audit_log": "SELECT rowid AS rid, event, metadata, timestamp FROM audit_log WHERE rowid > ? ORDER BY rowid LIMIT ?",
+    "approvals": """
+        SELECT a.rowid AS rid, a.action, a.timestamp, n.sent_at AS notified_at
+        FROM approvals a
+        LEFT JOIN messages d ON d.id = a.draft_id
+        LEFT JOIN owner_notifications n ON n.msg_id = d.in_reply_to_id AND n.event_type = 'DRAFT_READY'
+        WHERE a.rowid > ? ORDER BY a.rowid LIMIT ?""",
+}
+
+class _Rollup:
+    """Per-batch accumulator: (day, metric, key) -> [count, total, max]."""
+    def __init__(self):
+        self.cells = {}
+
+    def add(self, day, metric, key="", count=1, value=None):
+        cell = self.cells.setdefault((day, metric, key), [0, 0.0, None])
+        cell[0] += count
+        if value is not None:
+            cell[1] += value
+            cell[2] = value if cell[2] is None else max(cell[2], value)
+
+    def rows(self):
+        return [(day, metric, key, c, total, mx) for (day, metric, key), (c, total, mx) in self.cells.items()]
+
+def _day(timestamp):
+    return (timestamp or "")[:10] or "unknown" # ISO8601 UTC -> YYYY-MM-DD
+
+def _meta(row):
+    try:
+        return json.loads(row['metadata'] or "{}")
+    except ValueError:
+        return {}
+
+def reason_category(reason):
+    """
+    Groups NEEDS_REVIEW reasons: drops details after ':' and numeric parentheticals.
+    "Risk HIGH (LEGAL: 'sue you')" -> "Risk HIGH (LEGAL)", "Low Confidence (0.6)" -> "Low Confidence"
+    """
+    head = (reason or "UNKNOWN").partition(":")[0]
+    head = re.sub(r"\s*\([^)]*\d[^)]*\)?", "", head)
+    if head.count("(") > head.count(")"):
+        head += ")"
+    return head.strip()[:40] or "UNKNOWN"
+
+def failure_category(error):
+    """Twilio error code when present, else the first clause of the error."""
+    match = re.search(r"\b(2\d{4})\b", error or "")
+    if match:
+        return f"Twilio {match.group(1)}"
+    return re.sub(r"\d+", "#", (error or "UNKNOWN").partition(":")[0]).strip()[:40]
+
+def _fold_audit(row, rollup):
+    day, event = _day(row['timestamp']), row['event']
+    rollup.add(day, "event", event)
+    if event == "MESSAGE_ROUTED":
+        meta = _meta(row)
+        rollup.add(day, "route", meta.get("status") or "UNKNOWN")
+        if meta.get("status") == "NEEDS_REVIEW":
+            rollup.add(day, "review_reason", reason_category(meta.get("reason")))
+    elif event == "SEND_FAILED":
+        rollup.add(day, "send_failure", failure_category(_meta(row).get("error")))
+    elif event == "MESSAGE_SENT":
+        latency_ms = _meta(row).get("approval_to_send_ms")
+        if latency_ms is not None:
+            rollup.add(day, "approval_to_send_ms", value=float(latency_ms))
+    elif event == "LLM_USAGE":
+        meta = _meta(row)
+        for key in ("calls", "prompt_tokens", "completion_tokens", "cache_hits"):
+            if meta.get(key):
+                rollup.add(day, "llm", key, count=int(meta[key]))
+
+def _fold_approvals(row, rollup):
+    day = _day(row['timestamp'])
+    rollup.add(day, "approval", row['action'])
+    if row['notified_at'] and row['timestamp']:
+        seconds = (datetime.fromisoformat(row['timestamp']) - datetime.fromisoformat(row['notified_at'])).total_seconds()
+        rollup.add(day, "approval_turnaround_s", row['action'], value=max(0.0, seconds))
+
+FOLDERS = {"audit_log": _fold_audit, "approvals": _fold_approvals}
+
+def update_rollups(batch_size=REPORT_BATCH_SIZE):
+    """
+    Folds rows added since the last run into report_daily. Cost is proportional to the
+    new rows only. Each batch commits with its high-water mark, so a crash never double-counts.
+    Returns the number of source rows folded.
+    """
+    folded = 0
+    for source, query in SOURCES.items():
+        while True:
+            with transaction() as conn:
+                state = conn.execute("SELECT high_water FROM report_state WHERE source = ?", (source,)).fetchone()
+                high_water = state['high_water'] if state else 0
+                rows = conn.execute(query, (high_water, batch_size)).fetchall()
+                if not rows:
+                    break
+                rollup = _Rollup()
+                for row in rows:
+                    FOLDERS[source](row, rollup)
+                conn.executemany(UPSERT_ROLLUP, rollup.rows())
+                conn.execute("""INSERT INTO report_state (source, high_water, updated_at) VALUES (?, ?, ?)
+                                ON CONFLICT(source) DO UPDATE SET high_water = excluded.high_water, updated_at = excluded.updated_at""",
+                             (source, rows[-1]['rid'], datetime.now(timezone.utc).isoformat()))
+            folded += len(rows)
+            if len(rows) < batch_size:
+                break
+    if folded:
+        logger.info(f"Report rollups updated ({folded} rows)")
+    return folded
+
+def build_report(day):
+    """
+    JSON-ready report for one UTC day, read from report_daily only.
+    """
+    cells = {}
+    for r in get_connection().execute("SELECT metric, key, count, total, max FROM report_daily WHERE day = ?", (day,)):
+        cells.setdefault(r['metric'], {})[r['key']] = (r['count'], r['total'], r['max'])
+
+    def count(metric, key):
+        return cells.get(metric, {}).get(key, (0, 0.0, None))[0]
+
+    def ranked(metric):
+        return dict(sorted(((k, v[0]) for k, v in cells.get(metric, {}).items()), key=lambda kv: (-kv[1], kv[0])))
+
+    turnaround = cells.get("approval_turnaround_s", {})
+    decided = sum(v[0] for v in turnaround.values())
+    to_send = cells.get("approval_to_send_ms", {}).get("", (0, 0.0, None))
+    llm = cells.get("llm", {})
+
+    return {
+        "day": day,
+        "volume": {
+            "received": count("event", "MESSAGE_RECEIVED"),
+            "drafts": count("route", "DRAFT_PENDING_APPROVAL"),
+            "needs_review": count("route", "NEEDS_REVIEW"),
+            "sent": count("event", "MESSAGE_SENT"),
+            "send_failed": count("event", "SEND_FAILED") + count("event", "SEND_OUTCOME_UNKNOWN"),
+            "send_blocked": count("event", "SEND_BLOCKED_KILL_SWITCH"),
+        },
+        "approvals": {
+            "by_action": ranked("approval"),
+            "avg_turnaround_s": round(sum(v[1] for v in turnaround.values()) / decided, 1) if decided else None,
+            "max_turnaround_s": max((v[2] for v in turnaround.values() if v[2] is not None), default=None),
+        },
+        "approval_to_send_ms": {
+            "avg": round(to_send[1] / to_send[0]) if to_send[0] else None,
+            "max": to_send[2],
+        },
+        "review_reasons": ranked("review_reason"),
+        "send_failures": ranked("send_failure"),
+        "llm": {key: llm.get(key, (0,))[0] for key in ("calls", "prompt_tokens", "completion_tokens", "cache_hits")},
+    }
+
+def _short(n):
+    return f"{n / 1000:.1f}k" if n >= 1000 else str(n)
+
+def format_digest(report):
+    """
+    Compact SMS digest (about two segments).
+    """
+    v, a, llm = report["volume"], report["approvals"], report["llm"]
+    actions = a["by_action"]
+    lines = [
+        f"MILO daily {report['day']}",
+        f"In {v['received']} | Drafts {v['drafts']} | Review {v['needs_review']} | Sent {v['sent']} | Failed {v['send_failed']}",
+    ]
+    if actions:
+        line = f"Owner: A{actions.get('APPROVE', 0)} R{actions.get('REJECT', 0)} E{actions.get('EDIT', 0)}"
+        if a["avg_turnaround_s"] is not None:
+            line += f", avg {round(a['avg_turnaround_s'] / 60)}m"
+        lines.append(line)
+    if report["review_reasons"]:
+        top = list(report["review_reasons"].items())[:3]
+        lines.append("Review: " + ", ".join(f"{k} {n}" for k, n in top))
+    if report["send_failures"]:
+        top = list(report["send_failures"].items())[:2]
+        lines.append("Failures: " + ", ".join(f"{k} {n}" for k, n in top))
+    if llm["calls"] or llm["cache_hits"]:
+        tokens = llm["prompt_tokens"] + llm["completion_tokens"]
+        lines.append(f"LLM: {llm['calls']} calls, {_short(tokens)} tokens, {llm['cache_hits']} cached")
+    return "\n".join(lines)
+
+def yesterday():
+    return (datetime.now(timezone.utc) - timedelta(days=1)).strftime("%Y-%m-%d")
+
+def generate_daily_report(day=None, send=True):
+    """
+    Brings the rollups up to date and returns the report for `day` (default: yesterday, UTC).
+    With send=True the SMS digest goes to the owner once per day (owner_notifications ledger).
+    """
+    day = day or yesterday()
+    update_rollups()
+    report = build_report(day)
+    if send:
+        send_owner_sms(get_connection(), "DAILY_REPORT", f"REPORT:{day}", format_digest(report), {"day": day})
+    return report
+
+def run_report_loop(stop_event=None):
     """
-    Placeholder for daily audit reporting.
+    Keeps the rollups current every REPORT_INTERVAL and sends yesterday's digest once
+    REPORT_DIGEST_HOUR (UTC) has passed. Runs until stop_event is set, so should be threaded.
     """
-    logger.info("generate_daily_report called (No-op MVP).")
+    logger.info(f"Starting Report Loop... Interval: {REPORT_INTERVAL}s, digest after {REPORT_DIGEST_HOUR}:00 UTC")
+    while not (stop_event and stop_event.is_set()):
+        try:
+            if datetime.now(timezone.utc).hour >= REPORT_DIGEST_HOUR:
+                generate_daily_report()
+            else:
+                update_rollups()
+        except Exception as e:
+            logger.error(f"Report loop crash: {e}")
+        if stop_event:
+            stop_event.wait(REPORT_INTERVAL)
+        else:
+            time.sleep(REPORT_INTERVAL)
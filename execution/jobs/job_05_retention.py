@@ -0,0 +1,285 @@
+import os
+import glob
+import time
+import argparse
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from execution.utils.db import get_db_connection
+from execution.utils.logging import get_logger
+from execution.config import (
+    RETENTION_DAYS, AUDIT_RETENTION_DAYS, ARCHIVE_DIR, RETENTION_BATCH_SIZE,
+    RETENTION_PAUSE, RETENTION_INTERVAL, VACUUM_STEP_PAGES
+)
+from execution.jobs.job_04_report import update_rollups
+
+logger = get_logger(__name__)
+
+TERMINAL_STATUSES = ("SENT", "REJECTED", "FAILED_SEND", "IMPORTED")
+# Tables that move to the archive (same schema there, added columns included)
+ARCHIVE_TABLES = ("messages", "approvals", "outbound_sends", "owner_notifications", "audit_log")
+MAX_HISTORY_ARCHIVES = 9 # SQLite attaches at most 10 databases; newest years win
+
+def archive_dir(conn):
+    """ARCHIVE_DIR, or archive/ next to the main database file."""
+    if ARCHIVE_DIR:
+        return ARCHIVE_DIR
+    main_file = next(r['file'] for r in conn.execute("PRAGMA database_list") if r['name'] == 'main')
+    return os.path.join(os.path.dirname(main_file), "archive")
+
+def archive_path(directory, year):
+    return os.path.join(directory, f"milo-archive-{year}.db")
+
+def maintenance_connection():
+    """
+    Dedicated autocommit connection: ATTACH/DETACH never touch the shared per-thread connections.
+    """
+    conn = get_db_connection()
+    conn.isolation_level = None
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS retention_batch (tbl TEXT, rid INTEGER, PRIMARY KEY (tbl, rid))")
+    return conn
+
+@contextmanager
+def attached(conn, path, alias="arch"):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn.execute(f"ATTACH DATABASE ? AS {alias}", (path,))
+    try:
+        # The archive commit must be on disk before the rows leave the main DB
+        conn.execute(f"PRAGMA {alias}.synchronous = FULL")
+        yield alias
+    finally:
+        conn.execute(f"DETACH DATABASE {alias}")
+
+def columns(conn, schema, table):
+    return [r['name'] for r in conn.execute(f'PRAGMA {schema}.table_info("{table}")')]
+
+def ensure_archive_schema(conn, alias):
+    """
+    Creates the archived tables from the main schema, adding columns introduced by later migrations.
+    """
+    for table in ARCHIVE_TABLES:
+        sql = conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()['sql']
+        conn.execute(sql.replace(f"CREATE TABLE {table}", f"CREATE TABLE IF NOT EXISTS {alias}.{table}", 1))
+        have = set(columns(conn, alias, table))
+        for col in conn.execute(f'PRAGMA main.table_info("{table}")').fetchall():
+            if col['name'] not in have:
+                conn.execute(f'ALTER TABLE {alias}.{table} ADD COLUMN "{col["name"]}" {col["type"]}')
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {alias}.idx_archive_thread ON messages(thread_id, timestamp)")
+
+def _safe_rowid(conn, source):
+    """
+    Highest rowid of `source` that may leave the main DB: already folded into the report
+    rollups, and never the newest row (SQLite would hand its rowid out again).
+    """
+    state = conn.execute("SELECT high_water FROM report_state WHERE source = ?", (source,)).fetchone()
+    newest = conn.execute(f"SELECT max(rowid) FROM {source}").fetchone()[0] or 0
+    return min(state['high_water'] if state else 0, newest - 1)
+
+def _select_message_batch(conn, cutoff, limit):
+    """
+    Fills retention_batch with old terminal drafts and imported history, the inbound messages
+    the drafts answer (unless another draft still references them) and their approvals, send
+    ledger and owner notification rows. Returns {year: count of drafts and imported rows}.
+    """
+    safe = _safe_rowid(conn, "approvals")
+    placeholders = ", ".join("?" for _ in TERMINAL_STATUSES)
+    drafts = conn.execute(f"""
+        SELECT m.rowid AS rid, substr(m.timestamp, 1, 4) AS year FROM messages m
+        WHERE m.status IN ({placeholders}) AND (m.type = 'DRAFT' OR m.status = 'IMPORTED') AND m.timestamp < ?
+          AND NOT EXISTS (SELECT 1 FROM approvals a WHERE a.draft_id = m.id AND a.rowid > ?)
+        ORDER BY m.timestamp LIMIT ?""", (*TERMINAL_STATUSES, cutoff, safe, limit)).fetchall()
+    if not drafts:
+        return {}
+    year = drafts[0]['year'] # One archive file per batch
+    conn.executemany("INSERT INTO temp.retention_batch (tbl, rid) VALUES ('messages', ?)",
+                     [(r['rid'],) for r in drafts if r['year'] == year])
+
+    batch = "SELECT rid FROM temp.retention_batch WHERE tbl = 'messages'"
+    conn.execute(f"""
+        INSERT OR IGNORE INTO temp.retention_batch (tbl, rid)
+        SELECT 'messages', p.rowid FROM messages d JOIN messages p ON p.id = d.in_reply_to_id
+        WHERE d.rowid IN ({batch})
+          AND NOT EXISTS (SELECT 1 FROM messages o WHERE o.in_reply_to_id = p.id AND o.rowid NOT IN ({batch}))""")
+    ids = f"SELECT id FROM messages WHERE rowid IN ({batch})"
+    conn.execute(f"INSERT INTO temp.retention_batch SELECT 'approvals', rowid FROM approvals WHERE draft_id IN ({ids})")
+    conn.execute(f"INSERT INTO temp.retention_batch SELECT 'outbound_sends', rowid FROM outbound_sends WHERE draft_id IN ({ids})")
+    conn.execute(f"INSERT INTO temp.retention_batch SELECT 'owner_notifications', rowid FROM owner_notifications WHERE msg_id IN ({ids})")
+    return {year: sum(1 for r in drafts if r['year'] == year)}
+
+def _select_audit_batch(conn, cutoff, limit):
+    safe = _safe_rowid(conn, "audit_log")
+    rows = conn.execute("""SELECT rowid AS rid, substr(timestamp, 1, 4) AS year FROM audit_log
+                           WHERE timestamp < ? AND rowid <= ? ORDER BY timestamp LIMIT ?""", (cutoff, safe, limit)).fetchall()
+    if not rows:
+        return {}
+    year = rows[0]['year']
+    picked = [(r['rid'],) for r in rows if r['year'] == year]
+    conn.executemany("INSERT INTO temp.retention_batch (tbl, rid) VALUES ('audit_log', ?)", picked)
+    return {year: len(picked)}
+
+def _move_batch(conn, year):
+    """
+    Copies the rows listed in retention_batch into the year's archive, then deletes them from main.
+    Two commits, archive first: a crash in between leaves rows in both places, and the next
+    run's INSERT OR REPLACE makes that harmless. Returns rows moved per table.
+    """
+    directory = archive_dir(conn)
+    moved = {}
+    tables = [r['tbl'] for r in conn.execute("SELECT DISTINCT tbl FROM temp.retention_batch")]
+    with attached(conn, archive_path(directory, year if (year or "").isdigit() else "unknown")) as alias:
+        ensure_archive_schema(conn, alias)
+
+        # 1. Archive (reads main, writes only the archive file)
+        conn.execute("BEGIN")
+        try:
+            for table in tables:
+                cols = ", ".join(f'"{c}"' for c in columns(conn, "main", table))
+                conn.execute(f"""INSERT OR REPLACE INTO {alias}.{table} ({cols}) SELECT {cols} FROM main.{table}
+                                 WHERE rowid IN (SELECT rid FROM temp.retention_batch WHERE tbl = ?)""", (table,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        # 2. Delete from main (short write lock). A draft re-approved in between stays put.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for table in tables:
+                guard = ""
+                if table == "messages":
+                    guard = f" AND (type != 'DRAFT' OR status IN ({', '.join(repr(s) for s in TERMINAL_STATUSES)}))"
+                moved[table] = conn.execute(f"""DELETE FROM main.{table}
+                                                WHERE rowid IN (SELECT rid FROM temp.retention_batch WHERE tbl = ?){guard}""",
+                                            (table,)).rowcount
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    conn.execute("DELETE FROM temp.retention_batch")
+    return moved
+
+def _archive(conn, select_batch, cutoff, totals, stop_event):
+    while not (stop_event and stop_event.is_set()):
+        picked = select_batch(conn, cutoff, RETENTION_BATCH_SIZE)
+        if not picked:
+            return
+        (year, _), = picked.items()
+        for table, n in _move_batch(conn, year).items():
+            totals[table] = totals.get(table, 0) + n
+        time.sleep(RETENTION_PAUSE)
+
+def compact(conn, stop_event=None):
+    """
+    Returns free pages to the filesystem in VACUUM_STEP_PAGES steps (each a short write).
+    Needs auto_vacuum=INCREMENTAL (new databases; older files: run --convert once).
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        logger.warning("auto_vacuum is not INCREMENTAL; run `python -m execution.jobs.job_05_retention --convert` once to enable compaction")
+        return 0
+    freed = 0
+    while not (stop_event and stop_event.is_set()):
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if not free:
+            break
+        conn.execute(f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})").fetchall()
+        freed += free - conn.execute("PRAGMA freelist_count").fetchone()[0]
+        time.sleep(RETENTION_PAUSE)
+    conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+    return freed
+
+def run_retention(stop_event=None, now=None):
+    """
+    One retention pass: archive old terminal drafts (with their thread context) and
+    old audit events into yearly archive files, then compact. Returns counts.
+    """
+    now = now or datetime.now(timezone.utc)
+    update_rollups() # Rows leave the main DB only after the report has counted them
+    conn = maintenance_connection()
+    try:
+        totals = {}
+        _archive(conn, _select_message_batch, (now - timedelta(days=RETENTION_DAYS)).isoformat(), totals, stop_event)
+        _archive(conn, _select_audit_batch, (now - timedelta(days=AUDIT_RETENTION_DAYS)).isoformat(), totals, stop_event)
+        totals["vacuumed_pages"] = compact(conn, stop_event) if any(totals.values()) else 0
+    finally:
+        conn.close()
+    if any(totals.values()):
+        logger.info(f"Retention pass: {totals}")
+    return totals
+
+def convert_to_incremental():
+    """
+    One-off full VACUUM that switches an existing file to auto_vacuum=INCREMENTAL.
+    Takes an exclusive lock for its duration: run with the service stopped.
+    """
+    update_rollups()
+    conn = maintenance_connection()
+    try:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        # VACUUM may renumber rowids; everything up to here has been folded into the report
+        conn.execute("UPDATE report_state SET high_water = (SELECT coalesce(max(rowid), 0) FROM audit_log) WHERE source = 'audit_log'")
+        conn.execute("UPDATE report_state SET high_water = (SELECT coalesce(max(rowid), 0) FROM approvals) WHERE source = 'approvals'")
+        logger.info("Database converted to auto_vacuum=INCREMENTAL")
+    finally:
+        conn.close()
+
+def _history_select(conn, schema, table, cols, source):
+    have = set(columns(conn, schema, table))
+    exprs = ", ".join(f'"{c}"' if c in have else f'NULL AS "{c}"' for c in cols)
+    sql = f"SELECT {exprs}, '{source}' AS source FROM {schema}.{table} a"
+    if schema != "main": # A crash between archive and delete can leave a row in both
+        sql += f" WHERE NOT EXISTS (SELECT 1 FROM main.{table} m WHERE m.id = a.id)"
+    return sql
+
+def history_connection():
+    """
+    Read connection with the newest archive files attached and TEMP views
+    message_history / audit_history spanning them and the main DB.
+    """
+    conn = get_db_connection()
+    paths = sorted(glob.glob(os.path.join(archive_dir(conn), "milo-archive-*.db")), reverse=True)[:MAX_HISTORY_ARCHIVES]
+    schemas = [("main", "main")]
+    for i, path in enumerate(paths):
+        alias = f"archive_{i}"
+        conn.execute(f"ATTACH DATABASE ? AS {alias}", (path,))
+        schemas.append((alias, os.path.basename(path)))
+    for view, table in (("message_history", "messages"), ("audit_history", "audit_log")):
+        cols = columns(conn, "main", table)
+        selects = [_history_select(conn, schema, table, cols, source) for schema, source in schemas
+                   if schema == "main" or columns(conn, schema, table)]
+        conn.execute(f"CREATE TEMP VIEW {view} AS " + " UNION ALL ".join(selects))
+    return conn
+
+def thread_history(thread_id):
+    """All messages of a thread, live and archived, oldest first."""
+    conn = history_connection()
+    try:
+        rows = conn.execute("SELECT * FROM message_history WHERE thread_id = ? ORDER BY timestamp, id", (thread_id,)).fetchall()
+        return [dict(r) for r in rows]
+    finally:
+        conn.close()
+
+def run_retention_loop(stop_event=None):
+    """
+    Runs a retention pass every RETENTION_INTERVAL. Should be threaded.
+    """
+    logger.info(f"Starting Retention Loop... Messages {RETENTION_DAYS}d, audit {AUDIT_RETENTION_DAYS}d")
+    while not (stop_event and stop_event.is_set()):
+        try:
+            run_retention(stop_event)
+        except Exception as e:
+            logger.error(f"Retention loop crash: {e}")
+        if stop_event:
+            stop_event.wait(RETENTION_INTERVAL)
+        else:
+            time.sleep(RETENTION_INTERVAL)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archive old messages/audit rows and compact the database.")
+    parser.add_argument("--convert", action="store_true", help="One-off full VACUUM enabling incremental compaction (service stopped)")
+    args = parser.parse_args(argv)
+    if args.convert:
+        convert_to_incremental()
+    print(run_retention())
+
+if __name__ == '__main__':
+    main()
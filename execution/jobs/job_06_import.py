@@ -0,0 +1,245 @@
+import csv
+import io
+import json
+import re
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from execution.utils.db import transaction
+from execution.utils.audit import audit_row, insert_audit
+from execution.utils.logging import get_logger
+from execution.config import IMPORT_BATCH_SIZE, IMPORT_MAX_ERRORS_REPORTED
+
+logger = get_logger(__name__)
+
+# Imported history is never enriched, notified or sent: nothing selects this status
+IMPORTED_STATUS = "IMPORTED"
+FORMATS = ("csv", "json", "jsonl")
+
+# Normalized header -> field. Covers Twilio console CSV exports and the REST API JSON.
+FIELD_ALIASES = {
+    "sid": "sid", "messagesid": "sid", "id": "sid",
+    "from": "from", "to": "to", "body": "body", "direction": "direction",
+    "datesent": "date", "sentdate": "date", "datecreated": "date", "date": "date", "timestamp": "date",
+    "nummedia": "num_media", "mediaurl": "media_url", "mediaurl0": "media_url",
+}
+
+MESSAGES_KEY = re.compile(r'"messages"\s*:\s*\[')
+
+INSERT_SQL = """INSERT OR IGNORE INTO messages (id, thread_id, sender, receiver, body, media, status, type, timestamp, draft_version)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)"""
+
+def detect_format(name=None, content_type=None):
+    """csv / json / jsonl from a file name or MIME type (None if unknown)."""
+    name = (name or "").lower()
+    for fmt in ("jsonl", "json", "csv"):
+        if name.endswith(f".{fmt}") or (fmt == "jsonl" and name.endswith(".ndjson")):
+            return fmt
+    content_type = (content_type or "").lower()
+    if "ndjson" in content_type or "jsonl" in content_type:
+        return "jsonl"
+    if "json" in content_type:
+        return "json"
+    if "csv" in content_type:
+        return "csv"
+    return None
+
+def read_records(stream, fmt, chunk_size=1 << 16):
+    """
+    Yields one dict per message from a text stream, without loading the file:
+    CSV with a header row, JSON Lines, or a JSON array (optionally wrapped as {"messages": [...]}).
+    """
+    if fmt == "csv":
+        yield from csv.DictReader(stream)
+    elif fmt == "jsonl":
+        for line in stream:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield e # Counted as an invalid row, not fatal
+    elif fmt == "json":
+        yield from _json_array_items(stream, chunk_size)
+    else:
+        raise ValueError(f"Unknown import format: {fmt}")
+
+def _json_array_items(stream, chunk_size):
+    """Items of a top-level JSON array (or of the "messages" array in an object), decoded one at a time."""
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = "", 0, False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer, pos = buffer[pos:] + chunk, 0
+
+    fill()
+    while not buffer.strip() and not eof: # Leading whitespace
+        fill()
+    if buffer.lstrip().startswith("["):
+        pos = buffer.index("[") + 1
+    else: # API page: {"messages": [...], ...}
+        while True:
+            match = MESSAGES_KEY.search(buffer, pos)
+            if match:
+                pos = match.end()
+                break
+            if eof:
+                raise ValueError('No JSON array or "messages" array found')
+            pos = max(0, len(buffer) - 64) # Keep a tail in case the key spans chunks
+            fill()
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(buffer):
+            if eof:
+                raise ValueError("Unterminated JSON array")
+            fill()
+            continue
+        if buffer[pos] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            fill() # Item spans the chunk boundary
+            continue
+        if end == len(buffer) and not eof: # A number may continue in the next chunk
+            fill()
+            continue
+        pos = end
+        yield item
+
+def parse_timestamp(value):
+    """ISO 8601 or RFC 2822 (Twilio API) -> UTC ISO string. Naive times are taken as UTC."""
+    value = (value or "").strip()
+    if not value:
+        raise ValueError("missing date")
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        try:
+            parsed = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"unparseable date {value!r}")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).isoformat()
+
+def normalize_record(record):
+    """
+    Export row -> messages parameter tuple. Raises ValueError for rows that cannot be imported.
+    Thread is the customer's number: the sender for inbound, the receiver for outbound.
+    """
+    if isinstance(record, json.JSONDecodeError):
+        raise ValueError(f"invalid JSON: {record}")
+    if not isinstance(record, dict):
+        raise ValueError("not an object")
+    fields = {}
+    for key, value in record.items():
+        field = FIELD_ALIASES.get("".join(ch for ch in str(key).lower() if ch.isalnum()))
+        if field and field not in fields:
+            fields[field] = value.strip() if isinstance(value, str) else value
+
+    sid, sender, receiver = fields.get("sid"), fields.get("from"), fields.get("to")
+    if not sid or not isinstance(sid, str):
+        raise ValueError("missing sid")
+    if not sender or not receiver:
+        raise ValueError(f"{sid}: missing from/to")
+    direction = str(fields.get("direction") or "inbound").lower()
+    if direction.startswith("inbound"):
+        msg_type, thread_id = "INBOUND", sender
+    elif direction.startswith("outbound"):
+        msg_type, thread_id = "OUTBOUND", receiver
+    else:
+        raise ValueError(f"{sid}: unknown direction {direction!r}")
+    try:
+        timestamp = parse_timestamp(fields.get("date"))
+    except ValueError as e:
+        raise ValueError(f"{sid}: {e}")
+
+    media = {}
+    if fields.get("media_url"):
+        media["url"] = fields["media_url"]
+    try:
+        num_media = int(fields.get("num_media") or 0)
+    except (TypeError, ValueError):
+        num_media = 0
+    if num_media and not media:
+        media["count"] = num_media
+    return (sid, thread_id, sender, receiver, str(fields.get("body") or ""), json.dumps(media),
+            IMPORTED_STATUS, msg_type, timestamp)
+
+def _existing_ids(conn, ids):
+    """The subset of ids already stored (queried in chunks under SQLite's variable limit)."""
+    found = set()
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        found.update(r[0] for r in conn.execute(f"SELECT id FROM messages WHERE id IN ({', '.join('?' * len(chunk))})", chunk))
+    return found
+
+def import_records(records, source="import", batch_size=None, actor="SYSTEM"):
+    """
+    Validates and inserts records in batches of `batch_size`, one transaction each:
+    executemany, a MESSAGE_IMPORTED audit row per inserted message and a HISTORY_IMPORTED
+    summary row. Existing ids, including repeats within the file, are skipped by the
+    primary key. Returns counts and sample errors.
+    """
+    batch_size = batch_size or IMPORT_BATCH_SIZE
+    stats = {"source": source, "read": 0, "imported": 0, "duplicates": 0, "invalid": 0, "batches": 0, "errors": []}
+    started = time.monotonic()
+    batch = []
+
+    def flush():
+        with transaction() as conn:
+            stored = _existing_ids(conn, [row[0] for row in batch])
+            conn.executemany(INSERT_SQL, batch)
+            audits = []
+            for row in batch:
+                if row[0] not in stored: # New here, and not a repeat within the batch
+                    stored.add(row[0])
+                    audits.append(audit_row("MESSAGE_IMPORTED", {"msg_id": row[0], "thread_id": row[1], "type": row[7],
+                                                                 "source": source}, actor=actor))
+            inserted = len(audits) # Under the write lock, so the pre-read is exact (total_changes counts trigger rows too)
+            audits.append(audit_row("HISTORY_IMPORTED", {
+                "source": source, "batch": stats["batches"] + 1, "rows": len(batch), "imported": inserted,
+                "first_id": batch[0][0], "last_id": batch[-1][0]}, actor=actor))
+            insert_audit(conn, audits)
+        stats["batches"] += 1
+        stats["imported"] += inserted
+        stats["duplicates"] += len(batch) - inserted
+        batch.clear()
+
+    try:
+        for record in records:
+            stats["read"] += 1
+            try:
+                batch.append(normalize_record(record))
+            except ValueError as e:
+                stats["invalid"] += 1
+                if len(stats["errors"]) < IMPORT_MAX_ERRORS_REPORTED:
+                    stats["errors"].append(f"row {stats['read']}: {e}")
+                continue
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+    finally:
+        seconds = time.monotonic() - started
+        stats["seconds"] = round(seconds, 2)
+        stats["rows_per_s"] = round(stats["read"] / seconds) if seconds else None
+        logger.info(f"Import {source}: {stats['imported']} imported, {stats['duplicates']} duplicates, "
+                    f"{stats['invalid']} invalid in {stats['batches']} batches ({stats['seconds']}s)")
+    return stats
+
+def import_stream(binary, fmt, source="import", batch_size=None, actor="SYSTEM"):
+    """Imports a binary file-like object (UTF-8, BOM tolerated)."""
+    if not hasattr(binary, "read1"): # Raw streams (e.g. a WSGI request body)
+        binary = io.BufferedReader(binary)
+    text = io.TextIOWrapper(binary, encoding="utf-8-sig", newline="")
+    try:
+        return import_records(read_records(text, fmt), source=source, batch_size=batch_size, actor=actor)
+    finally:
+        text.detach() # The caller owns the underlying stream
@@ -1,20 +1,120 @@
+import hmac
 import threading
+import uuid
+from datetime import datetime, timezone
 import flask
 from flask import request, jsonify
-from execution.utils.logging import logger
-from execution.utils.db import init_db
-from execution.config import BASE_URL, OWNER_PHONE_NUMBER
+from execution.utils.logging import get_logger
+from execution.utils.db import init_db, transaction, get_connection, database_path
+from execution.utils.leader import LeaderElection, PROCESS_ID
+from execution.utils.audit import audit_writer, record_audit
+from execution.utils.metrics import Gauge, timed, render_metrics, REGISTRY
+from execution.utils.cache import thread_controls, message_sids
+from execution.config import BASE_URL, OWNER_PHONE_NUMBER, ADMIN_API_TOKEN, LEADER_LOCK_PATH, LEADER_RETRY_INTERVAL
+from execution.connectors.twilio import shared_connector
 from execution.jobs.job_01_ingest import ingest_message
-from execution.jobs.job_02_enrich import process_enrichment
-from execution.jobs.job_03_act import run_polling_loop
+from execution.jobs.job_02_enrich import enrichment_pool, enqueue_enrichment, run_enrichment_sweep_loop, classification_cache, openai_guard
+from execution.jobs.job_03_act import run_polling_loop, wake_outbound_sender
+from execution.jobs.job_04_report import build_report, update_rollups, run_report_loop, yesterday
+from execution.jobs.job_05_retention import thread_history, run_retention_loop
+from execution.jobs.job_06_import import import_stream, detect_format, FORMATS
+
+logger = get_logger("run")
 
 app = flask.Flask(__name__)
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({"status": "healthy"}), 200
+    return jsonify({
+        "status": "healthy",
+        "process": PROCESS_ID,
+        "leader": bool(leader and leader.is_leader),
+        "enrichment_queue_depth": enrichment_pool.depth(),
+        "audit_queue_depth": audit_writer.depth(),
+        "classification_cache": classification_cache.stats,
+        "thread_controls": thread_controls.stats,
+        "message_sids": message_sids.snapshot(),
+        "openai": openai_guard.snapshot(),
+        "twilio": shared_connector().latency_summary()
+    }), 200
+
+# Read at scrape time from the trigger-maintained counters (never a scan of messages)
+TRACKED_STATUSES = ("RECEIVED", "DRAFT_PENDING_APPROVAL", "APPROVED_TO_SEND", "SENDING", "NEEDS_REVIEW")
+
+def status_counts():
+    counts = {(status,): 0 for status in TRACKED_STATUSES}
+    for row in get_connection().execute("SELECT status, count FROM message_status_counts"):
+        counts[(row['status'],)] = row['count']
+    return counts
+
+Gauge("milo_messages", "Messages by status.", status_counts, ["status"])
+Gauge("milo_enrichment_queue_depth", "Messages waiting in the enrichment pool.", lambda: enrichment_pool.depth(), multiprocess="sum")
+Gauge("milo_audit_queue_depth", "Audit rows waiting for a group commit.", lambda: audit_writer.depth(), multiprocess="sum")
+Gauge("milo_leader", "Processes running the background loops (1 when healthy).", lambda: int(bool(leader and leader.is_leader)), multiprocess="sum")
+Gauge("milo_openai_circuit_open", "1 while the OpenAI circuit breaker is failing fast.",
+      lambda: int(openai_guard.breaker.state == "OPEN"), multiprocess="max")
+Gauge("milo_classification_cache_lookups", "Classification cache lookups by result.",
+      lambda: {(k,): v for k, v in classification_cache.stats.items()}, ["result"], multiprocess="sum")
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return render_metrics(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+def is_admin(req):
+    """
+    Bearer-token check for admin endpoints. Always False while ADMIN_API_TOKEN is unset.
+    """
+    supplied = req.headers.get("Authorization", "")
+    return bool(ADMIN_API_TOKEN) and hmac.compare_digest(supplied, f"Bearer {ADMIN_API_TOKEN}")
+
+@app.route('/reports/daily', methods=['GET'])
+def daily_report():
+    """
+    JSON report for ?day=YYYY-MM-DD (UTC, default yesterday), from the rollup tables.
+    """
+    if not is_admin(request):
+        return jsonify({"error": "forbidden"}), 403
+    day = request.args.get('day') or yesterday()
+    try:
+        datetime.strptime(day, "%Y-%m-%d")
+    except ValueError:
+        return jsonify({"error": "day must be YYYY-MM-DD"}), 400
+    update_rollups()
+    return jsonify(build_report(day)), 200
+
+@app.route('/threads/<thread_id>/history', methods=['GET'])
+def thread_history_endpoint(thread_id):
+    """
+    Full thread history, including messages moved to the archive files.
+    """
+    if not is_admin(request):
+        return jsonify({"error": "forbidden"}), 403
+    return jsonify({"thread_id": thread_id, "messages": thread_history(thread_id)}), 200
+
+@app.route('/admin/import', methods=['POST'])
+def import_history_endpoint():
+    """
+    Bulk history import. Either a multipart upload (field "file") or the raw file as the
+    body; format from ?format=csv|json|jsonl, else the file name / Content-Type.
+    Streams the upload; responds with the import counts when done.
+    """
+    if not is_admin(request):
+        return jsonify({"error": "forbidden"}), 403
+    upload = request.files.get('file')
+    name = upload.filename if upload else request.args.get('source')
+    content_type = upload.mimetype if upload else request.mimetype
+    fmt = request.args.get('format') or detect_format(name, content_type)
+    if fmt not in FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(FORMATS)}"}), 400
+    stream = upload.stream if upload else request.stream
+    try:
+        stats = import_stream(stream, fmt, source=name or "upload", actor="ADMIN_API")
+    except ValueError as e: # Unreadable file (rows are validated individually)
+        return jsonify({"error": str(e)}), 400
+    return jsonify(stats), 200
 
 @app.route('/twilio/inbound', methods=['POST'])
+@timed("webhook")
 def inbound_webhook():
     """
     Handle inbound messages from Twilio.
@@ -31,10 +131,11 @@ def inbound_webhook():
             return process_owner_command(data)
         
         # 1. Ingest
-        ingest_message(data)
+        msg_id = ingest_message(data)
         
-        # 2. Enrich (Synchronous for MVP simplicity)
-        process_enrichment()
+        # 2. Enrich (Background pool; sweep picks up anything shed under backpressure)
+        if msg_id:
+            enqueue_enrichment(msg_id, sender)
         
         return "", 200
     except Exception as e:
@@ -53,9 +154,27 @@ def owner_webhook():
         logger.error(f"Owner Webhook Error: {e}")
         return "", 500
 
+# Rows the owner may approve, reject or edit. FAILED_SEND stays approvable: re-approving
+# is how the owner resends a draft whose outcome was unknown.
+OWNER_ACTIONABLE = "type = 'DRAFT' AND status IN ('DRAFT_PENDING_APPROVAL', 'FAILED_SEND')"
+
+def resolve_thread(target):
+    """
+    Thread id for a P/U target: a stored message id, an existing thread id, or a thread
+    already paused. None for anything else (a typo must not pause a made-up thread).
+    """
+    conn = get_connection()
+    row = conn.execute("SELECT thread_id FROM messages WHERE id = ? AND thread_id IS NOT NULL", (target,)).fetchone()
+    if row:
+        return row['thread_id']
+    if conn.execute("SELECT 1 FROM messages WHERE thread_id = ? LIMIT 1", (target,)).fetchone() or thread_controls.get(target):
+        return target
+    return None
+
+@timed("owner_command")
 def process_owner_command(data):
     """
-    Core logic for handling A/R/E commands.
+    Core logic for handling A/R/E (drafts) and P/U (pause/resume thread) commands.
     """
     sender = data.get('From')
     body = data.get('Body', '').strip()
@@ -68,7 +187,7 @@ def process_owner_command(data):
     logger.info(f"Owner Command: {body}")
     
     # Parse logic
-    # A <id> | R <id> | E <id> <text>
+    # A <id> | R <id> | E <id> <text> | P <thread> [reason] | U <thread>
     parts = body.split(' ', 2)
     cmd = parts[0].upper()
     
@@ -78,45 +197,91 @@ def process_owner_command(data):
             
     msg_id = parts[1]
     
-    from execution.utils.db import get_db_connection
-    conn = get_db_connection()
-    c = conn.cursor()
+    if cmd in ('P', 'U'):
+        # Thread is the customer number, or any message id in that thread
+        thread_id = resolve_thread(msg_id)
+        if thread_id is None:
+            logger.warning(f"Invalid owner command {cmd}: no message or thread {msg_id}")
+            record_audit("OWNER_COMMAND_INVALID", {"command": cmd, "target": msg_id}, actor="OWNER")
+            return "", 200
+        reason = parts[2] if cmd == 'P' and len(parts) == 3 else None
+        thread_controls.set_paused(thread_id, cmd == 'P', reason, actor="OWNER")
+        return "", 200
     
-    if cmd == 'A':
-        # Approve
-        c.execute("UPDATE messages SET status = 'APPROVED_TO_SEND' WHERE id = ?", (msg_id,))
-        logger.info(f"Owner APPROVED {msg_id}")
-    elif cmd == 'R':
-        # Reject
-        c.execute("UPDATE messages SET status = 'REJECTED' WHERE id = ?", (msg_id,))
-        logger.info(f"Owner REJECTED {msg_id}")
-    elif cmd == 'E' and len(parts) == 3:
-        # Edit
-        new_text = parts[2]
-        c.execute("SELECT draft_version FROM messages WHERE id = ?", (msg_id,))
-        row = c.fetchone()
-        if row:
-            new_ver = row['draft_version'] + 1
-            c.execute("UPDATE messages SET body = ?, status = 'DRAFT_PENDING_APPROVAL', draft_version = ? WHERE id = ?", 
-                        (new_text, new_ver, msg_id))
-            logger.info(f"Owner EDITED {msg_id}")
+    action = None
+    with transaction() as conn:
+        c = conn.cursor()
+        
+        # Only drafts awaiting the owner: never inbound, imported or already sent rows
+        if cmd == 'A':
+            # Approve
+            c.execute(f"UPDATE messages SET status = 'APPROVED_TO_SEND' WHERE id = ? AND {OWNER_ACTIONABLE}", (msg_id,))
+            action = "APPROVE" if c.rowcount else None
+        elif cmd == 'R':
+            # Reject
+            c.execute(f"UPDATE messages SET status = 'REJECTED' WHERE id = ? AND {OWNER_ACTIONABLE}", (msg_id,))
+            action = "REJECT" if c.rowcount else None
+        elif cmd == 'E' and len(parts) == 3:
+            # Edit
+            new_text = parts[2]
+            c.execute(f"UPDATE messages SET body = ?, status = 'DRAFT_PENDING_APPROVAL', draft_version = draft_version + 1 WHERE id = ? AND {OWNER_ACTIONABLE}",
+                      (new_text, msg_id))
+            action = "EDIT" if c.rowcount else None
+
+        if action:
+            logger.info(f"Owner {action} {msg_id}")
+        else:
+            logger.warning(f"Owner command {cmd} ignored: {msg_id} is not a draft awaiting approval")
+
+        # Approval record (also the start point for approval-to-send latency)
+        if action:
+            c.execute("INSERT INTO approvals (id, draft_id, reviewer_phone, action, notes, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+                      (str(uuid.uuid4()), msg_id, sender, action, None, datetime.now(timezone.utc).isoformat()))
     
-    conn.commit()
-    conn.close()
+    # Committed: wake the sender now rather than at the next poll
+    if action == "APPROVE":
+        wake_outbound_sender()
     
     return "", 200
 
-def main():
-    logger.info("MILO System Starting...")
-    
-    # 1. DB Init
+def start_background_loops():
+    """
+    Polling (sender), enrichment sweep, report and retention loops. Leader process only.
+    """
+    threading.Thread(target=run_polling_loop, name="poller", daemon=True).start()
+    threading.Thread(target=run_enrichment_sweep_loop, name="enrich-sweep", daemon=True).start()
+    threading.Thread(target=run_report_loop, name="report", daemon=True).start()
+    threading.Thread(target=run_retention_loop, name="retention", daemon=True).start()
+
+leader = None
+
+def start_worker():
+    """
+    Per-process startup: the dev server, or each gunicorn worker (post_worker_init).
+    Every process serves webhooks and enriches what it ingests (the DB lease keeps each
+    thread on one process, oldest first); the background loops run only in the process
+    holding the leader lock.
+    """
+    global leader
+    # 1. DB Init (migrations are safe to race between workers)
     init_db()
+    thread_controls.load()
+    message_sids.start_warming() # Bloom filter built in the background; the DB dedups meanwhile
+    
+    # 2. Start Audit Writer + Enrichment Workers
+    audit_writer.start()
+    enrichment_pool.start()
+    REGISTRY.start_export() # Multi-process /metrics (METRICS_DIR); no-op otherwise
     
-    # 2. Start Polling Thread
-    t = threading.Thread(target=run_polling_loop, daemon=True)
-    t.start()
+    # 3. Leader Election -> Polling, Sweep, Report, Retention loops
+    leader = LeaderElection(LEADER_LOCK_PATH or f"{database_path()}.leader", start_background_loops, LEADER_RETRY_INTERVAL)
+    leader.start()
+
+def main():
+    logger.info("MILO System Starting...")
+    start_worker()
     
-    # 3. Start Server
+    # 4. Start Server (development; production: gunicorn -c execution/gunicorn.conf.py execution.run:app)
     # MVP: Debug=False, Port=5000
     app.run(host='0.0.0.0', port=5000)
 
@@ -0,0 +1,38 @@
+import gc
+import os
+import unittest
+import execution.config
+import execution.utils.db
+from execution.utils.audit import flush_audit
+from execution.utils.db import init_db
+
+TEST_DB = "execution/test_milo.db"
+
+def remove_db(path):
+    """Deletes a SQLite file and its WAL/shared-memory companions."""
+    for p in (path, path + "-wal", path + "-shm"):
+        if os.path.exists(p):
+            try:
+                os.remove(p)
+            except PermissionError: # Windows: a connection still holds it
+                pass
+
+class DatabaseTestCase(unittest.TestCase):
+    """
+    Each test runs against a fresh TEST_DB, removed afterwards.
+    Set `init_schema = False` to start from a missing file (migration tests).
+    """
+    test_db = TEST_DB
+    init_schema = True
+
+    def setUp(self):
+        remove_db(self.test_db)
+        execution.config.DATABASE_PATH = self.test_db
+        execution.utils.db.DATABASE_PATH = self.test_db
+        if self.init_schema:
+            init_db()
+
+    def tearDown(self):
+        flush_audit() # Pending audit rows belong to this test's DB
+        gc.collect() # Release connections still holding the file
+        remove_db(self.test_db)
@@ -0,0 +1,211 @@
+import unittest
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import unittest.mock
+from execution.utils.db import get_db_connection
+from execution.jobs.job_03_act import run_polling_loop, wake_outbound_sender
+from execution.run import process_owner_command
+from execution.jobs.job_03_act import process_outbound_queue, claim_outbound, SEND_WORKERS
+from execution.utils.ratelimit import TokenBucket
+from execution.tests.dbtest import DatabaseTestCase
+
+OWNER = '+1999999999'
+
+
+class OutboundTest(DatabaseTestCase):
+
+    def insert_draft(self, draft_id, receiver='+15550003', status='DRAFT_PENDING_APPROVAL', thread_id=None):
+        conn = get_db_connection()
+        conn.execute("INSERT INTO messages (id, thread_id, status, type, body, receiver, timestamp) VALUES (?, ?, ?, 'DRAFT', 'Hi', ?, '2025-01-01')",
+                     (draft_id, thread_id or receiver, status, receiver))
+        conn.commit()
+        conn.close()
+
+    def status_of(self, msg_id):
+        conn = get_db_connection()
+        row = conn.execute("SELECT status FROM messages WHERE id = ?", (msg_id,)).fetchone()
+        conn.close()
+        return row['status']
+
+    def test_approval_wakes_sender_and_records_latency(self):
+        self.insert_draft('DRAFT_WAKE')
+        stop = threading.Event()
+
+        with unittest.mock.patch('execution.jobs.job_03_act.twilio.send_sms', return_value="SID_OUT") as mock_send, \
+             unittest.mock.patch('execution.jobs.job_03_act.ENABLE_SENDING', True), \
+             unittest.mock.patch('execution.jobs.job_03_act.POLLING_INTERVAL', 30), \
+             unittest.mock.patch('execution.run.OWNER_PHONE_NUMBER', OWNER):
+            loop = threading.Thread(target=run_polling_loop, args=(stop,), daemon=True)
+            loop.start()
+            time.sleep(0.1) # First (empty) poll, then waits up to 30s
+
+            process_owner_command({"From": OWNER, "Body": "A DRAFT_WAKE"})
+            deadline = time.monotonic() + 2
+            while self.status_of('DRAFT_WAKE') != 'SENT' and time.monotonic() < deadline:
+                time.sleep(0.02)
+
+            stop.set()
+            wake_outbound_sender()
+            loop.join(2)
+
+        self.assertEqual(self.status_of('DRAFT_WAKE'), 'SENT')
+        mock_send.assert_called_once_with('+15550003', 'Hi')
+
+        conn = get_db_connection()
+        approval = conn.execute("SELECT action, reviewer_phone FROM approvals WHERE draft_id='DRAFT_WAKE'").fetchone()
+        self.assertEqual(tuple(approval), ('APPROVE', OWNER))
+        meta = json.loads(conn.execute("SELECT metadata FROM audit_log WHERE event='MESSAGE_SENT'").fetchone()['metadata'])
+        self.assertIsNotNone(meta['approval_to_send_ms'])
+        self.assertLess(meta['approval_to_send_ms'], 2000)
+        conn.close()
+
+    def test_token_bucket_limits_rate(self):
+        bucket = TokenBucket(rate=20, burst=1)
+        start = time.monotonic()
+        for _ in range(6):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.2) # 5 waits of 50ms
+
+    def test_token_bucket_rejects_rates_that_never_refill(self):
+        for rate, burst in ((0, 1), (-1, 1), (1, 0.5)):
+            with self.assertRaisesRegex(ValueError, "rate > 0 and burst >= 1"):
+                TokenBucket(rate, burst)
+        env = dict(os.environ, TWILIO_SEND_RATE="0")
+        result = subprocess.run([sys.executable, "-c", "import execution.config"], env=env, capture_output=True, text=True)
+        self.assertNotEqual(result.returncode, 0) # Fails at startup, not on the first send
+        self.assertIn("TWILIO_SEND_RATE must be > 0", result.stderr)
+
+    def test_parallel_send_keeps_thread_order(self):
+        sent = []
+        lock = threading.Lock()
+
+        def send(to, body):
+            time.sleep(0.05)
+            with lock:
+                sent.append((to, body))
+            return f"SID_{body}"
+
+        conn = get_db_connection()
+        for n in range(3):
+            for t in range(4):
+                conn.execute("INSERT INTO messages (id, thread_id, status, type, body, receiver, timestamp) VALUES (?, ?, 'APPROVED_TO_SEND', 'DRAFT', ?, ?, ?)",
+                             (f"D_{t}_{n}", f"+1555000{t}", f"m{n}", f"+1555000{t}", f"2025-01-01T00:00:0{n}"))
+        conn.commit()
+        conn.close()
+
+        with unittest.mock.patch('execution.jobs.job_03_act.twilio.send_sms', side_effect=send), \
+             unittest.mock.patch('execution.jobs.job_03_act.ENABLE_SENDING', True):
+            start = time.monotonic()
+            self.assertEqual(process_outbound_queue(), 12)
+            elapsed = time.monotonic() - start
+
+        self.assertLess(elapsed, 0.5) # 12 x 50ms = 0.6s sequentially
+        for t in range(4):
+            self.assertEqual([b for to, b in sent if to == f"+1555000{t}"], ["m0", "m1", "m2"])
+
+        conn = get_db_connection()
+        self.assertEqual(conn.execute("SELECT count(*) FROM messages WHERE status='SENT'").fetchone()[0], 12)
+        self.assertEqual(conn.execute("SELECT count(*) FROM audit_log WHERE event='MESSAGE_SENT'").fetchone()[0], 12)
+        conn.close()
+
+    def test_send_workers_outlive_claim_batches(self):
+        for n in range(12):
+            self.insert_draft(f"D_{n:02d}", receiver=f"+1555{n:04d}", status='APPROVED_TO_SEND')
+        workers = set()
+
+        def send(to, body):
+            workers.add(threading.current_thread())
+            return f"SID_{to}"
+
+        with unittest.mock.patch('execution.jobs.job_03_act.twilio.send_sms', side_effect=send), \
+             unittest.mock.patch('execution.jobs.job_03_act.ENABLE_SENDING', True), \
+             unittest.mock.patch('execution.jobs.job_03_act.SEND_CLAIM_BATCH', 3):
+            self.assertEqual(process_outbound_queue(), 12) # Four claim batches
+        self.assertLessEqual(len(workers), SEND_WORKERS) # One executor, not one per batch
+        self.assertTrue(all(w.is_alive() for w in workers))
+
+    def test_claims_are_disjoint_and_concurrent_senders_send_once(self):
+        for n in range(20):
+            self.insert_draft(f"D_{n:02d}", receiver=f"+1555{n:04d}", status='APPROVED_TO_SEND')
+
+        first = claim_outbound(8, owner="A")
+        second = claim_outbound(100, owner="B")
+        self.assertEqual(len(first), 8)
+        self.assertEqual(len(second), 12)
+        self.assertFalse({r['id'] for r in first} & {r['id'] for r in second})
+        self.assertEqual(claim_outbound(100, owner="C"), []) # Leases still live
+
+        conn = get_db_connection()
+        conn.execute("UPDATE messages SET status='APPROVED_TO_SEND', lease_owner=NULL, lease_expires_at=NULL")
+        conn.commit()
+        conn.close()
+
+        sent = []
+        lock = threading.Lock()
+        def send(to, body):
+            time.sleep(0.01)
+            with lock:
+                sent.append(to)
+            return f"SID_{to}"
+
+        with unittest.mock.patch('execution.jobs.job_03_act.twilio.send_sms', side_effect=send), \
+             unittest.mock.patch('execution.jobs.job_03_act.ENABLE_SENDING', True), \
+             unittest.mock.patch('execution.jobs.job_03_act.SEND_CLAIM_BATCH', 5):
+            senders = [threading.Thread(target=process_outbound_queue) for _ in range(3)]
+            for t in senders:
+                t.start()
+            for t in senders:
+                t.join(5)
+
+        self.assertEqual(sorted(sent), sorted(set(sent)))
+        self.assertEqual(len(sent), 20)
+        conn = get_db_connection()
+        self.assertEqual(conn.execute("SELECT count(*) FROM messages WHERE status='SENT' AND lease_owner IS NULL").fetchone()[0], 20)
+        self.assertEqual(conn.execute("SELECT count(*) FROM outbound_sends WHERE status='SENT'").fetchone()[0], 20)
+        conn.close()
+
+    def test_expired_lease_is_reclaimed_without_resending(self):
+        conn = get_db_connection()
+        # Died before sending: safe to send
+        conn.execute("INSERT INTO messages (id, thread_id, status, type, body, receiver, timestamp, lease_owner, lease_expires_at) VALUES ('D_NEW', 'T1', 'SENDING', 'DRAFT', 'Hi', '+15550001', '2025-01-01', 'dead', 1)")
+        # Died after Twilio accepted it, before the status commit
+        conn.execute("INSERT INTO messages (id, thread_id, status, type, body, receiver, timestamp, lease_owner, lease_expires_at) VALUES ('D_DONE', 'T2', 'SENDING', 'DRAFT', 'Hi', '+15550002', '2025-01-01', 'dead', 1)")
+        conn.execute("INSERT INTO outbound_sends (draft_id, lease_owner, status, sid) VALUES ('D_DONE', 'dead', 'SENT', 'SID_OLD')")
+        # Died mid-call: outcome unknown
+        conn.execute("INSERT INTO messages (id, thread_id, status, type, body, receiver, timestamp, lease_owner, lease_expires_at) VALUES ('D_LIMBO', 'T3', 'SENDING', 'DRAFT', 'Hi', '+15550003', '2025-01-01', 'dead', 1)")
+        conn.execute("INSERT INTO outbound_sends (draft_id, lease_owner, status) VALUES ('D_LIMBO', 'dead', 'SENDING')")
+        # Live lease held by another sender: left alone
+        conn.execute("INSERT INTO messages (id, thread_id, status, type, body, receiver, timestamp, lease_owner, lease_expires_at) VALUES ('D_BUSY', 'T4', 'SENDING', 'DRAFT', 'Hi', '+15550004', '2025-01-01', 'other', ?)",
+                     (time.time() + 60,))
+        conn.commit()
+        conn.close()
+
+        with unittest.mock.patch('execution.jobs.job_03_act.twilio.send_sms', return_value="SID_NEW") as mock_send, \
+             unittest.mock.patch('execution.jobs.job_03_act.ENABLE_SENDING', True), \
+             unittest.mock.patch('execution.run.OWNER_PHONE_NUMBER', OWNER):
+            self.assertEqual(process_outbound_queue(), 3)
+            mock_send.assert_called_once_with('+15550001', 'Hi')
+
+            self.assertEqual(self.status_of('D_NEW'), 'SENT')
+            self.assertEqual(self.status_of('D_DONE'), 'SENT')
+            self.assertEqual(self.status_of('D_LIMBO'), 'FAILED_SEND')
+            self.assertEqual(self.status_of('D_BUSY'), 'SENDING')
+
+            conn = get_db_connection()
+            events = {r['event'] for r in conn.execute("SELECT event FROM audit_log")}
+            self.assertTrue({"MESSAGE_SENT", "SEND_DEDUPLICATED", "SEND_OUTCOME_UNKNOWN"} <= events)
+            conn.close()
+
+            # Owner checked with the customer and re-approves: now it goes out
+            process_owner_command({"From": OWNER, "Body": "A D_LIMBO"})
+            process_outbound_queue()
+            self.assertEqual(mock_send.call_count, 2)
+            self.assertEqual(self.status_of('D_LIMBO'), 'SENT')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+import json
+import time
+from datetime import datetime, timezone
+from execution.utils.db import get_db_connection
+from execution.utils.audit import AuditWriter
+from execution.jobs.job_01_ingest import ingest_message
+from execution.tests.dbtest import DatabaseTestCase
+
+
+class AuditWriterTest(DatabaseTestCase):
+
+    def audit_rows(self, event=None):
+        conn = get_db_connection()
+        if event:
+            rows = conn.execute("SELECT * FROM audit_log WHERE event = ?", (event,)).fetchall()
+        else:
+            rows = conn.execute("SELECT * FROM audit_log").fetchall()
+        conn.close()
+        return rows
+
+    def test_events_are_group_committed(self):
+        writer = AuditWriter(batch_size=10, flush_interval=60)
+        for n in range(25):
+            writer.record("TEST_EVENT", {"n": n})
+        deadline = time.monotonic() + 2
+        while writer.stats["written"] < 10 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        # Size trigger fired well before the 60s timer
+        self.assertGreaterEqual(writer.stats["written"], 10)
+        writer.flush()
+        self.assertEqual(len(self.audit_rows("TEST_EVENT")), 25)
+        self.assertEqual(writer.stats["written"], 25)
+        self.assertLess(writer.stats["batches"], 25)
+        writer.stop()
+
+    def test_metadata_is_real_json_and_durable_flush_is_immediate(self):
+        writer = AuditWriter(batch_size=100, flush_interval=60)
+        writer.record("QUEUED", {"body": 'He said "hi"\n'})
+        at = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        writer.record("DURABLE", {"at": at}, actor="OWNER")
+        self.assertEqual(writer.flush(durable=True), 2)
+
+        # Both queued rows committed on this thread
+        self.assertEqual(json.loads(self.audit_rows("QUEUED")[0]['metadata']), {"body": 'He said "hi"\n'})
+        durable = self.audit_rows("DURABLE")[0]
+        self.assertEqual(durable['actor'], "OWNER")
+        self.assertEqual(json.loads(durable['metadata']), {"at": "2025-01-01 00:00:00+00:00"})
+        writer.stop()
+
+    def test_ingest_audit_commits_with_the_message(self):
+        payload = {'MessageSid': 'SM_AUDIT', 'From': '+15550001', 'To': '+15559999', 'Body': 'Hi "there"', 'NumMedia': '1',
+                   'MediaUrl0': 'https://example.com/a"b.jpg'}
+        self.assertEqual(ingest_message(payload), 'SM_AUDIT')
+        self.assertIsNone(ingest_message(payload)) # Retry: no second event
+
+        audits = self.audit_rows("MESSAGE_RECEIVED")
+        self.assertEqual([json.loads(r['metadata']) for r in audits], [{"sid": "SM_AUDIT"}])
+        conn = get_db_connection()
+        media = conn.execute("SELECT media FROM messages WHERE id='SM_AUDIT'").fetchone()['media']
+        conn.close()
+        self.assertEqual(json.loads(media), {"url": 'https://example.com/a"b.jpg'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+import tempfile
+import execution.config
+import execution.jobs.job_02_enrich as job_02
+from execution.connectors.twilio import shared_connector
+from execution.bench.fakes import FakeOpenAI
+from execution.bench.load_test import parse_args, run_benchmark, compare, histogram_quantile
+from execution.bench.startup import measure, parse_importtime
+
+
+class BenchTest(unittest.TestCase):
+
+    def test_small_run_end_to_end(self):
+        transport = shared_connector().transport
+        db_path = execution.config.DATABASE_PATH
+        with tempfile.TemporaryDirectory() as tmp:
+            args = parse_args(["--messages", "40", "--customers", "10", "--openai-ms", "0", "--twilio-ms", "0",
+                               "--duplicate-ratio", "0.1", "--work-dir", tmp])
+            report = run_benchmark(args)
+
+        self.assertTrue(report["outcome"]["drained"])
+        self.assertEqual(report["outcome"]["http_errors"], {"webhook": 0, "owner": 0})
+        self.assertEqual(report["workload"]["unique_inbound"] + report["workload"]["duplicates"], 40)
+        self.assertGreater(report["outcome"]["statuses"].get("SENT", 0), 0)
+        for stage in ("webhook", "ingest", "enrich", "llm_classify", "twilio_send"):
+            self.assertIn(stage, report["stages"])
+        self.assertGreater(report["db"]["end_bytes"], report["db"]["start_bytes"])
+
+        # Global state is restored
+        self.assertIs(shared_connector().transport, transport)
+        self.assertEqual(execution.config.DATABASE_PATH, db_path)
+        self.assertNotIsInstance(job_02.openai_client, FakeOpenAI)
+
+    def test_compare_flags_regressions(self):
+        baseline = {"throughput": {"ingest_per_s": 100}, "webhook_ms": {"p95": 10}, "stages": {"ingest": {"p95_ms": 5}}}
+        current = {"throughput": {"ingest_per_s": 90}, "webhook_ms": {"p95": 20}, "stages": {"ingest": {"p95_ms": 5.5}}}
+        self.assertEqual(compare(current, baseline, 0.25), [("webhook_ms.p95", 10, 20)])
+
+    def test_histogram_quantile(self):
+        self.assertEqual(histogram_quantile(0.5, (1.0, 2.0), [0, 10, 0]), 1.5)
+        self.assertIsNone(histogram_quantile(0.5, (1.0,), [0, 0]))
+
+
+class StartupTest(unittest.TestCase):
+
+    def test_sdks_stay_off_the_import_path(self):
+        report = measure(top=5)
+        self.assertEqual(report["health_status"], 200)
+        self.assertEqual(report["eager_lazy_modules"], [])
+        self.assertIn("execution.run", report["slowest_cumulative_ms"])
+
+    def test_parse_importtime(self):
+        stderr = ("import time: self [us] | cumulative | imported package\n"
+                  "import time:       120 |        120 |     flask.json\n"
+                  "import time:       300 |        420 |   flask\n"
+                  "unrelated line\n")
+        self.assertEqual(parse_importtime(stderr), {"flask.json": (120, 120), "flask": (300, 420)})
+
+
+if __name__ == '__main__':
+    unittest.main()
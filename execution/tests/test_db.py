@@ -0,0 +1,114 @@
+import unittest
+import sqlite3
+import threading
+import unittest.mock
+from execution.utils.db import (
+    init_db, get_db_connection, get_connection, transaction, schema_version, MIGRATIONS, db, DatabaseBusyError
+)
+from execution.tests.dbtest import DatabaseTestCase
+
+
+class DbTest(DatabaseTestCase):
+    init_schema = False # Tests build the schema (or a legacy one) themselves
+
+    def create_legacy_db(self):
+        # Schema as created by the original (pre-migration) init_db
+        conn = sqlite3.connect(self.test_db)
+        conn.execute("CREATE TABLE messages (id TEXT PRIMARY KEY, thread_id TEXT, in_reply_to_id TEXT, sender TEXT, receiver TEXT, body TEXT, media TEXT, status TEXT, type TEXT, timestamp DATETIME, draft_version INTEGER DEFAULT 1)")
+        conn.execute("CREATE TABLE approvals (id TEXT PRIMARY KEY, draft_id TEXT, reviewer_phone TEXT, action TEXT, notes TEXT, timestamp DATETIME, FOREIGN KEY(draft_id) REFERENCES messages(id))")
+        conn.execute("CREATE TABLE audit_log (id TEXT PRIMARY KEY, event TEXT, actor TEXT, metadata TEXT, timestamp DATETIME)")
+        conn.execute("CREATE TABLE thread_controls (thread_id TEXT PRIMARY KEY, paused BOOLEAN, paused_reason TEXT, last_updated DATETIME)")
+        conn.execute("INSERT INTO messages (id, status, type, timestamp) VALUES ('SM_OLD', 'RECEIVED', 'INBOUND', '2025-01-01')")
+        conn.execute("INSERT INTO audit_log (id, event, actor, metadata, timestamp) VALUES ('1', 'OWNER_NOTIFIED_NEEDS_REVIEW', 'SYSTEM', '{\"msg_id\": \"SM_OLD\", \"sid\": \"SID_1\"}', '2025-01-01')")
+        conn.commit()
+        conn.close()
+
+    def test_legacy_db_upgrades_in_place(self):
+        self.create_legacy_db()
+        init_db()
+
+        conn = get_db_connection()
+        self.assertEqual(schema_version(conn), MIGRATIONS[-1][0])
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertEqual(conn.execute("SELECT status FROM messages WHERE id='SM_OLD'").fetchone()['status'], 'RECEIVED')
+
+        plan = " ".join(r[3] for r in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id, thread_id FROM messages WHERE status = 'RECEIVED' AND type = 'INBOUND' ORDER BY timestamp, id"))
+        self.assertIn("COVERING INDEX idx_messages_queue", plan)
+
+        # Legacy audit notifications are backfilled into the ledger
+        ledger = conn.execute("SELECT event_type, status, sid FROM owner_notifications WHERE msg_id='SM_OLD'").fetchone()
+        self.assertEqual(tuple(ledger), ('NEEDS_REVIEW', 'SENT', 'SID_1'))
+        conn.close()
+
+    def test_status_counts_follow_every_write(self):
+        self.create_legacy_db()
+        init_db() # Backfills SM_OLD
+
+        def counts():
+            return {r['status']: r['count'] for r in get_connection().execute("SELECT status, count FROM message_status_counts") if r['count']}
+        self.assertEqual(counts(), {"RECEIVED": 1})
+        with transaction() as conn:
+            conn.execute("INSERT INTO messages (id, status, type) VALUES ('SM_A', 'RECEIVED', 'INBOUND'), ('SM_B', 'RECEIVED', 'INBOUND')")
+            conn.execute("INSERT OR IGNORE INTO messages (id, status, type) VALUES ('SM_A', 'RECEIVED', 'INBOUND')") # Ignored: not counted
+            conn.execute("UPDATE messages SET status = 'NEEDS_REVIEW' WHERE id = 'SM_A'")
+            conn.execute("UPDATE messages SET status = 'RECEIVED', lease_owner = 'x' WHERE id = 'SM_B'") # Unchanged status
+            conn.execute("DELETE FROM messages WHERE id = 'SM_OLD'")
+        self.assertEqual(counts(), {"RECEIVED": 1, "NEEDS_REVIEW": 1})
+
+    def test_migrations_are_idempotent(self):
+        init_db()
+        init_db()
+        conn = get_db_connection()
+        applied = conn.execute("SELECT count(*) FROM schema_migrations").fetchone()[0]
+        self.assertEqual(applied, len(MIGRATIONS))
+        conn.close()
+
+    def test_connections_are_thread_local_and_reused(self):
+        init_db()
+        self.assertIs(get_connection(), get_connection())
+
+        other = []
+        t = threading.Thread(target=lambda: other.append(get_connection()))
+        t.start()
+        t.join()
+        self.assertIsNot(other[0], get_connection())
+
+        # init_db (e.g. a new DB file) invalidates every thread's connection
+        before = get_connection()
+        init_db()
+        self.assertIsNot(before, get_connection())
+
+    def test_transaction_commits_and_rolls_back(self):
+        init_db()
+        with transaction() as conn:
+            conn.execute("INSERT INTO messages (id, status) VALUES ('T1', 'RECEIVED')")
+
+        with self.assertRaises(ValueError):
+            with transaction() as conn:
+                conn.execute("INSERT INTO messages (id, status) VALUES ('T2', 'RECEIVED')")
+                raise ValueError("boom")
+
+        ids = [r['id'] for r in get_db_connection().execute("SELECT id FROM messages")]
+        self.assertEqual(ids, ['T1'])
+
+    def test_transaction_busy_raises_cleanly(self):
+        init_db()
+        locker = sqlite3.connect(self.test_db, isolation_level=None)
+        locker.execute("BEGIN IMMEDIATE")
+        try:
+            with unittest.mock.patch('execution.utils.db.DB_BUSY_TIMEOUT', 0.01), \
+                 unittest.mock.patch('execution.utils.db.DB_LOCK_RETRIES', 1):
+                db.reset()
+                with self.assertRaises(DatabaseBusyError):
+                    with transaction() as conn:
+                        pass
+                self.assertFalse(get_connection().in_transaction)
+        finally:
+            locker.execute("ROLLBACK")
+            locker.close()
+            db.reset()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+import threading
+import unittest.mock
+from execution.utils.db import init_db, get_db_connection
+from execution.utils.cache import BloomFilter, MessageSidCache
+from execution.jobs.job_01_ingest import ingest_message
+from execution.tests.dbtest import DatabaseTestCase
+
+
+class BloomFilterTest(unittest.TestCase):
+
+    def test_no_false_negatives_and_bounded_false_positives(self):
+        bloom = BloomFilter(1000, 0.01)
+        for n in range(1000):
+            bloom.add(f"SM{n}")
+        self.assertTrue(all(f"SM{n}" in bloom for n in range(1000)))
+        false_positives = sum(f"MM{n}" in bloom for n in range(10000))
+        self.assertLess(false_positives, 300) # ~1% expected
+
+
+class IngestDedupTest(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cache = MessageSidCache(100, bloom_capacity=1000)
+        patcher = unittest.mock.patch('execution.jobs.job_01_ingest.message_sids', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def payload(self, sid):
+        return {"MessageSid": sid, "From": "+15550050", "Body": "Hi"}
+
+    def test_warmed_duplicates_skip_sqlite(self):
+        self.assertEqual(ingest_message(self.payload("SM_OLD")), "SM_OLD")
+        self.cache = MessageSidCache(100, bloom_capacity=1000) # Restart: warm from the DB
+        self.cache.load()
+        no_db = unittest.mock.Mock(side_effect=AssertionError("touched SQLite"))
+        with unittest.mock.patch('execution.jobs.job_01_ingest.message_sids', self.cache), \
+             unittest.mock.patch('execution.jobs.job_01_ingest.get_connection', no_db), \
+             unittest.mock.patch('execution.jobs.job_01_ingest.transaction', no_db):
+            for _ in range(50): # Retry storm
+                self.assertIsNone(ingest_message(self.payload("SM_OLD")))
+        self.assertEqual(self.cache.stats["recent_hits"], 50)
+
+    def test_bloom_negative_skips_the_read(self):
+        self.cache.load()
+        with unittest.mock.patch('execution.jobs.job_01_ingest.get_connection',
+                                 side_effect=AssertionError("read for a certainly new sid")):
+            self.assertEqual(ingest_message(self.payload("SM_NEW")), "SM_NEW")
+        self.assertEqual(self.cache.stats["bloom_negatives"], 1)
+        self.assertTrue(self.cache.seen("SM_NEW"))
+
+    def test_warm_up_does_not_block_ingest(self):
+        self.assertEqual(ingest_message(self.payload("SM_OLD")), "SM_OLD")
+        self.cache = MessageSidCache(100, bloom_capacity=1000) # Restart
+        release = threading.Event()
+        load = self.cache.load
+        with unittest.mock.patch('execution.jobs.job_01_ingest.message_sids', self.cache), \
+             unittest.mock.patch.object(self.cache, 'load', side_effect=lambda: (release.wait(5), load())):
+            warming = self.cache.start_warming() # Returns at once
+            self.assertTrue(self.cache.snapshot()["warming"])
+            self.assertIsNone(ingest_message(self.payload("SM_OLD"))) # Caught by the DB check meanwhile
+            self.assertEqual(ingest_message(self.payload("SM_NEW")), "SM_NEW")
+            self.assertEqual(self.cache.stats["bloom_negatives"], 0)
+            release.set()
+            warming.join(5)
+        self.assertFalse(self.cache.snapshot()["warming"])
+        self.assertTrue(self.cache.might_exist("SM_OLD") and self.cache.might_exist("SM_NEW"))
+        self.assertFalse(self.cache.might_exist("SM_OTHER")) # Filter in use
+
+    def test_db_stays_authoritative(self):
+        # Stored by another process: unknown to this cache, caught by the insert
+        conn = get_db_connection()
+        conn.execute("""INSERT INTO messages (id, thread_id, sender, body, media, status, type, timestamp)
+                        VALUES ('SM_OTHER', '+1', '+1', 'Hi', '{}', 'RECEIVED', 'INBOUND', '2025-01-01')""")
+        conn.commit()
+        conn.close()
+        self.assertIsNone(ingest_message(self.payload("SM_OTHER")))
+
+        # DB swapped (init_db): nothing remembered from the old one
+        self.cache.add("SM_STALE")
+        init_db()
+        self.assertFalse(self.cache.seen("SM_STALE"))
+
+    def test_concurrent_retries_store_once(self):
+        barrier = threading.Barrier(8)
+        results = []
+
+        def retry():
+            barrier.wait()
+            results.append(ingest_message(self.payload("SM_RACE")))
+        with self.assertNoLogs("MILO", level="ERROR"):
+            threads = [threading.Thread(target=retry) for _ in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        self.assertEqual((results.count("SM_RACE"), results.count(None)), (1, 7)) # No IntegrityError
+        conn = get_db_connection()
+        self.assertEqual(conn.execute("SELECT count(*) FROM messages WHERE id = 'SM_RACE'").fetchone()[0], 1)
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,320 @@
+import unittest
+import threading
+import time
+import unittest.mock
+from execution.utils.db import get_db_connection
+from execution.utils.workers import KeyedWorkerPool
+from execution.jobs.job_01_ingest import ingest_message
+from execution.jobs.job_02_enrich import (
+    enrich_message, process_enrichment, route_to_review, classification_cache, load_checkpoint, BACKLOG_JOB
+)
+from execution.utils.cache import ClassificationCache, normalize_body
+from execution.utils.preclassify import preclassify
+from execution.tests.dbtest import DatabaseTestCase
+
+
+class EnrichmentPoolTest(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        classification_cache.reset()
+
+    def test_pool_keeps_order_per_key(self):
+        seen = []
+        pool = KeyedWorkerPool("test", seen.append, workers=3, queue_size=50)
+        for i in range(20):
+            pool.submit("+1555", i)
+        pool.join()
+        pool.stop()
+        self.assertEqual(seen, list(range(20)))
+
+    def test_pool_backpressure_and_depth(self):
+        gate = threading.Event()
+        pool = KeyedWorkerPool("test", lambda item: gate.wait(), workers=1, queue_size=2)
+        self.assertTrue(pool.submit("k", 1)) # Picked up by the worker, blocks on gate
+        time.sleep(0.05)
+        self.assertTrue(pool.submit("k", 2))
+        self.assertTrue(pool.submit("k", 3))
+        self.assertEqual(pool.depth(), 2)
+        self.assertFalse(pool.submit("k", 4)) # Saturated
+        gate.set()
+        pool.stop()
+
+    def test_webhook_ingests_and_enqueues_only(self):
+        from execution.run import app
+        with unittest.mock.patch('execution.run.enqueue_enrichment') as mock_enqueue, \
+             unittest.mock.patch('execution.jobs.job_02_enrich.classify_message') as mock_classify:
+            client = app.test_client()
+            resp = client.post('/twilio/inbound', data={"MessageSid": "SM_HOOK", "From": "+15550010", "Body": "Hi"})
+            self.assertEqual(resp.status_code, 200)
+            mock_enqueue.assert_called_once_with("SM_HOOK", "+15550010")
+            mock_classify.assert_not_called()
+
+            # Twilio retry of the same MessageSid is not re-enqueued
+            client.post('/twilio/inbound', data={"MessageSid": "SM_HOOK", "From": "+15550010", "Body": "Hi"})
+            mock_enqueue.assert_called_once()
+
+        conn = get_db_connection()
+        msg = conn.execute("SELECT status FROM messages WHERE id='SM_HOOK'").fetchone()
+        self.assertEqual(msg['status'], 'RECEIVED')
+        conn.close()
+
+    @unittest.mock.patch('execution.jobs.job_02_enrich.twilio_client.send_sms')
+    def test_enrich_message_single(self, mock_send_sms):
+        ingest_message({"MessageSid": "SM_MEDIA", "From": "+15550011", "Body": "", "NumMedia": "1", "MediaUrl0": "http://x"})
+        enrich_message("SM_MEDIA")
+
+        conn = get_db_connection()
+        msg = conn.execute("SELECT status FROM messages WHERE id='SM_MEDIA'").fetchone()
+        self.assertEqual(msg['status'], 'NEEDS_REVIEW')
+        conn.close()
+
+    @unittest.mock.patch('execution.jobs.job_02_enrich.twilio_client.send_sms')
+    @unittest.mock.patch('execution.jobs.job_02_enrich.openai_client')
+    def test_backlog_parallel_across_threads_ordered_within(self, mock_openai, mock_send_sms):
+        calls = []
+        lock = threading.Lock()
+
+        def classify(body):
+            time.sleep(0.05)
+            with lock:
+                calls.append(body)
+            return {"language": "EN", "language_confidence": 0.9, "risk": "LOW", "risk_reason": "NONE", "intent": "KNOWN"}
+
+        def draft(body, lang, intent):
+            time.sleep(0.05)
+            return f"Re: {body}"
+
+        for t in range(4):
+            for n in range(3):
+                ingest_message({"MessageSid": f"SM_{t}_{n}", "From": f"+1555000{t}", "Body": f"t{t} m{n}"})
+
+        with unittest.mock.patch('execution.jobs.job_02_enrich.classify_message', side_effect=classify), \
+             unittest.mock.patch('execution.jobs.job_02_enrich.generate_draft', side_effect=draft):
+            start = time.monotonic()
+            process_enrichment(concurrency=4)
+            elapsed = time.monotonic() - start
+
+        # 12 messages x 2 calls x 50ms = 1.2s sequentially
+        self.assertLess(elapsed, 0.9)
+        for t in range(4):
+            self.assertEqual([b for b in calls if b.startswith(f"t{t} ")], [f"t{t} m0", f"t{t} m1", f"t{t} m2"])
+
+        conn = get_db_connection()
+        drafts = conn.execute("SELECT count(*) FROM messages WHERE type='DRAFT'").fetchone()[0]
+        self.assertEqual(drafts, 12)
+        conn.close()
+
+    @unittest.mock.patch('execution.jobs.job_02_enrich.twilio_client.send_sms')
+    def test_backlog_workers_outlive_sweeps(self, mock_send_sms):
+        workers = set()
+
+        def tracked(msg_id, reason):
+            workers.add(threading.current_thread())
+            return route_to_review(msg_id, reason)
+        with unittest.mock.patch('execution.jobs.job_02_enrich.route_to_review', side_effect=tracked):
+            for sweep in range(3):
+                for t in range(4):
+                    ingest_message({"MessageSid": f"SM_W{sweep}_{t}", "From": f"+1555002{t}", "Body": "", "NumMedia": "1", "MediaUrl0": "http://x"})
+                process_enrichment(concurrency=2)
+        self.assertLessEqual(len(workers), 2) # One executor, not one per sweep
+        self.assertTrue(all(w.is_alive() for w in workers))
+
+    def test_backlog_pages_in_order_and_resumes_from_checkpoint(self):
+        conn = get_db_connection()
+        for n in (4, 1, 6, 0, 3, 5, 2): # Inserted out of order; timestamp order is 0..6
+            conn.execute("""INSERT INTO messages (id, thread_id, sender, body, media, status, type, timestamp)
+                            VALUES (?, ?, ?, 'Hi', '{}', 'RECEIVED', 'INBOUND', ?)""",
+                         (f"SM_B{n}", f"+1555004{n % 2}", f"+1555004{n % 2}", f"2025-01-01T00:00:0{n}"))
+        conn.commit()
+        seen = []
+
+        def enrich(conn, row):
+            if row['id'] == "SM_B4" and "SM_B4" not in seen:
+                seen.append(row['id'])
+                raise RuntimeError("crash") # Dies mid-way through the second page
+            seen.append(row['id'])
+            conn.execute("UPDATE messages SET status = 'NEEDS_REVIEW' WHERE id = ?", (row['id'],))
+
+        with unittest.mock.patch('execution.jobs.job_02_enrich.enrich_row', side_effect=enrich):
+            with self.assertRaises(RuntimeError):
+                process_enrichment(concurrency=1, page_size=3)
+            self.assertEqual(seen, ["SM_B0", "SM_B1", "SM_B2", "SM_B3", "SM_B4"])
+            self.assertEqual(load_checkpoint(conn, BACKLOG_JOB), (("2025-01-01T00:00:02", "SM_B2"), 3))
+
+            process_enrichment(concurrency=1, page_size=3) # Resumes after SM_B2
+        self.assertEqual(seen[5:], ["SM_B4", "SM_B5", "SM_B6"])
+        self.assertEqual(load_checkpoint(conn, BACKLOG_JOB), (None, 0)) # Pass complete
+        left = conn.execute("SELECT count(*) FROM messages WHERE status = 'RECEIVED'").fetchone()[0]
+        self.assertEqual(left, 0)
+        conn.close()
+
+    def test_sweep_skips_a_thread_the_pool_is_enriching(self):
+        conn = get_db_connection()
+        for msg_id, thread, ts in (("SM_O0", "+15550050", "00"), ("SM_O1", "+15550050", "01"), ("SM_P0", "+15550051", "02")):
+            conn.execute("""INSERT INTO messages (id, thread_id, sender, body, media, status, type, timestamp)
+                            VALUES (?, ?, ?, 'Hi', '{}', 'RECEIVED', 'INBOUND', ?)""", (msg_id, thread, thread, f"2025-01-01T00:00:{ts}"))
+        conn.commit()
+        conn.close()
+        lock = threading.Lock()
+        active, overlaps, seen = {}, [], []
+        busy, release = threading.Event(), threading.Event()
+
+        def enrich(conn, row):
+            thread = row['thread_id']
+            with lock:
+                active[thread] = active.get(thread, 0) + 1
+                if active[thread] > 1:
+                    overlaps.append(row['id'])
+                seen.append(row['id'])
+            conn.execute("UPDATE messages SET status = 'NEEDS_REVIEW' WHERE id = ?", (row['id'],))
+            if row['id'] == "SM_O0": # Routed, still notifying the owner
+                busy.set()
+                release.wait(5)
+            with lock:
+                active[thread] -= 1
+
+        with unittest.mock.patch('execution.jobs.job_02_enrich.enrich_row', side_effect=enrich):
+            pool_worker = threading.Thread(target=enrich_message, args=("SM_O0",))
+            pool_worker.start()
+            busy.wait(5)
+            process_enrichment(concurrency=4) # Sweep runs meanwhile: SM_O1's thread is busy
+            self.assertEqual(seen, ["SM_O0", "SM_P0"])
+            release.set()
+            pool_worker.join(5)
+
+        self.assertEqual(overlaps, [])
+        self.assertEqual(seen, ["SM_O0", "SM_P0", "SM_O1"]) # The pool worker carried on with its thread
+
+    @unittest.mock.patch('execution.jobs.job_02_enrich.twilio_client.send_sms')
+    @unittest.mock.patch('execution.jobs.job_02_enrich.openai_client')
+    def test_single_call_pipeline(self, mock_openai, mock_send_sms):
+        combined = unittest.mock.Mock()
+        choice = unittest.mock.Mock()
+        choice.message.content = '{"language": "EN", "language_confidence": 0.95, "risk": "LOW", "risk_reason": "NONE", "intent": "KNOWN", "draft": "Happy to help. What day works for you?"}'
+        combined.choices = [choice]
+        mock_openai.chat.completions.create.side_effect = [combined]
+
+        with unittest.mock.patch('execution.jobs.job_02_enrich.ENRICH_PIPELINE', 'single_call'):
+            ingest_message({"MessageSid": "SM_ONE", "From": "+15550020", "Body": "Can I book Tuesday?"})
+            enrich_message("SM_ONE")
+
+        self.assertEqual(mock_openai.chat.completions.create.call_count, 1)
+        self.assertEqual(mock_openai.chat.completions.create.call_args.kwargs["temperature"], 0.3) # Drafts as in two_call
+        conn = get_db_connection()
+        draft = conn.execute("SELECT body FROM messages WHERE in_reply_to_id='SM_ONE'").fetchone()
+        self.assertEqual(draft['body'], "Happy to help. What day works for you?")
+        conn.close()
+
+    @unittest.mock.patch('execution.jobs.job_02_enrich.twilio_client.send_sms')
+    @unittest.mock.patch('execution.jobs.job_02_enrich.openai_client')
+    def test_single_call_guardrail_discards_draft(self, mock_openai, mock_send_sms):
+        combined = unittest.mock.Mock()
+        choice = unittest.mock.Mock()
+        choice.message.content = '{"language": "EN", "language_confidence": 0.95, "risk": "HIGH", "risk_reason": "LEGAL", "intent": "KNOWN", "draft": "Sure thing!"}'
+        combined.choices = [choice]
+        mock_openai.chat.completions.create.side_effect = [combined]
+
+        with unittest.mock.patch('execution.jobs.job_02_enrich.ENRICH_PIPELINE', 'single_call'):
+            ingest_message({"MessageSid": "SM_ONE_RISK", "From": "+15550021", "Body": "Can you do Friday?"})
+            enrich_message("SM_ONE_RISK")
+
+        conn = get_db_connection()
+        msg = conn.execute("SELECT status FROM messages WHERE id='SM_ONE_RISK'").fetchone()
+        self.assertEqual(msg['status'], 'NEEDS_REVIEW')
+        drafts = conn.execute("SELECT count(*) FROM messages WHERE in_reply_to_id='SM_ONE_RISK'").fetchone()[0]
+        self.assertEqual(drafts, 0)
+        conn.close()
+
+    def test_normalize_body(self):
+        self.assertEqual(normalize_body("  What are your HOURS?? "), "what are your hours")
+        self.assertEqual(normalize_body("¿Cuánto cuesta?"), "cuánto cuesta")
+
+    @unittest.mock.patch('execution.jobs.job_02_enrich.twilio_client.send_sms')
+    @unittest.mock.patch('execution.jobs.job_02_enrich.openai_client')
+    def test_classification_cache_skips_repeat_calls(self, mock_openai, mock_send_sms):
+        mock_classify = unittest.mock.Mock()
+        choice = unittest.mock.Mock()
+        choice.message.content = '{"language": "EN", "language_confidence": 0.9, "risk": "LOW", "risk_reason": "NONE", "intent": "UNKNOWN"}'
+        mock_classify.choices = [choice]
+        mock_openai.chat.completions.create.side_effect = [mock_classify]
+
+        ingest_message({"MessageSid": "SM_C1", "From": "+15550030", "Body": "What are your hours?"})
+        ingest_message({"MessageSid": "SM_C2", "From": "+15550031", "Body": "what are your  hours"})
+        enrich_message("SM_C1")
+        enrich_message("SM_C2") # Memory hit, no second OpenAI call
+
+        classification_cache.reset()
+        ingest_message({"MessageSid": "SM_C3", "From": "+15550032", "Body": "WHAT ARE YOUR HOURS"})
+        enrich_message("SM_C3") # Persistent tier hit after a "restart"
+
+        self.assertEqual(mock_openai.chat.completions.create.call_count, 1)
+        self.assertEqual(classification_cache.stats["memory_hits"], 0)
+        self.assertEqual(classification_cache.stats["db_hits"], 1)
+
+    def test_classification_cache_prompt_version(self):
+        old = ClassificationCache("prompt v1", max_entries=10, db_max_entries=10, ttl=60, max_chars=160)
+        old.put("yes", {"intent": "KNOWN"})
+        self.assertEqual(old.get("Yes!"), {"intent": "KNOWN"})
+
+        new = ClassificationCache("prompt v2", max_entries=10, db_max_entries=10, ttl=60, max_chars=160)
+        self.assertIsNone(new.get("yes"))
+
+        expired = ClassificationCache("prompt v1", max_entries=10, db_max_entries=10, ttl=-1, max_chars=160)
+        self.assertIsNone(expired.get("yes"))
+
+    def test_classification_cache_is_scoped_to_the_pipeline(self):
+        classification_cache.put("what are your hours", {"intent": "KNOWN"})
+        self.assertEqual(classification_cache.get("What are your hours?"), {"intent": "KNOWN"})
+        with unittest.mock.patch('execution.jobs.job_02_enrich.ENRICH_PIPELINE', "single_call"):
+            self.assertIsNone(classification_cache.get("What are your hours?")) # CLASSIFY_AND_DRAFT_PROMPT
+            classification_cache.put("what are your hours", {"intent": "UNKNOWN"})
+            self.assertEqual(classification_cache.get("What are your hours?"), {"intent": "UNKNOWN"})
+            with unittest.mock.patch('execution.jobs.job_02_enrich.CLASSIFY_AND_DRAFT_PROMPT', "edited prompt"):
+                self.assertIsNone(classification_cache.get("What are your hours?"))
+        self.assertEqual(classification_cache.get("What are your hours?"), {"intent": "KNOWN"})
+
+    def test_preclassify_routes_certain_cases(self):
+        self.assertIn("Opt-out", preclassify("STOP"))
+        self.assertIn("LEGAL", preclassify("I'm calling my lawyer"))
+        self.assertIn("CYRILLIC", preclassify("Здравствуйте, сколько стоит?"))
+        self.assertIn("FR", preclassify("Bonjour, je voudrais savoir combien pour une coupe"))
+        self.assertIsNone(preclassify("What are your hours?"))
+        self.assertIsNone(preclassify("Hola, ¿cuánto cuesta el corte?"))
+
+    def test_preclassify_risk_needs_an_unambiguous_phrase(self):
+        self.assertIn("LEGAL", preclassify("Fix this or I will sue you"))
+        self.assertIn("PAYMENT", preclassify("I'm going to dispute the charge with my bank"))
+        self.assertIn("PAYMENT", preclassify("Filing a chargeback today"))
+        self.assertIn("REFUND", preclassify("I want my money back"))
+        self.assertIn("MEDICAL", preclassify("My dad collapsed, please call 911"))
+        self.assertIn("MEDICAL", preclassify("Es una emergencia médica"))
+        for body in ("Is this urgent? I'd like to book for Friday",
+                     "Can I speak with the manager about a quote?",
+                     "Do you accept credit card payments?",
+                     "My lawyer recommended you, do you have openings?",
+                     "Do you clean sued leather jackets?",
+                     "Do you offer refunds if I cancel?",
+                     "Do you do emergency plumber call-outs on weekends?",
+                     "Who should we list in case of emergency on the booking?",
+                     "¿Atienden emergencias el domingo?"):
+            self.assertIsNone(preclassify(body), body)
+
+    @unittest.mock.patch('execution.jobs.job_02_enrich.twilio_client.send_sms')
+    @unittest.mock.patch('execution.jobs.job_02_enrich.openai_client')
+    def test_preclassify_skips_openai(self, mock_openai, mock_send_sms):
+        with unittest.mock.patch('execution.jobs.job_02_enrich.OWNER_PHONE_NUMBER', '+1999999999'):
+            ingest_message({"MessageSid": "SM_PRE", "From": "+15550040", "Body": "Stop"})
+            enrich_message("SM_PRE")
+
+        mock_openai.chat.completions.create.assert_not_called()
+        args, _ = mock_send_sms.call_args
+        self.assertIn("Opt-out keyword (STOP)", args[1])
+        conn = get_db_connection()
+        msg = conn.execute("SELECT status FROM messages WHERE id='SM_PRE'").fetchone()
+        self.assertEqual(msg['status'], 'NEEDS_REVIEW')
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+import io
+import json
+import unittest.mock
+from execution.utils.db import get_db_connection
+from execution.jobs.job_01_ingest import ingest_message
+from execution.jobs.job_02_enrich import process_enrichment
+from execution.jobs.job_06_import import import_stream, read_records, normalize_record
+from execution.run import app, process_owner_command
+from execution.tests.dbtest import DatabaseTestCase
+
+TOKEN = "test-admin-token"
+OWNER = "+15559990001"
+
+CSV_EXPORT = "\ufeff" + """From,To,Body,Status,SentDate,ApiVersion,NumSegments,ErrorCode,AccountSid,Sid,Direction,Price,PriceUnit
++15550060,+15559990000,"Hi, are you open Monday?",received,2025-03-01T10:00:00Z,2010-04-01,1,,AC1,SM_H1,inbound,,USD
++15559990000,+15550060,Yes! 9 to 5.,delivered,2025-03-01T10:05:00Z,2010-04-01,1,,AC1,SM_H2,outbound-api,,USD
++15550061,+15559990000,No date,received,,2010-04-01,1,,AC1,SM_H3,inbound,,USD
++15550060,+15559990000,"Hi, are you open Monday?",received,2025-03-01T10:00:00Z,2010-04-01,1,,AC1,SM_H1,inbound,,USD
++15550062,+15559990000,Already here,received,2025-03-02T08:00:00Z,2010-04-01,1,,AC1,SM_LIVE,inbound,,USD
+"""
+
+
+class ImportTest(DatabaseTestCase):
+
+    def rows(self):
+        conn = get_db_connection()
+        rows = {r['id']: dict(r) for r in conn.execute("SELECT id, thread_id, type, status, timestamp FROM messages")}
+        conn.close()
+        return rows
+
+    def test_csv_export_is_validated_deduped_and_never_enriched(self):
+        ingest_message({"MessageSid": "SM_LIVE", "From": "+15550062", "Body": "Already here"})
+        stats = import_stream(io.BytesIO(CSV_EXPORT.encode()), "csv", source="export.csv", batch_size=2)
+
+        self.assertEqual((stats["read"], stats["imported"], stats["duplicates"], stats["invalid"]), (5, 2, 2, 1))
+        self.assertIn("SM_H3: missing date", stats["errors"][0])
+        rows = self.rows()
+        self.assertEqual(rows["SM_H1"]["status"], "IMPORTED")
+        self.assertEqual((rows["SM_H2"]["type"], rows["SM_H2"]["thread_id"]), ("OUTBOUND", "+15550060"))
+        self.assertEqual(rows["SM_H1"]["timestamp"], "2025-03-01T10:00:00+00:00")
+        self.assertEqual(rows["SM_LIVE"]["status"], "RECEIVED") # Live row untouched
+
+        conn = get_db_connection()
+        audits = conn.execute("SELECT metadata FROM audit_log WHERE event = 'HISTORY_IMPORTED'").fetchall()
+        imported = [json.loads(r['metadata'])['msg_id'] for r in conn.execute("SELECT metadata FROM audit_log WHERE event = 'MESSAGE_IMPORTED'")]
+        conn.close()
+        self.assertEqual(len(audits), stats["batches"])
+        self.assertEqual(sorted(imported), ["SM_H1", "SM_H2"]) # One per stored row, none for duplicates
+
+        with unittest.mock.patch('execution.jobs.job_02_enrich.enrich_row') as enrich:
+            process_enrichment(concurrency=1)
+        self.assertEqual([c.args[1]['id'] for c in enrich.call_args_list], ["SM_LIVE"])
+
+    def test_owner_commands_cannot_touch_imported_rows(self):
+        import_stream(io.BytesIO(CSV_EXPORT.encode()), "csv", source="export.csv")
+        with unittest.mock.patch('execution.run.OWNER_PHONE_NUMBER', OWNER), \
+             unittest.mock.patch('execution.run.wake_outbound_sender') as wake:
+            for body in ("A SM_H2", "R SM_H2", "E SM_H2 Sure, see you then", "A SM_H1"):
+                process_owner_command({"From": OWNER, "Body": body})
+        wake.assert_not_called()
+
+        rows = self.rows()
+        self.assertEqual((rows["SM_H1"]["status"], rows["SM_H2"]["status"]), ("IMPORTED", "IMPORTED"))
+        conn = get_db_connection()
+        self.assertEqual(conn.execute("SELECT body FROM messages WHERE id = 'SM_H2'").fetchone()['body'], "Yes! 9 to 5.")
+        self.assertEqual(conn.execute("SELECT count(*) FROM approvals").fetchone()[0], 0)
+        conn.close()
+
+    def test_json_streams_across_chunk_boundaries(self):
+        items = [{"sid": f"MM{n}", "from": "+15550070", "to": "+15559990000", "body": "x" * n,
+                  "date_sent": "Thu, 30 Jul 2015 20:12:31 +0000", "direction": "inbound", "num_media": "1"} for n in range(30)]
+        page = json.dumps({"first_page_uri": "/2010-04-01/Messages.json", "messages": items, "page": 0})
+        self.assertEqual(list(read_records(io.StringIO(page), "json", chunk_size=7)), items)
+        self.assertEqual(list(read_records(io.StringIO(json.dumps(items)), "json", chunk_size=5)), items)
+        self.assertEqual(normalize_record(items[0])[5], '{"count": 1}')
+
+        records = list(read_records(io.StringIO('{"sid": "SM_J1"}\nnot json\n'), "jsonl"))
+        with self.assertRaises(ValueError):
+            normalize_record(records[1])
+
+    def test_admin_endpoint(self):
+        client = app.test_client()
+        self.assertEqual(client.post("/admin/import?format=csv", data=CSV_EXPORT).status_code, 403)
+
+        headers = {"Authorization": f"Bearer {TOKEN}"}
+        with unittest.mock.patch('execution.run.ADMIN_API_TOKEN', TOKEN):
+            response = client.post("/admin/import?format=csv", data=CSV_EXPORT.encode(), headers=headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json()["imported"], 3)
+
+            lines = "\n".join(json.dumps({"sid": f"SM_U{n}", "from": "+15550080", "to": "+15559990000",
+                                          "date_created": "2025-04-01 12:00:00", "body": "hi"}) for n in range(3))
+            upload = {"file": (io.BytesIO(lines.encode()), "history.jsonl")}
+            response = client.post("/admin/import", data=upload, headers=headers, content_type="multipart/form-data")
+            self.assertEqual(response.get_json()["imported"], 3)
+            self.assertEqual(client.post("/admin/import", data="x", headers=headers).status_code, 400)
+        self.assertEqual(self.rows()["SM_U0"]["status"], "IMPORTED")
+
+
+if __name__ == '__main__':
+    unittest.main()
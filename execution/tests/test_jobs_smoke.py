@@ -2,40 +2,24 @@ import unittest
 import os
 import sqlite3
 import unittest.mock
+from datetime import datetime, timezone
 from execution.jobs.job_01_ingest import ingest_message
-from execution.jobs.job_02_enrich import process_enrichment
+from execution.jobs.job_02_enrich import process_enrichment, send_owner_sms
 from execution.jobs.job_03_act import process_outbound_queue
-from execution.utils.db import init_db, get_db_connection
-import execution.config
+from execution.utils.db import get_db_connection, get_connection
+import execution.jobs.job_02_enrich
 import execution.connectors.twilio
 from execution.connectors.twilio import TwilioConnector
+from execution.tests.dbtest import DatabaseTestCase
 
 # Mock Config
 os.environ["DATABASE_PATH"] = ":memory:" 
 
-class MvpSmokeTest(unittest.TestCase):
+class MvpSmokeTest(DatabaseTestCase):
     
     def setUp(self):
-        self.test_db = "execution/test_milo.db"
-        if os.path.exists(self.test_db):
-            os.remove(self.test_db)
-        
-        # Monkey patch
-        execution.config.DATABASE_PATH = self.test_db
-        execution.utils.db.DATABASE_PATH = self.test_db
-        # We need to ensure logic uses this path
-        
-        init_db()
-
-    def tearDown(self):
-        # Ensure file is released
-        import gc
-        gc.collect()
-        if os.path.exists(self.test_db):
-            try:
-                os.remove(self.test_db)
-            except PermissionError:
-                pass 
+        super().setUp()
+        execution.jobs.job_02_enrich.classification_cache.reset()
 
     def test_ingest_deduplication(self):
         payload = {"MessageSid": "SM123", "From": "+15550001", "Body": "Test"}
@@ -115,10 +99,10 @@ class MvpSmokeTest(unittest.TestCase):
     @unittest.mock.patch('execution.jobs.job_02_enrich.twilio_client.send_sms')
     def test_enrich_notifications_idempotency(self, mock_send_sms):
          with unittest.mock.patch('execution.jobs.job_02_enrich.OWNER_PHONE_NUMBER', '+1999999999'):
-             # Setup Audit Log with existing notification
+             # Setup Notification Ledger with existing notification
              conn = get_db_connection()
              conn.execute("INSERT INTO messages (id, status, type, sender, body, thread_id, media) VALUES ('SM_DUP', 'RECEIVED', 'INBOUND', '+1555', 'Bad', '+1555', '{}')")
-             conn.execute("INSERT INTO audit_log (id, event, actor, metadata, timestamp) VALUES ('1', 'OWNER_NOTIFIED_NEEDS_REVIEW', 'SYSTEM', '{\"msg_id\": \"SM_DUP\"}', '2025-01-01')")
+             conn.execute("INSERT INTO owner_notifications (msg_id, event_type, status, sid, created_at) VALUES ('SM_DUP', 'NEEDS_REVIEW', 'SENT', 'SID_OLD', '2025-01-01')")
              conn.commit()
              conn.close()
              
@@ -127,6 +111,22 @@ class MvpSmokeTest(unittest.TestCase):
              
              mock_send_sms.assert_not_called()
 
+    @unittest.mock.patch('execution.jobs.job_02_enrich.twilio_client.send_sms', return_value="SID_RETRY")
+    def test_stale_pending_notification_is_reclaimed(self, mock_send_sms):
+        conn = get_db_connection()
+        # A sender crashed after reserving: one reservation long ago, one just now (still in flight)
+        conn.execute("INSERT INTO owner_notifications (msg_id, event_type, status, created_at) VALUES ('SM_STALE', 'NEEDS_REVIEW', 'PENDING', '2025-01-01T00:00:00+00:00')")
+        conn.execute("INSERT INTO owner_notifications (msg_id, event_type, status, created_at) VALUES ('SM_BUSY', 'NEEDS_REVIEW', 'PENDING', ?)",
+                     (datetime.now(timezone.utc).isoformat(),))
+        conn.commit()
+        conn.close()
+
+        with unittest.mock.patch('execution.jobs.job_02_enrich.OWNER_PHONE_NUMBER', '+1999999999'):
+            self.assertEqual(send_owner_sms(get_connection(), "NEEDS_REVIEW", "SM_STALE", "Review SM_STALE"), "SID_RETRY")
+            self.assertIsNone(send_owner_sms(get_connection(), "NEEDS_REVIEW", "SM_BUSY", "Review SM_BUSY"))
+            self.assertIsNone(send_owner_sms(get_connection(), "NEEDS_REVIEW", "SM_STALE", "Review SM_STALE")) # Now SENT
+        mock_send_sms.assert_called_once_with('+1999999999', "Review SM_STALE")
+
 
     @unittest.mock.patch('execution.jobs.job_02_enrich.openai_client')
     def test_enrich_low_confidence(self, mock_openai):
@@ -0,0 +1,109 @@
+import unittest
+import os
+import threading
+import time
+import tempfile
+import unittest.mock
+import execution.jobs.job_02_enrich
+from execution.utils.db import get_db_connection
+from execution.utils.leader import LeaderElection, PROCESS_ID
+from execution.jobs.job_02_enrich import enrich_message
+from execution.jobs.job_03_act import run_polling_loop
+from execution.tests.dbtest import DatabaseTestCase
+
+
+class LeaderElectionTest(unittest.TestCase):
+
+    def test_single_leader_and_takeover(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "milo.db.leader")
+            elected = []
+            first = LeaderElection(path, lambda: elected.append("first"), retry_interval=0.05)
+            second = LeaderElection(path, lambda: elected.append("second"), retry_interval=0.05)
+            first.start()
+            second.start()
+            time.sleep(0.2)
+            self.assertEqual(elected, ["first"])
+            self.assertFalse(second.is_leader)
+            with open(path) as f:
+                self.assertEqual(f.read().strip(), PROCESS_ID)
+
+            first.resign() # Leader gone: the standby takes over
+            time.sleep(0.3)
+            self.assertEqual(elected, ["first", "second"])
+            self.assertTrue(second.is_leader)
+            second.resign()
+
+
+class CrossProcessTest(DatabaseTestCase):
+
+    def insert(self, msg_id, lease_owner=None, lease_expires_at=None, thread_id='+15550030', timestamp='2025-01-01'):
+        conn = get_db_connection()
+        conn.execute("""INSERT INTO messages (id, thread_id, sender, body, media, status, type, timestamp, lease_owner, lease_expires_at)
+                        VALUES (?, ?, ?, '', '{}', 'RECEIVED', 'INBOUND', ?, ?, ?)""",
+                     (msg_id, thread_id, thread_id, timestamp, lease_owner, lease_expires_at))
+        conn.commit()
+        conn.close()
+
+    def status(self, msg_id):
+        conn = get_db_connection()
+        row = conn.execute("SELECT status, lease_owner FROM messages WHERE id = ?", (msg_id,)).fetchone()
+        conn.close()
+        return row['status'], row['lease_owner']
+
+    @unittest.mock.patch('execution.jobs.job_02_enrich.twilio_client.send_sms')
+    def test_enrichment_respects_other_process_lease(self, mock_send_sms):
+        self.insert("SM_LEASED", "other-host:1:abc", time.time() + 60)
+        enrich_message("SM_LEASED")
+        self.assertEqual(self.status("SM_LEASED"), ('RECEIVED', "other-host:1:abc"))
+
+        self.insert("SM_EXPIRED", "dead-host:1:abc", time.time() - 1, thread_id='+15550033')
+        enrich_message("SM_EXPIRED") # Empty body -> NEEDS_REVIEW once taken over
+        self.assertEqual(self.status("SM_EXPIRED"), ('NEEDS_REVIEW', None))
+
+    @unittest.mock.patch('execution.jobs.job_02_enrich.twilio_client.send_sms')
+    def test_thread_is_enriched_by_one_process_oldest_first(self, mock_send_sms):
+        # Another worker is drafting the customer's first message
+        self.insert("SM_T1", "other-host:1:abc", time.time() + 60, thread_id='+15550031', timestamp='2025-01-01T10:00:00')
+        self.insert("SM_T2", thread_id='+15550031', timestamp='2025-01-01T10:00:05')
+        enrich_message("SM_T2")
+        self.assertEqual(self.status("SM_T2"), ('RECEIVED', None))
+
+        # Older message still waiting (shed by its worker): the newer one waits too
+        self.insert("SM_U1", thread_id='+15550032', timestamp='2025-01-01T10:00:00')
+        self.insert("SM_U2", thread_id='+15550032', timestamp='2025-01-01T10:00:05')
+        enrich_message("SM_U2")
+        self.assertEqual(self.status("SM_U2"), ('RECEIVED', None))
+
+        # Whoever gets the oldest one drains the thread in order
+        with unittest.mock.patch('execution.jobs.job_02_enrich.enrich_row', wraps=execution.jobs.job_02_enrich.enrich_row) as enrich:
+            enrich_message("SM_U1")
+        self.assertEqual([c.args[1]['id'] for c in enrich.call_args_list], ["SM_U1", "SM_U2"])
+        self.assertEqual(self.status("SM_U2"), ('NEEDS_REVIEW', None))
+
+    def test_sender_sees_approvals_from_other_processes(self):
+        stop = threading.Event()
+        with unittest.mock.patch('execution.jobs.job_03_act.twilio.send_sms', return_value="SID_X"), \
+             unittest.mock.patch('execution.jobs.job_03_act.ENABLE_SENDING', True), \
+             unittest.mock.patch('execution.jobs.job_03_act.POLLING_INTERVAL', 30), \
+             unittest.mock.patch('execution.jobs.job_03_act.WAKE_CHECK_INTERVAL', 0.05):
+            loop = threading.Thread(target=run_polling_loop, args=(stop,), daemon=True)
+            loop.start()
+            time.sleep(0.2)
+
+            # Approval committed on another connection, without the in-process wake signal
+            conn = get_db_connection()
+            conn.execute("INSERT INTO messages (id, thread_id, status, type, body, receiver, timestamp) VALUES ('D_X', '+1', 'APPROVED_TO_SEND', 'DRAFT', 'Hi', '+1', '2025-01-01')")
+            conn.commit()
+            conn.close()
+
+            deadline = time.monotonic() + 3
+            while self.status("D_X")[0] != 'SENT' and time.monotonic() < deadline:
+                time.sleep(0.05)
+            stop.set()
+            loop.join(2)
+        self.assertEqual(self.status("D_X")[0], 'SENT')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+import gzip
+import json
+import logging
+import os
+import tempfile
+from logging.handlers import QueueHandler
+from execution.utils.logging import logger, get_logger, apply_levels, build_file_handler, process_log_path, JsonFormatter
+
+
+class LoggingTest(unittest.TestCase):
+
+    def test_logger_only_enqueues(self):
+        self.assertTrue(all(isinstance(h, QueueHandler) for h in logger.handlers))
+        self.assertTrue(logger.listener._thread.is_alive())
+
+    def test_json_formatter(self):
+        record = logging.LogRecord("MILO.jobs.x", logging.WARNING, __file__, 1, "sent %s", ("é",), None)
+        record.props = {"msg_id": "SM1"}
+        line = json.loads(JsonFormatter().format(record))
+        self.assertEqual(line["message"], "sent é")
+        self.assertEqual((line["level"], line["logger"], line["msg_id"]), ("WARNING", "MILO.jobs.x", "SM1"))
+        self.assertRegex(line["timestamp"], r"^\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d{3}$")
+
+    def test_per_module_levels(self):
+        enrich = get_logger("execution.jobs.job_02_enrich")
+        self.assertEqual(enrich.name, "MILO.jobs.job_02_enrich")
+        self.assertFalse(enrich.isEnabledFor(logging.DEBUG))
+        try:
+            apply_levels("jobs.job_02_enrich=debug, utils=WARNING")
+            self.assertTrue(enrich.isEnabledFor(logging.DEBUG))
+            self.assertFalse(get_logger("execution.utils.db").isEnabledFor(logging.INFO))
+            self.assertTrue(get_logger("execution.jobs.job_03_act").isEnabledFor(logging.INFO))
+        finally:
+            logging.getLogger("MILO.jobs.job_02_enrich").setLevel(logging.NOTSET)
+            logging.getLogger("MILO.utils").setLevel(logging.NOTSET)
+
+    def test_size_rotation_compresses_backups(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "execution.log")
+            handler = build_file_handler(path, rotation="size", max_bytes=200, backup_count=2)
+            for n in range(20):
+                handler.emit(logging.LogRecord("MILO", logging.INFO, __file__, 1, f"line {n}", None, None))
+            handler.close()
+
+            files = sorted(os.listdir(tmp))
+            self.assertEqual(files, ["execution.log", "execution.log.1.gz", "execution.log.2.gz"])
+            with gzip.open(os.path.join(tmp, "execution.log.1.gz"), "rt") as f:
+                self.assertIn('"message":"line', f.read())
+
+    def test_per_process_log_file(self):
+        self.assertEqual(process_log_path(".tmp/execution.log", per_process=False), ".tmp/execution.log")
+        self.assertEqual(process_log_path(".tmp/execution.log", per_process=True), f".tmp/execution.{os.getpid()}.log")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+import json
+import os
+import tempfile
+import unittest.mock
+import fcntl
+from execution.utils.metrics import Counter, Histogram, Gauge, Registry, timed, STAGE_SECONDS, STAGE_ERRORS
+from execution.run import app
+from execution.tests.dbtest import DatabaseTestCase
+
+
+class MetricsTest(DatabaseTestCase):
+
+    def test_prometheus_text_format(self):
+        registry = Registry()
+        requests = Counter("t_requests_total", "Requests.", ["outcome"], registry=registry)
+        latency = Histogram("t_latency_seconds", "Latency.", ["stage"], buckets=(0.1, 1), registry=registry)
+        requests.inc("ok")
+        requests.inc("ok")
+        requests.inc('bad "quote"')
+        latency.observe(0.05, "a")
+        latency.observe(0.5, "a")
+        latency.observe(5, "a")
+
+        text = registry.render()
+        self.assertIn("# TYPE t_requests_total counter", text)
+        self.assertIn('t_requests_total{outcome="ok"} 2', text)
+        self.assertIn('t_requests_total{outcome="bad \\"quote\\""} 1', text)
+        self.assertIn('t_latency_seconds_bucket{stage="a",le="0.1"} 1', text)
+        self.assertIn('t_latency_seconds_bucket{stage="a",le="1"} 2', text)
+        self.assertIn('t_latency_seconds_bucket{stage="a",le="+Inf"} 3', text)
+        self.assertIn('t_latency_seconds_count{stage="a"} 3', text)
+
+    def test_multiprocess_merge(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            registry = Registry(tmp)
+            requests = Counter("t_requests_total", "Requests.", ["outcome"], registry=registry)
+            latency = Histogram("t_latency_seconds", "Latency.", buckets=(0.1, 1), registry=registry)
+            Gauge("t_leader", "Leader.", lambda: 0, registry=registry, multiprocess="sum")
+            Gauge("t_rows", "From the DB.", lambda: 7, registry=registry)
+            requests.inc("ok")
+            latency.observe(0.05)
+            registry.export()
+            self.assertTrue(os.path.exists(os.path.join(tmp, f"{registry.instance()}.json")))
+
+            other = {"t_requests_total": [[["ok"], 2]], "t_latency_seconds": [[[], [0, 1, 0], 0.5, 1]],
+                     "t_leader": [[[], 1]], "t_rows": []}
+            # A live worker (holds its lock), and an exited leader whose pid the live one reused
+            for name in ("4242-b", "4242-a"):
+                with open(os.path.join(tmp, f"{name}.json"), "w") as f:
+                    json.dump(other, f)
+                open(os.path.join(tmp, f"{name}.lock"), "a").close()
+            with open(os.path.join(tmp, "4242-b.lock"), "a") as held:
+                fcntl.flock(held.fileno(), fcntl.LOCK_EX)
+                text = registry.render()
+                self.assertFalse(os.path.exists(os.path.join(tmp, "4242-a.json"))) # Folded into retired.json
+                self.assertEqual(text, registry.render()) # Nothing folded twice
+
+            self.assertIn('t_requests_total{outcome="ok"} 5', text) # Exited workers' counts are kept
+            self.assertIn('t_latency_seconds_bucket{le="1"} 3', text)
+            self.assertIn('t_latency_seconds_count 3', text)
+            self.assertIn("t_leader 1", text) # Live processes only
+            self.assertIn("t_rows 7", text)
+
+            # Now the other worker exits too: its counts move to retired, its gauge goes
+            text = registry.render()
+            self.assertIn('t_requests_total{outcome="ok"} 5', text)
+            self.assertIn("t_leader 0", text)
+            self.assertEqual(sorted(os.listdir(tmp)), sorted([f"{registry.instance()}.json", f"{registry.instance()}.lock",
+                                                              "retired.json", "retired.lock"]))
+
+    def test_timed_records_errors(self):
+        before = STAGE_SECONDS.labels("test_stage").count
+        with self.assertRaises(ValueError):
+            with timed("test_stage"):
+                raise ValueError("boom")
+        self.assertEqual(STAGE_SECONDS.labels("test_stage").count, before + 1)
+        self.assertEqual(STAGE_ERRORS.labels("test_stage").value, 1)
+
+    def test_metrics_endpoint(self):
+        client = app.test_client()
+        with unittest.mock.patch('execution.run.enqueue_enrichment'):
+            client.post('/twilio/inbound', data={'MessageSid': 'SM_METRICS', 'From': '+15550001', 'To': '+15559999', 'Body': 'Hi'})
+
+        response = client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith("text/plain"))
+        text = response.get_data(as_text=True)
+        self.assertIn('milo_messages{status="RECEIVED"} 1', text)
+        self.assertIn('milo_messages{status="APPROVED_TO_SEND"} 0', text)
+        self.assertIn('milo_stage_duration_seconds_count{stage="ingest"}', text)
+        self.assertIn('milo_stage_duration_seconds_count{stage="webhook"}', text)
+        self.assertIn("milo_enrichment_queue_depth 0", text)
+
+
+if __name__ == '__main__':
+    unittest.main()
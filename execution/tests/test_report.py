@@ -0,0 +1,112 @@
+import unittest
+import os
+import json
+import unittest.mock
+from datetime import datetime, timezone
+from execution.utils.db import get_db_connection
+from execution.jobs.job_01_ingest import ingest_message
+from execution.jobs.job_02_enrich import process_enrichment
+from execution.jobs.job_04_report import update_rollups, build_report, format_digest, generate_daily_report, reason_category
+from execution.run import app
+from execution.tests.dbtest import DatabaseTestCase
+
+DAY = '2025-03-01'
+
+
+class ReportTest(DatabaseTestCase):
+
+    def audit(self, event, metadata, timestamp=f"{DAY}T10:00:00+00:00"):
+        conn = get_db_connection()
+        conn.execute("INSERT INTO audit_log (id, event, actor, metadata, timestamp) VALUES (?, ?, 'SYSTEM', ?, ?)",
+                     (os.urandom(8).hex(), event, json.dumps(metadata), timestamp))
+        conn.commit()
+        conn.close()
+
+    def seed(self):
+        for i in range(3):
+            self.audit("MESSAGE_RECEIVED", {"msg_id": f"IN{i}"})
+        self.audit("MESSAGE_ROUTED", {"msg_id": "IN0", "status": "NEEDS_REVIEW", "reason": "Risk HIGH (LEGAL: 'lawyer')"})
+        self.audit("MESSAGE_ROUTED", {"msg_id": "IN1", "status": "NEEDS_REVIEW", "reason": "Low Confidence (0.6)"})
+        self.audit("MESSAGE_ROUTED", {"msg_id": "IN2", "status": "DRAFT_PENDING_APPROVAL", "draft_id": "D1"})
+        self.audit("MESSAGE_SENT", {"approval_to_send_ms": 400})
+        self.audit("SEND_FAILED", {"error": "HTTP 400 error: Unable to create record: code 21211"})
+        self.audit("LLM_USAGE", {"msg_id": "IN2", "calls": 1, "prompt_tokens": 900, "completion_tokens": 200})
+        self.audit("MESSAGE_RECEIVED", {"msg_id": "OTHER"}, timestamp="2025-03-02T00:00:01+00:00")
+
+        conn = get_db_connection()
+        conn.execute("INSERT INTO messages (id, in_reply_to_id, status, type, timestamp) VALUES ('D1', 'IN2', 'SENT', 'DRAFT', ?)", (DAY,))
+        conn.execute("INSERT INTO owner_notifications (msg_id, event_type, status, sent_at) VALUES ('IN2', 'DRAFT_READY', 'SENT', ?)",
+                     (f"{DAY}T10:00:00+00:00",))
+        conn.execute("INSERT INTO approvals (id, draft_id, action, timestamp) VALUES ('AP1', 'D1', 'APPROVE', ?)",
+                     (f"{DAY}T10:05:00+00:00",))
+        conn.commit()
+        conn.close()
+
+    def test_rollups_are_incremental(self):
+        self.seed()
+        self.assertEqual(update_rollups(batch_size=4), 11) # Several batches, one per transaction
+        self.assertEqual(update_rollups(), 0) # Nothing new: nothing re-read
+
+        self.audit("MESSAGE_RECEIVED", {"msg_id": "IN3"})
+        self.assertEqual(update_rollups(), 1)
+
+        report = build_report(DAY)
+        self.assertEqual(report["volume"]["received"], 4)
+        self.assertEqual(report["volume"]["needs_review"], 2)
+        self.assertEqual(report["volume"]["send_failed"], 1)
+        self.assertEqual(report["review_reasons"], {"Low Confidence": 1, "Risk HIGH (LEGAL)": 1})
+        self.assertEqual(report["send_failures"], {"Twilio 21211": 1})
+        self.assertEqual(report["approvals"]["by_action"], {"APPROVE": 1})
+        self.assertEqual(report["approvals"]["avg_turnaround_s"], 300.0)
+        self.assertEqual(report["approval_to_send_ms"], {"avg": 400, "max": 400.0})
+        self.assertEqual(report["llm"]["prompt_tokens"], 900)
+        self.assertEqual(build_report("2025-03-02")["volume"]["received"], 1)
+
+    def test_volume_counts_routing_not_owner_sms(self):
+        classified = {"language": "EN", "language_confidence": 0.95, "risk": "LOW", "intent": "KNOWN"}
+        with unittest.mock.patch('execution.jobs.job_02_enrich.OWNER_PHONE_NUMBER', None), \
+             unittest.mock.patch('execution.jobs.job_02_enrich.openai_client', unittest.mock.Mock()), \
+             unittest.mock.patch('execution.jobs.job_02_enrich.classify_with_cache', return_value=(classified, "Sure, 9 to 5.")):
+            ingest_message({"MessageSid": "SM_R1", "From": "+15550091", "Body": "Open Monday?"})
+            ingest_message({"MessageSid": "SM_R2", "From": "+15550092", "Body": "", "NumMedia": "1", "MediaUrl0": "https://example.com/a.jpg"})
+            process_enrichment(concurrency=1)
+        update_rollups()
+
+        report = build_report(datetime.now(timezone.utc).strftime("%Y-%m-%d"))
+        self.assertEqual((report["volume"]["drafts"], report["volume"]["needs_review"]), (1, 1)) # No owner SMS sent
+        self.assertEqual(report["review_reasons"], {"Media/Empty Body context": 1})
+
+    def test_reason_category(self):
+        self.assertEqual(reason_category("Message too long (1200 chars)"), "Message too long")
+        self.assertEqual(reason_category("Opt-out keyword (STOP)"), "Opt-out keyword (STOP)")
+        self.assertEqual(reason_category("Enrichment Exception: boom"), "Enrichment Exception")
+
+    def test_digest_sent_once_per_day(self):
+        self.seed()
+        with unittest.mock.patch('execution.jobs.job_02_enrich.OWNER_PHONE_NUMBER', '+1999'), \
+             unittest.mock.patch('execution.jobs.job_02_enrich.twilio_client.send_sms', return_value="SM_DIGEST") as mock_send:
+            report = generate_daily_report(DAY)
+            generate_daily_report(DAY)
+
+        self.assertEqual(mock_send.call_count, 1)
+        body = mock_send.call_args[0][1]
+        self.assertEqual(body, format_digest(report))
+        self.assertIn("In 3 | Drafts 1 | Review 2 | Sent 1 | Failed 1", body)
+        self.assertIn("Owner: A1 R0 E0, avg 5m", body)
+        self.assertLessEqual(len(body), 320)
+
+    def test_endpoint_requires_admin_token(self):
+        self.seed()
+        client = app.test_client()
+        with unittest.mock.patch('execution.run.ADMIN_API_TOKEN', None):
+            self.assertEqual(client.get(f'/reports/daily?day={DAY}').status_code, 403)
+        with unittest.mock.patch('execution.run.ADMIN_API_TOKEN', 'secret'):
+            self.assertEqual(client.get(f'/reports/daily?day={DAY}', headers={"Authorization": "Bearer nope"}).status_code, 403)
+            response = client.get(f'/reports/daily?day={DAY}', headers={"Authorization": "Bearer secret"})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json()["volume"]["received"], 3)
+            self.assertEqual(client.get('/reports/daily?day=yesterday', headers={"Authorization": "Bearer secret"}).status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import unittest
+import time
+import unittest.mock
+import execution.jobs.job_02_enrich as job_02
+from execution.utils.db import get_db_connection, DatabaseBusyError
+from execution.utils.resilience import Resilient, CircuitBreaker, AdaptiveTimeout, CircuitOpenError
+from execution.jobs.job_01_ingest import ingest_message
+from execution.jobs.job_02_enrich import enrich_message, classification_cache
+from execution.tests.dbtest import DatabaseTestCase
+
+OWNER = '+1999999999'
+
+
+def guard(threshold=3, reset=60, retries=2, hedge=False, on_open=None):
+    return Resilient("test", CircuitBreaker(threshold, reset, on_open=on_open),
+                     lambda: AdaptiveTimeout(1.0, 0.05, 1.0), retries=retries, hedge=hedge, sleep=lambda s: None)
+
+
+class ResilienceTest(unittest.TestCase):
+
+    def test_retries_transient_errors_only(self):
+        g = guard()
+        calls = []
+
+        def flaky(timeout):
+            calls.append(timeout)
+            if len(calls) < 3:
+                raise TimeoutError("slow")
+            return "ok"
+        self.assertEqual(g.call("op", flaky), "ok")
+        self.assertEqual(len(calls), 3)
+
+        bad = unittest.mock.Mock(side_effect=ValueError("bad request"))
+        with self.assertRaises(ValueError):
+            g.call("op", bad)
+        self.assertEqual(bad.call_count, 1)
+
+    def test_breaker_opens_fails_fast_and_recovers(self):
+        opened = []
+        g = guard(threshold=2, reset=0.05, retries=0, on_open=lambda: opened.append(1))
+        down = unittest.mock.Mock(side_effect=ConnectionError("down"))
+        for _ in range(2):
+            with self.assertRaises(ConnectionError):
+                g.call("op", down)
+        with self.assertRaises(CircuitOpenError):
+            g.call("op", down)
+        self.assertEqual(down.call_count, 2)
+        self.assertEqual(opened, [1])
+
+        time.sleep(0.06) # Half-open: one probe
+        self.assertEqual(g.call("op", lambda timeout: "back"), "back")
+        self.assertEqual(g.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_adaptive_timeout_follows_latency(self):
+        policy = AdaptiveTimeout(10.0, 0.5, 10.0, percentile=0.99, multiplier=2.0, min_samples=20)
+        self.assertEqual(policy.current(), 10.0)
+        for _ in range(50):
+            policy.observe(0.4)
+        self.assertAlmostEqual(policy.current(), 0.8)
+        for _ in range(200):
+            policy.observe(0.01)
+        self.assertEqual(policy.current(), 0.5) # Clamped
+
+    def test_hedged_request_wins(self):
+        g = guard(hedge=True)
+        for _ in range(20):
+            g.policy("op").observe(0.01)
+        calls = []
+
+        def slow_first(timeout):
+            calls.append(1)
+            if len(calls) == 1:
+                time.sleep(0.5)
+                return "slow"
+            return "fast"
+        started = time.monotonic()
+        self.assertEqual(g.call("op", slow_first), "fast")
+        self.assertLess(time.monotonic() - started, 0.4)
+
+    def test_openai_client_does_not_retry_on_its_own(self):
+        import execution.connectors.openai as connector
+        with unittest.mock.patch.object(connector, 'OPENAI_API_KEY', 'sk-test'), \
+             unittest.mock.patch.object(connector, '_client', None):
+            client = connector.get_openai_client()
+            self.assertEqual(client.max_retries, 0)
+
+
+class DeferralTest(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        classification_cache.reset()
+
+    @unittest.mock.patch('execution.jobs.job_02_enrich.OWNER_PHONE_NUMBER', OWNER)
+    @unittest.mock.patch('execution.jobs.job_02_enrich.twilio_client.send_sms', return_value="SM_ALERT")
+    @unittest.mock.patch('execution.jobs.job_02_enrich.openai_client')
+    def test_outage_defers_without_alert_storm(self, mock_openai, mock_send_sms):
+        mock_openai.chat.completions.create.side_effect = TimeoutError("OpenAI timed out")
+        outage_guard = guard(threshold=3, retries=1, on_open=job_02._alert_openai_down)
+
+        with unittest.mock.patch('execution.jobs.job_02_enrich.openai_guard', outage_guard):
+            for i in range(5):
+                ingest_message({"MessageSid": f"SM_OUT{i}", "From": f"+1555002{i}", "Body": "Do you open on Sunday?"})
+                enrich_message(f"SM_OUT{i}")
+
+        conn = get_db_connection()
+        statuses = {r['status'] for r in conn.execute("SELECT status FROM messages WHERE type = 'INBOUND'")}
+        conn.close()
+        self.assertEqual(statuses, {'RECEIVED'}) # Held for the sweep, not NEEDS_REVIEW
+        self.assertEqual(mock_openai.chat.completions.create.call_count, 3) # Then the circuit failed fast
+        self.assertEqual(mock_send_sms.call_count, 1) # One outage alert, no per-message alerts
+        self.assertIn("OpenAI", mock_send_sms.call_args[0][1])
+
+    @unittest.mock.patch('execution.jobs.job_02_enrich.OWNER_PHONE_NUMBER', OWNER)
+    @unittest.mock.patch('execution.jobs.job_02_enrich.twilio_client.send_sms', return_value="SM_ALERT")
+    @unittest.mock.patch('execution.jobs.job_02_enrich.openai_client')
+    def test_busy_database_defers_the_draft(self, mock_openai, mock_send_sms):
+        choice = unittest.mock.Mock()
+        choice.message.content = '{"language": "EN", "language_confidence": 0.9, "risk": "LOW", "risk_reason": "NONE", "intent": "KNOWN"}'
+        mock_openai.chat.completions.create.return_value.choices = [choice]
+        ingest_message({"MessageSid": "SM_BUSY", "From": "+15550029", "Body": "Can I book Friday?"})
+
+        busy = unittest.mock.Mock(side_effect=DatabaseBusyError("Database busy after 5 attempts"))
+        with unittest.mock.patch('execution.jobs.job_02_enrich.transaction', busy):
+            enrich_message("SM_BUSY")
+
+        conn = get_db_connection()
+        self.assertEqual(conn.execute("SELECT status FROM messages WHERE id = 'SM_BUSY'").fetchone()['status'], 'RECEIVED')
+        self.assertEqual(conn.execute("SELECT count(*) FROM messages WHERE type = 'DRAFT'").fetchone()[0], 0)
+        conn.close()
+        mock_send_sms.assert_not_called() # No owner page for a lock timeout
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import unittest
+import os
+import sqlite3
+import tempfile
+import unittest.mock
+from datetime import datetime, timezone
+from execution.utils.db import get_db_connection
+from execution.jobs.job_05_retention import run_retention, thread_history
+from execution.run import app
+from execution.tests.dbtest import DatabaseTestCase
+
+NOW = datetime(2025, 6, 1, tzinfo=timezone.utc)
+THREAD = '+15550007'
+
+
+class RetentionTest(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.archive = tempfile.TemporaryDirectory()
+        self.patches = [unittest.mock.patch('execution.jobs.job_05_retention.ARCHIVE_DIR', self.archive.name),
+                        unittest.mock.patch('execution.jobs.job_05_retention.RETENTION_PAUSE', 0)]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.archive.cleanup()
+        super().tearDown()
+
+    def seed(self):
+        conn = get_db_connection()
+        conn.executemany("INSERT INTO messages (id, thread_id, in_reply_to_id, body, status, type, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?)", [
+            ('IN_OLD', THREAD, None, 'Hi', 'DRAFT_PENDING_APPROVAL', 'INBOUND', '2024-01-05T10:00:00+00:00'),
+            ('D_OLD', THREAD, 'IN_OLD', 'Hello!', 'SENT', 'DRAFT', '2024-01-05T10:10:00+00:00'),
+            ('IN_NEW', THREAD, None, 'Again', 'DRAFT_PENDING_APPROVAL', 'INBOUND', '2025-05-30T10:00:00+00:00'),
+            ('D_NEW', THREAD, 'IN_NEW', 'Sure', 'SENT', 'DRAFT', '2025-05-30T10:10:00+00:00'),
+            ('IN_REVIEW', '+15550008', None, 'Lawyer', 'NEEDS_REVIEW', 'INBOUND', '2024-01-06T10:00:00+00:00'),
+        ])
+        conn.execute("INSERT INTO approvals (id, draft_id, action, timestamp) VALUES ('AP_OLD', 'D_OLD', 'APPROVE', '2024-01-05T10:05:00+00:00')")
+        conn.execute("INSERT INTO approvals (id, draft_id, action, timestamp) VALUES ('AP_NEW', 'D_NEW', 'APPROVE', '2025-05-30T10:05:00+00:00')")
+        conn.execute("INSERT INTO outbound_sends (draft_id, status, sid) VALUES ('D_OLD', 'SENT', 'SM1')")
+        conn.execute("INSERT INTO owner_notifications (msg_id, event_type, status) VALUES ('IN_OLD', 'DRAFT_READY', 'SENT')")
+        for i in range(20):
+            conn.execute("INSERT INTO audit_log (id, event, metadata, timestamp) VALUES (?, 'MESSAGE_RECEIVED', '{}', ?)",
+                         (f"A{i}", f"2024-01-01T00:00:{i:02d}+00:00"))
+        conn.commit()
+        conn.close()
+
+    def ids(self, table, key="id"):
+        conn = get_db_connection()
+        found = {r[0] for r in conn.execute(f"SELECT {key} FROM {table}")}
+        conn.close()
+        return found
+
+    def test_archives_old_terminal_threads(self):
+        self.seed()
+        totals = run_retention(now=NOW)
+
+        self.assertEqual(self.ids("messages"), {'IN_NEW', 'D_NEW', 'IN_REVIEW'})
+        self.assertEqual(self.ids("approvals"), {'AP_NEW'})
+        self.assertEqual(self.ids("outbound_sends", "draft_id"), set())
+        self.assertEqual(self.ids("owner_notifications", "msg_id"), set())
+        self.assertEqual(totals["messages"], 2)
+
+        archive = sqlite3.connect(os.path.join(self.archive.name, "milo-archive-2024.db"))
+        self.assertEqual({r[0] for r in archive.execute("SELECT id FROM messages")}, {'IN_OLD', 'D_OLD'})
+        self.assertEqual(archive.execute("SELECT sid FROM outbound_sends").fetchone()[0], 'SM1')
+        # Added-by-migration columns exist in the archive too
+        self.assertIn('lease_owner', {r[1] for r in archive.execute("PRAGMA table_info(messages)")})
+        archive.close()
+
+        # Thread history spans the live DB and the archive
+        history = thread_history(THREAD)
+        self.assertEqual([m['id'] for m in history], ['IN_OLD', 'D_OLD', 'IN_NEW', 'D_NEW'])
+        self.assertEqual(history[0]['source'], 'milo-archive-2024.db')
+
+        # Idempotent
+        self.assertEqual(run_retention(now=NOW).get("messages", 0), 0)
+
+    def test_archives_old_imported_history(self):
+        self.seed()
+        conn = get_db_connection()
+        conn.executemany("INSERT INTO messages (id, thread_id, body, status, type, timestamp) VALUES (?, ?, ?, 'IMPORTED', ?, ?)", [
+            ('H_IN', THREAD, 'Open Monday?', 'INBOUND', '2023-03-01T10:00:00+00:00'),
+            ('H_OUT', THREAD, 'Yes! 9 to 5.', 'OUTBOUND', '2023-03-01T10:05:00+00:00'),
+            ('H_RECENT', THREAD, 'Thanks', 'INBOUND', '2025-05-31T10:00:00+00:00'),
+        ])
+        conn.commit()
+        conn.close()
+        run_retention(now=NOW)
+
+        self.assertEqual(self.ids("messages"), {'IN_NEW', 'D_NEW', 'IN_REVIEW', 'H_RECENT'})
+        archive = sqlite3.connect(os.path.join(self.archive.name, "milo-archive-2023.db"))
+        self.assertEqual({r[0] for r in archive.execute("SELECT id FROM messages")}, {'H_IN', 'H_OUT'})
+        archive.close()
+        self.assertEqual([m['id'] for m in thread_history(THREAD)][:2], ['H_IN', 'H_OUT'])
+
+    def test_audit_rows_respect_report_and_rowid(self):
+        self.seed()
+        run_retention(now=NOW)
+        # Everything was folded into the report first; only the newest row stays so its rowid is not reused
+        self.assertEqual(self.ids("audit_log"), {'A19'})
+        conn = get_db_connection()
+        self.assertEqual(conn.execute("SELECT count FROM report_daily WHERE day = '2024-01-01' AND key = 'MESSAGE_RECEIVED'").fetchone()[0], 20)
+        self.assertEqual(conn.execute("PRAGMA auto_vacuum").fetchone()[0], 2)
+        self.assertEqual(conn.execute("PRAGMA freelist_count").fetchone()[0], 0)
+        conn.close()
+
+    def test_history_endpoint_requires_admin(self):
+        self.seed()
+        client = app.test_client()
+        with unittest.mock.patch('execution.run.ADMIN_API_TOKEN', 'secret'):
+            self.assertEqual(client.get(f'/threads/{THREAD}/history').status_code, 403)
+            response = client.get(f'/threads/{THREAD}/history', headers={"Authorization": "Bearer secret"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.get_json()["messages"]), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+import unittest.mock
+from execution.utils.cache import thread_controls
+from execution.utils.db import get_db_connection
+from execution.utils.audit import flush_audit
+from execution.run import process_owner_command
+from execution.tests.dbtest import DatabaseTestCase
+
+OWNER = '+1999999999'
+THREAD = '+15550009'
+
+
+class ThreadControlTest(DatabaseTestCase):
+
+    def command(self, body):
+        with unittest.mock.patch('execution.run.OWNER_PHONE_NUMBER', OWNER):
+            return process_owner_command({'From': OWNER, 'Body': body})
+
+    def test_owner_pause_and_resume(self):
+        conn = get_db_connection()
+        conn.execute("INSERT INTO messages (id, thread_id, status, type, timestamp) VALUES ('SM_P', ?, 'NEEDS_REVIEW', 'INBOUND', '2025-01-01')", (THREAD,))
+        conn.commit()
+        conn.close()
+
+        self.command("P SM_P customer asked for a call") # By message id
+        self.assertEqual(thread_controls.get(THREAD)["reason"], "customer asked for a call")
+
+        conn = get_db_connection()
+        row = conn.execute("SELECT paused, paused_reason FROM thread_controls WHERE thread_id = ?", (THREAD,)).fetchone()
+        self.assertTrue(row['paused'])
+        self.assertEqual(conn.execute("SELECT actor FROM audit_log WHERE event = 'THREAD_PAUSED'").fetchone()['actor'], 'OWNER')
+        conn.close()
+
+        self.command(f"U {THREAD}") # By thread number
+        self.assertFalse(thread_controls.is_paused(THREAD))
+
+    def test_pause_needs_a_known_message_or_thread(self):
+        self.command("P SM_TYPO wrong id")
+        self.command("P +15550099")
+        self.assertEqual(thread_controls.get("SM_TYPO"), None)
+        self.assertEqual(thread_controls.get("+15550099"), None)
+        flush_audit()
+        conn = get_db_connection()
+        self.assertEqual(conn.execute("SELECT count(*) FROM thread_controls").fetchone()[0], 0)
+        invalid = [r['metadata'] for r in conn.execute("SELECT metadata FROM audit_log WHERE event = 'OWNER_COMMAND_INVALID'")]
+        conn.close()
+        self.assertEqual(len(invalid), 2)
+
+        # A paused thread can still be resumed by number
+        thread_controls.set_paused("+15550098", True, "manual")
+        self.command("U +15550098")
+        self.assertFalse(thread_controls.is_paused("+15550098"))
+
+    def test_external_writes_are_seen(self):
+        self.assertFalse(thread_controls.is_paused(THREAD))
+
+        # Repeat checks with no commits in between never touch the counter
+        checks = thread_controls.stats["counter_checks"]
+        for _ in range(5):
+            thread_controls.is_paused(THREAD)
+        self.assertEqual(thread_controls.stats["counter_checks"], checks)
+
+        # Another connection (e.g. another process) pauses the thread behind the cache's back
+        conn = get_db_connection()
+        conn.execute("INSERT INTO thread_controls (thread_id, paused, paused_reason) VALUES (?, 1, 'manual')", (THREAD,))
+        conn.commit()
+        self.assertEqual(thread_controls.get(THREAD)["reason"], "manual")
+
+        conn.execute("DELETE FROM thread_controls WHERE thread_id = ?", (THREAD,))
+        conn.commit()
+        conn.close()
+        self.assertFalse(thread_controls.is_paused(THREAD))
+
+    def test_unrelated_commits_do_not_reload(self):
+        thread_controls.is_paused(THREAD)
+        reloads = thread_controls.stats["reloads"]
+        conn = get_db_connection()
+        conn.execute("INSERT INTO messages (id, status, type) VALUES ('SM_OTHER', 'RECEIVED', 'INBOUND')")
+        conn.commit()
+        conn.close()
+        self.assertFalse(thread_controls.is_paused(THREAD))
+        self.assertEqual(thread_controls.stats["reloads"], reloads)
+
+
+if __name__ == '__main__':
+    unittest.main()
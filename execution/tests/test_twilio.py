@@ -0,0 +1,139 @@
+import unittest
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest.mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+import execution.jobs.job_02_enrich as job_02
+import execution.jobs.job_03_act as job_03
+from execution.connectors.twilio import TwilioConnector, RestTransport, MockTransport, build_transport
+from execution.utils.ratelimit import SharedTokenBucket
+
+
+class FakeTwilioHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive
+    peers = set()
+    received = []
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        form = parse_qs(self.rfile.read(length).decode())
+        FakeTwilioHandler.peers.add(self.client_address)
+        FakeTwilioHandler.received.append((form["To"][0], form["Body"][0]))
+        payload = json.dumps({"sid": f"SM{len(FakeTwilioHandler.received):032d}", "status": "queued"}).encode()
+        self.send_response(201)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class SlowTransport:
+    name = "slow"
+
+    def send(self, to_number, body, from_number):
+        time.sleep(0.1)
+        return f"SID_{to_number}"
+
+
+class InstantTransport:
+    name = "instant"
+
+    def send(self, to_number, body, from_number):
+        return "SID"
+
+
+class TwilioConnectorTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.rate_path = os.path.join(tmp.name, "milo.db.sendrate")
+        for name, value in (("TWILIO_RATE_STATE_PATH", self.rate_path), ("TWILIO_SEND_RATE", 1000), ("TWILIO_SEND_BURST", 1000)):
+            patcher = unittest.mock.patch(f'execution.connectors.twilio.{name}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_every_send_pays_the_shared_budget(self):
+        # Two processes' buckets on one state file: 20/s between them, not each
+        first, second = SharedTokenBucket(self.rate_path + ".x", 20, 1), SharedTokenBucket(self.rate_path + ".x", 20, 1)
+        start = time.monotonic()
+        for n in range(6):
+            (first if n % 2 else second).acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.2) # 5 waits of 50ms
+
+        # Every send through the connector pays (owner alerts and digests as well as replies)
+        connector = TwilioConnector(transport=InstantTransport())
+        with unittest.mock.patch('execution.connectors.twilio.TWILIO_SEND_RATE', 20), \
+             unittest.mock.patch('execution.connectors.twilio.TWILIO_SEND_BURST', 1):
+            start = time.monotonic()
+            for n in range(4):
+                connector.send_sms("+15559990001", f"Digest {n}")
+            self.assertGreaterEqual(time.monotonic() - start, 0.15)
+
+            start = time.monotonic()
+            mock = TwilioConnector(transport=MockTransport()) # No carrier: never throttled
+            for n in range(4):
+                mock.send_sms("+15559990001", f"Digest {n}")
+            self.assertLess(time.monotonic() - start, 0.1)
+
+    def test_jobs_share_one_connector(self):
+        self.assertIs(job_02.twilio_client, job_03.twilio)
+
+    def test_transport_built_on_first_use(self):
+        connector = TwilioConnector()
+        self.assertEqual(connector.latency_summary()["transport"], "not built")
+        with unittest.mock.patch('execution.connectors.twilio.build_transport', return_value=MockTransport()) as build:
+            connector.send_sms("+15550001", "Hi")
+            connector.send_sms("+15550001", "Hi again")
+        self.assertEqual(build.call_count, 1)
+        self.assertEqual(connector.latency_summary()["transport"], "mock")
+
+    def test_mock_transport_without_credentials(self):
+        with unittest.mock.patch('execution.connectors.twilio.TWILIO_ACCOUNT_SID', None):
+            self.assertIsInstance(build_transport("auto", base_url=""), MockTransport)
+        connector = TwilioConnector(MockTransport())
+        self.assertIsNone(connector.client)
+        self.assertEqual(connector.send_sms("+15550001", "Hi"), "mock_sid_123")
+
+    def test_rest_transport_reuses_connections_against_fake_server(self):
+        FakeTwilioHandler.peers, FakeTwilioHandler.received = set(), []
+        server = ThreadingHTTPServer(("127.0.0.1", 0), FakeTwilioHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            transport = RestTransport("ACtest", "token", base_url=f"http://127.0.0.1:{server.server_port}")
+            connector = TwilioConnector(transport)
+            sids = [connector.send_sms("+15550001", f"m{n}") for n in range(5)]
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(sids[0], f"SM{1:032d}")
+        self.assertEqual([b for _, b in FakeTwilioHandler.received], ["m0", "m1", "m2", "m3", "m4"])
+        self.assertEqual(len(FakeTwilioHandler.peers), 1) # One keep-alive connection
+        summary = connector.latency_summary()
+        self.assertEqual((summary["calls"], summary["errors"]), (5, 0))
+        self.assertIsNotNone(summary["avg_ms"])
+
+    def test_async_sends_run_concurrently(self):
+        connector = TwilioConnector(SlowTransport())
+
+        async def send_all():
+            return await asyncio.gather(*(connector.send_sms_async(f"+1555000{n}", "Hi") for n in range(5)))
+
+        start = time.monotonic()
+        sids = asyncio.run(send_all())
+        self.assertLess(time.monotonic() - start, 0.4) # 5 x 100ms sequentially
+        self.assertEqual(sids, [f"SID_+1555000{n}" for n in range(5)])
+        self.assertGreaterEqual(connector.latency_summary()["max_ms"], 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
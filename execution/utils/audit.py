@@ -0,0 +1,152 @@
+import atexit
+import json
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from execution.utils.db import get_connection, transaction
+from execution.utils.logging import get_logger
+from execution.config import AUDIT_BATCH_SIZE, AUDIT_FLUSH_INTERVAL, AUDIT_QUEUE_SIZE
+
+logger = get_logger(__name__)
+
+INSERT_AUDIT_SQL = "INSERT INTO audit_log (id, event, actor, metadata, timestamp) VALUES (?, ?, ?, ?, ?)"
+
+def audit_row(event, metadata=None, actor="SYSTEM", timestamp=None):
+    """
+    One audit_log row as a parameter tuple. metadata is JSON-serialized (datetimes etc. via str).
+    """
+    if timestamp is None:
+        timestamp = datetime.now(timezone.utc).isoformat()
+    elif isinstance(timestamp, datetime):
+        timestamp = timestamp.isoformat()
+    payload = json.dumps(metadata, default=str) if metadata is not None else None
+    return (str(uuid.uuid4()), event, actor, payload, timestamp)
+
+def insert_audit(conn, rows):
+    """
+    Writes audit rows inside the caller's transaction (use when the audit must commit
+    atomically with a status change).
+    """
+    conn.executemany(INSERT_AUDIT_SQL, rows)
+
+class AuditWriter:
+    """
+    Buffered audit writer. record() only enqueues; a background thread group-commits
+    the queue with executemany once `batch_size` rows are waiting or every `flush_interval` seconds.
+    flush(durable=True) writes on the calling thread instead.
+    """
+    def __init__(self, batch_size=AUDIT_BATCH_SIZE, flush_interval=AUDIT_FLUSH_INTERVAL, queue_size=AUDIT_QUEUE_SIZE):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._write_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self.stats = {"written": 0, "batches": 0, "dropped": 0}
+
+    def start(self):
+        with self._start_lock:
+            if self.running():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+            self._thread.start()
+
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def record(self, event, metadata=None, actor="SYSTEM", timestamp=None):
+        """
+        Queues an audit event and returns its id. Events that must commit with a state
+        change belong in that transaction (insert_audit), not here.
+        """
+        row = audit_row(event, metadata, actor, timestamp)
+        try:
+            self._queue.put(row, timeout=0.5)
+        except queue.Full:
+            logger.warning("Audit queue full, flushing inline")
+            self.flush()
+            self._queue.put(row)
+        if self._queue.qsize() >= self.batch_size:
+            self._wakeup.set() # Size trigger
+        if not self.running():
+            self.start()
+        return row[0]
+
+    def flush(self, durable=False):
+        """
+        Writes everything queued so far on the calling thread. Returns the row count.
+        """
+        with self._write_lock:
+            rows = self._drain()
+            if rows:
+                self._write(rows, durable)
+        return len(rows)
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+    def _drain(self, limit=None):
+        rows = []
+        while limit is None or len(rows) < limit:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _run(self):
+        # Rows stay queued until written, so flush() under the write lock is a barrier
+        while not self._stop.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            with self._write_lock:
+                while True:
+                    rows = self._drain(self.batch_size)
+                    if not rows:
+                        break
+                    self._write(rows)
+
+    def _write(self, rows, durable=False, attempts=3):
+        for attempt in range(attempts):
+            try:
+                conn = get_connection()
+                switch = durable and not conn.in_transaction # synchronous can't change inside a transaction
+                if switch:
+                    conn.execute("PRAGMA synchronous = FULL")
+                try:
+                    with transaction() as conn:
+                        insert_audit(conn, rows)
+                finally:
+                    if switch:
+                        conn.execute("PRAGMA synchronous = NORMAL")
+                self.stats["written"] += len(rows)
+                self.stats["batches"] += 1
+                return
+            except Exception as e:
+                logger.error(f"Audit write failed ({len(rows)} rows, attempt {attempt + 1}/{attempts}): {e}")
+                time.sleep(0.1 * (attempt + 1))
+        # Keep the events recoverable from the log file
+        self.stats["dropped"] += len(rows)
+        for row in rows:
+            logger.error(f"AUDIT_DROPPED: {json.dumps(row)}")
+
+audit_writer = AuditWriter()
+atexit.register(audit_writer.flush)
+
+def record_audit(event, metadata=None, actor="SYSTEM", timestamp=None):
+    return audit_writer.record(event, metadata, actor, timestamp)
+
+def flush_audit(durable=False):
+    return audit_writer.flush(durable)
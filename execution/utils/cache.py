@@ -0,0 +1,353 @@
+import hashlib
+import json
+import math
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timezone
+from execution.utils.db import get_connection, transaction, db
+from execution.utils.audit import audit_row, insert_audit
+from execution.utils.logging import get_logger
+from execution.config import DEDUP_RECENT_SIZE, DEDUP_BLOOM_ENABLED, DEDUP_BLOOM_CAPACITY, DEDUP_BLOOM_ERROR_RATE
+
+logger = get_logger(__name__)
+
+def normalize_body(body):
+    """
+    Folds case, whitespace and punctuation so trivially different texts share a key.
+    "What are your hours?" / "what are your  hours" -> "what are your hours"
+    """
+    text = unicodedata.normalize("NFKC", body or "").casefold()
+    text = "".join(" " if unicodedata.category(ch).startswith(("P", "S")) else ch for ch in text)
+    return " ".join(text.split())
+
+class ClassificationCache:
+    """
+    Two-tier cache of classification results.
+    Tier 1: in-process LRU. Tier 2: `classification_cache` table (survives restarts).
+    Entries are scoped to a version key, so a prompt/model change invalidates them.
+    `version_source` is a string, or a callable re-read on every lookup (e.g. when the
+    prompt depends on a setting that can change at runtime).
+    """
+    def __init__(self, version_source, max_entries, db_max_entries, ttl, max_chars):
+        self._version_source = version_source
+        self._version = (None, None) # (source, hash) last computed
+        self.max_entries = max_entries
+        self.db_max_entries = db_max_entries
+        self.ttl = ttl
+        self.max_chars = max_chars
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.stats = {"memory_hits": 0, "db_hits": 0, "misses": 0}
+
+    @property
+    def version(self):
+        source = self._version_source() if callable(self._version_source) else self._version_source
+        if self._version[0] != source:
+            self._version = (source, hashlib.sha256(source.encode()).hexdigest()[:16])
+        return self._version[1]
+
+    def key_for(self, body):
+        normalized = normalize_body(body)
+        if not normalized or len(normalized) > self.max_chars:
+            return None # Only short repeat texts are worth caching
+        return hashlib.sha256(f"{self.version}:{normalized}".encode()).hexdigest()
+
+    def get(self, body):
+        key = self.key_for(body)
+        if key is None:
+            return None
+        now = time.time()
+
+        # Tier 1: Memory
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and entry[1] > now:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return dict(entry[0])
+            if entry:
+                del self._memory[key]
+
+        # Tier 2: SQLite
+        try:
+            row = get_connection().execute("SELECT result, created_at FROM classification_cache WHERE key = ? AND version = ?",
+                                           (key, self.version)).fetchone()
+        except Exception as e:
+            logger.warning(f"Classification cache read failed: {e}")
+            row = None
+
+        if row and row['created_at'] + self.ttl > now:
+            result = json.loads(row['result'])
+            self._remember(key, result, row['created_at'] + self.ttl)
+            with self._lock:
+                self.stats["db_hits"] += 1
+            return dict(result)
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, body, result):
+        key = self.key_for(body)
+        if key is None:
+            return
+        now = time.time()
+        self._remember(key, result, now + self.ttl)
+        try:
+            with self._lock:
+                self._puts += 1
+                prune = self._puts % 100 == 0
+            with transaction() as conn:
+                conn.execute("INSERT OR REPLACE INTO classification_cache (key, version, result, created_at) VALUES (?, ?, ?, ?)",
+                             (key, self.version, json.dumps(result), now))
+                if prune:
+                    self._prune(conn, now)
+        except Exception as e:
+            logger.warning(f"Classification cache write failed: {e}")
+
+    def _remember(self, key, result, expires_at):
+        with self._lock:
+            self._memory[key] = (dict(result), expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _prune(self, conn, now):
+        # TTL + stale prompt versions, then size cap (oldest first)
+        conn.execute("DELETE FROM classification_cache WHERE created_at < ? OR version != ?", (now - self.ttl, self.version))
+        conn.execute("""
+            DELETE FROM classification_cache WHERE key IN (
+                SELECT key FROM classification_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?
+            )""", (self.db_max_entries,))
+
+    def reset(self):
+        """Drops the memory tier and counters (the SQLite tier is left alone)."""
+        with self._lock:
+            self._memory.clear()
+            self.stats = {"memory_hits": 0, "db_hits": 0, "misses": 0}
+
+class ThreadControlCache:
+    """
+    In-memory copy of `thread_controls` (paused threads only; the table is tiny).
+    Pause checks are served from memory. set_paused() writes through to the DB and the cache.
+    Changes made by other processes are detected cheaply: PRAGMA data_version tells whether
+    anyone else committed since this thread last looked, and only then is the trigger-maintained
+    change counter read; the table is reloaded only when that counter moved.
+    """
+    def __init__(self):
+        self._paused = {}
+        self._version = None # change_counters.version the memory copy reflects
+        self._generation = None # db.generation it was loaded from (test DB swaps, init_db)
+        self._lock = threading.Lock()
+        self._local = threading.local() # Per thread: (connection, data_version) last validated
+        self.stats = {"hits": 0, "counter_checks": 0, "reloads": 0}
+
+    def _validate(self):
+        conn = get_connection()
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        local = self._local
+        if (getattr(local, "conn", None) is conn and local.data_version == data_version
+                and self._generation == db.generation):
+            return # Nobody else has committed since this thread last checked
+        counter = conn.execute("SELECT version FROM change_counters WHERE name = 'thread_controls'").fetchone()
+        counter = counter['version'] if counter else 0
+        with self._lock:
+            self.stats["counter_checks"] += 1
+            stale = self._generation != db.generation or self._version != counter
+        if stale:
+            self.load(conn, counter)
+        local.conn, local.data_version = conn, data_version
+
+    def load(self, conn=None, counter=None):
+        """(Re)reads the paused threads. The counter is read first, so a concurrent change forces another reload."""
+        conn = conn or get_connection()
+        if counter is None:
+            row = conn.execute("SELECT version FROM change_counters WHERE name = 'thread_controls'").fetchone()
+            counter = row['version'] if row else 0
+        rows = conn.execute("SELECT thread_id, paused_reason, last_updated FROM thread_controls WHERE paused").fetchall()
+        with self._lock:
+            self._paused = {r['thread_id']: {"reason": r['paused_reason'], "since": r['last_updated']} for r in rows}
+            self._version, self._generation = counter, db.generation
+            self.stats["reloads"] += 1
+        logger.debug(f"Thread controls loaded: {len(rows)} paused (version {counter})")
+
+    def get(self, thread_id):
+        """{"reason", "since"} if the thread is paused, else None."""
+        self._validate()
+        with self._lock:
+            self.stats["hits"] += 1
+            entry = self._paused.get(thread_id)
+            return dict(entry) if entry else None
+
+    def is_paused(self, thread_id):
+        return self.get(thread_id) is not None
+
+    def set_paused(self, thread_id, paused, reason=None, actor="SYSTEM"):
+        """
+        Pauses or resumes a thread (DB + audit in one transaction), then updates the cache.
+        """
+        now_ui = datetime.now(timezone.utc).isoformat()
+        with transaction() as conn:
+            conn.execute("""INSERT INTO thread_controls (thread_id, paused, paused_reason, last_updated) VALUES (?, ?, ?, ?)
+                            ON CONFLICT(thread_id) DO UPDATE SET paused = excluded.paused, paused_reason = excluded.paused_reason,
+                                                                 last_updated = excluded.last_updated""",
+                         (thread_id, bool(paused), reason if paused else None, now_ui))
+            counter = conn.execute("SELECT version FROM change_counters WHERE name = 'thread_controls'").fetchone()['version']
+            insert_audit(conn, [audit_row("THREAD_PAUSED" if paused else "THREAD_RESUMED",
+                                          {"thread_id": thread_id, "reason": reason}, actor=actor, timestamp=now_ui)])
+        with self._lock:
+            if paused:
+                self._paused[thread_id] = {"reason": reason, "since": now_ui}
+            else:
+                self._paused.pop(thread_id, None)
+            # Only our own write in between: still in sync. Otherwise reload on the next check.
+            if self._generation == db.generation and self._version == counter - 1:
+                self._version = counter
+            else:
+                self._version = None
+        logger.info(f"Thread {thread_id} {'PAUSED' if paused else 'RESUMED'} by {actor}")
+
+thread_controls = ThreadControlCache()
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter: `in` is False only for keys never added.
+    Sized for `capacity` keys at `error_rate` false positives; degrades gracefully beyond.
+    """
+    def __init__(self, capacity, error_rate):
+        self.bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self._array = bytearray((self.bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self._array[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self._array[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+class MessageSidCache:
+    """
+    Webhook fast path for Twilio retries. Holds only MessageSids known to be stored:
+    an LRU of recent ones (a hit is a confirmed duplicate, answered without SQLite),
+    and optionally a Bloom filter over every stored inbound id, whose negatives mean
+    "certainly new" so ingest can skip the read and go straight to INSERT OR IGNORE.
+    The primary key stays the source of truth; other processes' inserts are simply
+    not known here and are caught by the insert.
+    """
+    def __init__(self, max_entries, bloom_capacity=None, bloom_error_rate=0.001):
+        self.max_entries = max_entries
+        self.bloom_capacity = bloom_capacity
+        self.bloom_error_rate = bloom_error_rate
+        self._recent = OrderedDict()
+        self._bloom = None # Only trusted once warmed from the DB
+        self._generation = db.generation
+        self._lock = threading.Lock()
+        self._warming = None # Background load() thread
+        self.stats = {"recent_hits": 0, "bloom_negatives": 0, "bloom_maybes": 0}
+
+    def _check_generation(self):
+        # Caller holds the lock. A different DB (init_db, tests) invalidates everything.
+        if self._generation != db.generation:
+            self._recent.clear()
+            self._bloom = None
+            self._generation = db.generation
+
+    def load(self, conn=None):
+        """
+        Warms the LRU with the most recent inbound ids and, when enabled, builds the
+        Bloom filter from all of them (streamed; nothing but the filter is kept).
+        """
+        conn = conn or get_connection()
+        bloom = BloomFilter(self.bloom_capacity, self.bloom_error_rate) if self.bloom_capacity else None
+        generation = db.generation
+        if bloom is not None:
+            for row in conn.execute("SELECT id FROM messages WHERE type = 'INBOUND' AND id IS NOT NULL"):
+                bloom.add(row['id'])
+        recent = conn.execute("SELECT id FROM messages WHERE type = 'INBOUND' AND id IS NOT NULL ORDER BY rowid DESC LIMIT ?",
+                              (self.max_entries,)).fetchall()
+        with self._lock:
+            if db.generation != generation:
+                return # DB swapped while warming
+            self._check_generation()
+            warmed = OrderedDict((row['id'], True) for row in reversed(recent))
+            for sid in self._recent: # Added by ingest while warming (newest)
+                warmed[sid] = True
+                warmed.move_to_end(sid)
+                if bloom is not None:
+                    bloom.add(sid)
+            while len(warmed) > self.max_entries:
+                warmed.popitem(last=False)
+            self._recent, self._bloom = warmed, bloom
+        logger.debug(f"MessageSid cache warmed: {len(recent)} recent, bloom {bloom.count if bloom else 'off'}")
+
+    def start_warming(self):
+        """
+        Runs load() in a daemon thread, so startup does not wait on a full scan of the
+        inbound ids. Until it finishes, might_exist() answers True and ingest relies on
+        the DB check.
+        """
+        self._warming = threading.Thread(target=self._warm, name="message-sids-warm", daemon=True)
+        self._warming.start()
+        return self._warming
+
+    def _warm(self):
+        started = time.monotonic()
+        try:
+            self.load()
+            logger.info(f"MessageSid cache warmed in {time.monotonic() - started:.1f}s")
+        except Exception as e:
+            logger.error(f"MessageSid cache warm-up failed (dedup falls back to the DB): {e}")
+
+    def seen(self, sid):
+        """True only for a MessageSid known to be stored (confirmed duplicate)."""
+        with self._lock:
+            self._check_generation()
+            if sid in self._recent:
+                self._recent.move_to_end(sid)
+                self.stats["recent_hits"] += 1
+                return True
+            return False
+
+    def might_exist(self, sid):
+        """False when the Bloom filter proves sid was never stored; True when unknown."""
+        with self._lock:
+            self._check_generation()
+            if self._bloom is None or not sid:
+                return True
+            if sid in self._bloom:
+                self.stats["bloom_maybes"] += 1
+                return True
+            self.stats["bloom_negatives"] += 1
+            return False
+
+    def add(self, sid):
+        """Records a MessageSid that is now stored."""
+        if not sid:
+            return
+        with self._lock:
+            self._check_generation()
+            self._recent[sid] = True
+            self._recent.move_to_end(sid)
+            while len(self._recent) > self.max_entries:
+                self._recent.popitem(last=False)
+            if self._bloom is not None:
+                self._bloom.add(sid)
+
+    def snapshot(self):
+        """Sizes and counters for /health."""
+        with self._lock:
+            return dict(self.stats, recent=len(self._recent), bloom=self._bloom.count if self._bloom is not None else None,
+                        warming=bool(self._warming and self._warming.is_alive()))
+
+message_sids = MessageSidCache(DEDUP_RECENT_SIZE, DEDUP_BLOOM_CAPACITY if DEDUP_BLOOM_ENABLED else None, DEDUP_BLOOM_ERROR_RATE)
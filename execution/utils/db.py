@@ -1,60 +1,340 @@
 import sqlite3
 import os
-from execution.config import DATABASE_PATH
-from execution.utils.logging import logger
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from execution.config import (
+    DATABASE_PATH, DB_BUSY_TIMEOUT, DB_CACHE_SIZE_KB, DB_MMAP_SIZE,
+    DB_STATEMENT_CACHE, DB_LOCK_RETRIES
+)
+from execution.utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+class DatabaseBusyError(Exception):
+    pass
 
 def get_db_connection():
-    conn = sqlite3.connect(DATABASE_PATH)
+    """
+    Fresh, caller-owned connection (legacy transaction handling; caller commits/closes).
+    Prefer get_connection() / transaction() for job code.
+    """
+    conn = sqlite3.connect(DATABASE_PATH, timeout=DB_BUSY_TIMEOUT)
     conn.row_factory = sqlite3.Row
+    apply_pragmas(conn)
     return conn
 
+def apply_pragmas(conn):
+    """
+    Per-connection tuning. journal_mode=WAL is persistent and set once in init_db.
+    """
+    conn.execute(f"PRAGMA busy_timeout = {int(DB_BUSY_TIMEOUT * 1000)}")
+    conn.execute("PRAGMA synchronous = NORMAL") # Durable across app crashes in WAL; fsync at checkpoints
+    conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+
+class ConnectionManager:
+    """
+    One long-lived autocommit connection per thread (webhook, poller, workers).
+    Keeps the prepared-statement cache warm and pays pragma setup once per thread.
+    Writes go through transaction(), which takes the write lock up front.
+    """
+    def __init__(self):
+        self._local = threading.local()
+        self._generation = 0
+
+    def connection(self):
+        local = self._local
+        conn = getattr(local, "conn", None)
+        if conn is not None and local.generation == self._generation and local.path == DATABASE_PATH:
+            return conn
+        if conn is not None:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        conn = sqlite3.connect(DATABASE_PATH, timeout=DB_BUSY_TIMEOUT, isolation_level=None,
+                               cached_statements=DB_STATEMENT_CACHE)
+        conn.row_factory = sqlite3.Row
+        apply_pragmas(conn)
+        local.conn, local.generation, local.path = conn, self._generation, DATABASE_PATH
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """
+        BEGIN IMMEDIATE ... COMMIT on this thread's connection (ROLLBACK on error).
+        Nested use joins the outer transaction.
+        """
+        conn = self.connection()
+        if conn.in_transaction:
+            yield conn
+            return
+
+        for attempt in range(DB_LOCK_RETRIES + 1):
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                break
+            except sqlite3.OperationalError as e:
+                if not _is_busy(e):
+                    raise
+                if attempt == DB_LOCK_RETRIES:
+                    raise DatabaseBusyError(f"Database busy after {attempt + 1} attempts: {e}") from e
+                logger.warning(f"Database busy ({e}), retrying BEGIN ({attempt + 1}/{DB_LOCK_RETRIES})")
+                time.sleep(0.05 * (2 ** attempt))
+
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+    def reset(self):
+        """Makes every thread reopen its connection on next use (e.g. after init_db / path change)."""
+        self._generation += 1
+
+    @property
+    def generation(self):
+        """Changes whenever connections are reset (so caches of DB state can drop theirs too)."""
+        return self._generation
+
+def _is_busy(error):
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+db = ConnectionManager()
+
+def get_connection():
+    return db.connection()
+
+def database_path():
+    return DATABASE_PATH
+
+def transaction():
+    return db.transaction()
+
+# Ordered schema migrations: (version, name, [statements] or callable(conn)).
+# Append only; never edit a migration that has shipped.
+MIGRATIONS = [
+    (1, "baseline tables", [
+        '''CREATE TABLE IF NOT EXISTS messages (
+            id TEXT PRIMARY KEY,
+            thread_id TEXT,
+            in_reply_to_id TEXT,
+            sender TEXT,
+            receiver TEXT,
+            body TEXT,
+            media TEXT,
+            status TEXT,
+            type TEXT,
+            timestamp DATETIME,
+            draft_version INTEGER DEFAULT 1
+        )''',
+        '''CREATE TABLE IF NOT EXISTS approvals (
+            id TEXT PRIMARY KEY,
+            draft_id TEXT,
+            reviewer_phone TEXT,
+            action TEXT,
+            notes TEXT,
+            timestamp DATETIME,
+            FOREIGN KEY(draft_id) REFERENCES messages(id)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS audit_log (
+            id TEXT PRIMARY KEY,
+            event TEXT,
+            actor TEXT,
+            metadata TEXT,
+            timestamp DATETIME
+        )''',
+        '''CREATE TABLE IF NOT EXISTS thread_controls (
+            thread_id TEXT PRIMARY KEY,
+            paused BOOLEAN,
+            paused_reason TEXT,
+            last_updated DATETIME
+        )''',
+        '''CREATE TABLE IF NOT EXISTS classification_cache (
+            key TEXT PRIMARY KEY,
+            version TEXT,
+            result TEXT,
+            created_at REAL
+        )''',
+    ]),
+    (2, "queue, thread and audit indexes", [
+        # Covers the RECEIVED / APPROVED_TO_SEND queue scans (status, type, oldest first)
+        "CREATE INDEX IF NOT EXISTS idx_messages_queue ON messages(status, type, timestamp, id, thread_id)",
+        "CREATE INDEX IF NOT EXISTS idx_messages_thread ON messages(thread_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_messages_in_reply_to ON messages(in_reply_to_id)",
+        "CREATE INDEX IF NOT EXISTS idx_audit_log_event ON audit_log(event, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_classification_cache_created ON classification_cache(created_at)",
+    ]),
+    (3, "owner notification ledger", [
+        '''CREATE TABLE IF NOT EXISTS owner_notifications (
+            msg_id TEXT NOT NULL,
+            event_type TEXT NOT NULL,
+            status TEXT,
+            sid TEXT,
+            created_at DATETIME,
+            sent_at DATETIME,
+            send_ms INTEGER,
+            PRIMARY KEY (msg_id, event_type)
+        )''',
+        # Backfill from the audit rows that used to be the dedup source
+        '''INSERT OR IGNORE INTO owner_notifications (msg_id, event_type, status, sid, created_at, sent_at)
+            SELECT json_extract(metadata, '$.msg_id'), substr(event, 16), 'SENT',
+                   json_extract(metadata, '$.sid'), timestamp, timestamp
+            FROM audit_log
+            WHERE event LIKE 'OWNER_NOTIFIED_%' AND json_valid(metadata)
+              AND json_extract(metadata, '$.msg_id') IS NOT NULL''',
+    ]),
+    (4, "approvals lookup index", [
+        "CREATE INDEX IF NOT EXISTS idx_approvals_draft ON approvals(draft_id, action, timestamp)",
+    ]),
+    (5, "outbound send leases and ledger", [
+        "ALTER TABLE messages ADD COLUMN lease_owner TEXT",
+        "ALTER TABLE messages ADD COLUMN lease_expires_at REAL",
+        # One row per draft ever handed to Twilio; the idempotency key for sends
+        '''CREATE TABLE IF NOT EXISTS outbound_sends (
+            draft_id TEXT PRIMARY KEY,
+            lease_owner TEXT,
+            status TEXT,
+            sid TEXT,
+            error TEXT,
+            attempted_at DATETIME,
+            completed_at DATETIME
+        )''',
+    ]),
+    (6, "daily report rollups", [
+        # One row per (UTC day, metric, key); updated incrementally by job_04_report
+        '''CREATE TABLE IF NOT EXISTS report_daily (
+            day TEXT NOT NULL,
+            metric TEXT NOT NULL,
+            key TEXT NOT NULL DEFAULT '',
+            count INTEGER NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0,
+            max REAL,
+            PRIMARY KEY (day, metric, key)
+        ) WITHOUT ROWID''',
+        # Last rowid folded into the rollups, per source table
+        '''CREATE TABLE IF NOT EXISTS report_state (
+            source TEXT PRIMARY KEY,
+            high_water INTEGER NOT NULL DEFAULT 0,
+            updated_at DATETIME
+        )''',
+    ]),
+    (7, "audit age index for retention", [
+        "CREATE INDEX IF NOT EXISTS idx_audit_log_timestamp ON audit_log(timestamp)",
+    ]),
+    (8, "thread_controls change counter", [
+        # Bumped by trigger on every write, so in-memory caches in any process can tell they are stale
+        '''CREATE TABLE IF NOT EXISTS change_counters (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )''',
+        "INSERT OR IGNORE INTO change_counters (name, version) VALUES ('thread_controls', 0)",
+    ] + [
+        f'''CREATE TRIGGER IF NOT EXISTS thread_controls_{op.lower()} AFTER {op} ON thread_controls
+            BEGIN UPDATE change_counters SET version = version + 1 WHERE name = 'thread_controls'; END'''
+        for op in ("INSERT", "UPDATE", "DELETE")
+    ]),
+    (9, "job checkpoints", [
+        '''CREATE TABLE IF NOT EXISTS job_checkpoints (
+            job TEXT PRIMARY KEY,
+            cursor_timestamp TEXT,
+            cursor_id TEXT,
+            processed INTEGER NOT NULL DEFAULT 0,
+            updated_at DATETIME
+        )''',
+    ]),
+    (10, "message status counters", [
+        # Kept by trigger, so /metrics reads a handful of rows instead of scanning messages
+        '''CREATE TABLE IF NOT EXISTS message_status_counts (
+            status TEXT PRIMARY KEY,
+            count INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID''',
+        '''INSERT OR IGNORE INTO message_status_counts (status, count)
+            SELECT status, count(*) FROM messages WHERE status IS NOT NULL GROUP BY status''',
+        '''CREATE TRIGGER IF NOT EXISTS message_status_insert AFTER INSERT ON messages WHEN NEW.status IS NOT NULL
+            BEGIN
+                INSERT OR IGNORE INTO message_status_counts (status, count) VALUES (NEW.status, 0);
+                UPDATE message_status_counts SET count = count + 1 WHERE status = NEW.status;
+            END''',
+        '''CREATE TRIGGER IF NOT EXISTS message_status_delete AFTER DELETE ON messages WHEN OLD.status IS NOT NULL
+            BEGIN UPDATE message_status_counts SET count = count - 1 WHERE status = OLD.status; END''',
+        '''CREATE TRIGGER IF NOT EXISTS message_status_update AFTER UPDATE OF status ON messages
+            WHEN OLD.status IS NOT NEW.status
+            BEGIN
+                UPDATE message_status_counts SET count = count - 1 WHERE status = OLD.status;
+                INSERT OR IGNORE INTO message_status_counts (status, count) SELECT NEW.status, 0 WHERE NEW.status IS NOT NULL;
+                UPDATE message_status_counts SET count = count + 1 WHERE status = NEW.status;
+            END''',
+    ]),
+]
+
 def init_db():
-    if not os.path.exists(os.path.dirname(DATABASE_PATH)):
-        os.makedirs(os.path.dirname(DATABASE_PATH), exist_ok=True)
-        
+    db_dir = os.path.dirname(DATABASE_PATH)
+    if db_dir and not os.path.exists(db_dir):
+        os.makedirs(db_dir, exist_ok=True)
+
     conn = get_db_connection()
-    c = conn.cursor()
-    
-    # Tables
-    c.execute('''CREATE TABLE IF NOT EXISTS messages (
-        id TEXT PRIMARY KEY,
-        thread_id TEXT,
-        in_reply_to_id TEXT,
-        sender TEXT,
-        receiver TEXT,
-        body TEXT,
-        media TEXT,
-        status TEXT,
-        type TEXT,
-        timestamp DATETIME,
-        draft_version INTEGER DEFAULT 1
-    )''')
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS approvals (
-        id TEXT PRIMARY KEY,
-        draft_id TEXT,
-        reviewer_phone TEXT,
-        action TEXT,
-        notes TEXT,
-        timestamp DATETIME,
-        FOREIGN KEY(draft_id) REFERENCES messages(id)
-    )''')
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS audit_log (
-        id TEXT PRIMARY KEY,
-        event TEXT,
-        actor TEXT,
-        metadata TEXT,
-        timestamp DATETIME
-    )''')
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS thread_controls (
-        thread_id TEXT PRIMARY KEY,
-        paused BOOLEAN,
-        paused_reason TEXT,
-        last_updated DATETIME
-    )''')
-    
-    conn.commit()
+
+    # Only takes effect on a new (empty) file; existing files need one full VACUUM (job_05_retention --convert)
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
+    # WAL lets the webhook write while pollers read
+    mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+    if mode.lower() != "wal":
+        logger.warning(f"SQLite journal_mode is {mode}, WAL unavailable")
+
+    migrate(conn)
     conn.close()
+    db.reset()
     logger.info("Database initialized at " + DATABASE_PATH)
+
+def migrate(conn):
+    """
+    Applies pending MIGRATIONS in order. Each migration runs in its own
+    BEGIN IMMEDIATE transaction, so concurrent starters apply it exactly once.
+    """
+    conn.execute('''CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name TEXT,
+        applied_at DATETIME
+    )''')
+    conn.commit()
+
+    applied = {r[0] for r in conn.execute("SELECT version FROM schema_migrations")}
+
+    isolation = conn.isolation_level
+    conn.isolation_level = None # Explicit transaction control (DDL included)
+    try:
+        for version, name, steps in MIGRATIONS:
+            if version in applied:
+                continue
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Re-check under the write lock (another process may have just applied it)
+                if conn.execute("SELECT 1 FROM schema_migrations WHERE version = ?", (version,)).fetchone():
+                    conn.execute("COMMIT")
+                    continue
+                if callable(steps):
+                    steps(conn)
+                else:
+                    for sql in steps:
+                        conn.execute(sql)
+                conn.execute("INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+                             (version, name, datetime.now(timezone.utc).isoformat()))
+                conn.execute("COMMIT")
+                logger.info(f"Applied migration {version}: {name}")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+    finally:
+        conn.isolation_level = isolation
+
+def schema_version(conn):
+    row = conn.execute("SELECT max(version) FROM schema_migrations").fetchone()
+    return row[0] or 0
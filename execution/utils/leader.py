@@ -0,0 +1,73 @@
+import os
+import socket
+import threading
+import uuid
+from execution.utils.logging import get_logger
+
+try:
+    import fcntl
+except ImportError: # Windows: no advisory locks, run single-process
+    fcntl = None
+
+logger = get_logger(__name__)
+
+# Identity of this process in leases and the leader file (set at import, i.e. after a fork)
+PROCESS_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+class LeaderElection:
+    """
+    Exactly one process per lock file is leader: whoever holds an exclusive flock on it.
+    The OS drops the lock when the holder dies, and a standby retrying every
+    `retry_interval` seconds takes over and runs on_elected().
+    """
+    def __init__(self, path, on_elected, retry_interval=5.0):
+        self.path = path
+        self.on_elected = on_elected
+        self.retry_interval = retry_interval
+        self.is_leader = False
+        self._file = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def try_acquire(self):
+        if self.is_leader:
+            return True
+        if fcntl is None:
+            logger.warning("fcntl unavailable; assuming a single process and taking leadership")
+        else:
+            handle = open(self.path, "a+")
+            try:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                handle.close()
+                return False
+            handle.seek(0)
+            handle.truncate()
+            handle.write(f"{PROCESS_ID}\n") # For operators: who leads
+            handle.flush()
+            self._file = handle
+        self.is_leader = True
+        logger.info(f"Elected leader ({PROCESS_ID}); starting background loops")
+        self.on_elected()
+        return True
+
+    def start(self):
+        """Tries now, then keeps retrying in a daemon thread until elected."""
+        if self.try_acquire():
+            return
+        logger.info(f"Standby: another process holds {self.path}")
+        self._thread = threading.Thread(target=self._run, name="leader-election", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.retry_interval):
+            if self.try_acquire():
+                return
+
+    def resign(self):
+        """Stops campaigning and releases the lock (shutdown / tests)."""
+        self._stop.set()
+        if self._file is not None:
+            self._file.close() # Closing drops the flock
+            self._file = None
+        self.is_leader = False
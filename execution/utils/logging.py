@@ -1,42 +1,131 @@
+import atexit
+import gzip
 import logging
 import json
 import os
+import queue
+import shutil
 import sys
-from datetime import datetime
-from execution.config import LOG_PATH
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from execution.config import LOG_PATH, LOG_LEVEL, LOG_LEVELS, LOG_ROTATION, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_PER_PROCESS
+
+_encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=str).encode
 
 class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line. Runs on the listener thread only, so the per-second
+    timestamp prefix can be cached without locking.
+    """
+    def __init__(self):
+        super().__init__()
+        self._second = None
+        self._prefix = ""
+
+    def _timestamp(self, created):
+        second = int(created)
+        if second != self._second:
+            self._second = second
+            self._prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(second))
+        return f"{self._prefix}.{int((created - second) * 1000):03d}"
+
     def format(self, record):
         log_record = {
-            "timestamp": datetime.fromtimestamp(record.created).isoformat(),
+            "timestamp": self._timestamp(record.created),
             "level": record.levelname,
             "message": record.getMessage(),
             "module": record.module,
             "func": record.funcName,
         }
+        if record.name != "MILO":
+            log_record["logger"] = record.name
         if hasattr(record, "props"):
             log_record.update(record.props)
-        return json.dumps(log_record)
+        return _encode(log_record)
+
+def _gzip_namer(name):
+    return name + ".gz"
+
+def _gzip_rotator(source, dest):
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+def process_log_path(path=LOG_PATH, per_process=LOG_PER_PROCESS):
+    """
+    LOG_PATH, or execution.<pid>.log next to it when several processes log at once:
+    rotating one file from many processes loses lines at every rollover.
+    """
+    if not per_process:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{os.getpid()}{ext}"
+
+def build_file_handler(path=None, rotation=LOG_ROTATION, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT):
+    """
+    Rotating JSON file handler: by size ("size") or time ("midnight", "H", ...); rotated files are gzipped.
+    """
+    path = path or process_log_path()
+    if rotation == "size":
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, delay=True)
+    else:
+        handler = TimedRotatingFileHandler(path, when=rotation, backupCount=backup_count, delay=True)
+    handler.namer = _gzip_namer
+    handler.rotator = _gzip_rotator
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+def apply_levels(spec, root="MILO"):
+    """
+    Per-module levels from "jobs.job_02_enrich=DEBUG,utils=WARNING" (names relative to the root logger).
+    """
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, level = item.partition("=")
+        name = name.strip()
+        target = root if name in ("", root) else f"{root}.{name}"
+        logging.getLogger(target).setLevel(level.strip().upper())
+
+def get_logger(module_name):
+    """
+    Module logger under MILO (execution.jobs.job_02_enrich -> MILO.jobs.job_02_enrich),
+    so LOG_LEVELS can raise or lower it independently. Hot-path debug calls should use
+    %-style args (logger.debug("x %s", y)) so nothing is formatted while DEBUG is off.
+    """
+    if module_name.startswith("execution."):
+        module_name = module_name[len("execution."):]
+    return logging.getLogger(f"MILO.{module_name}")
 
 def setup_logger(name="MILO"):
+    """
+    Callers only enqueue records (QueueHandler); a QueueListener thread formats
+    and writes them to the rotating file and stdout.
+    """
+    logger = logging.getLogger(name)
+    if getattr(logger, "listener", None) is not None:
+        return logger
+
     # Ensure log dir exists
     log_dir = os.path.dirname(LOG_PATH)
-    if not os.path.exists(log_dir):
+    if log_dir and not os.path.exists(log_dir):
         os.makedirs(log_dir, exist_ok=True)
 
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
+    logger.setLevel(LOG_LEVEL.upper())
 
-    # File Handler (JSON)
-    file_handler = logging.FileHandler(LOG_PATH)
-    file_handler.setFormatter(JsonFormatter())
-    logger.addHandler(file_handler)
+    # File Handler (JSON, rotated)
+    file_handler = build_file_handler()
 
     # Console Handler (Human Friendly)
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-    logger.addHandler(console_handler)
 
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop) # Drains the queue on shutdown
+    logger.addHandler(QueueHandler(log_queue))
+    logger.listener = listener
+
+    apply_levels(LOG_LEVELS, name)
     return logger
 
 logger = setup_logger()
@@ -0,0 +1,393 @@
+import atexit
+import bisect
+import functools
+import glob
+import json
+import os
+import threading
+import time
+from execution.config import METRICS_DIR, METRICS_EXPORT_INTERVAL
+
+try:
+    import fcntl
+except ImportError: # Windows: no advisory locks, run single-process
+    fcntl = None
+
+# Seconds; covers SQLite lookups (sub-ms) through LLM calls (several seconds)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+RETIRED = "retired" # Snapshot holding the summed counters of processes that exited
+
+class Registry:
+    """
+    Single process: render() reports this process's metrics.
+    With `directory` (METRICS_DIR, set under gunicorn) every process also exports a
+    snapshot there (start_export), and render() merges them, so a scrape answered by
+    any worker sees the whole service: counters and histograms are summed over every
+    process that ran; gauges are combined over live processes per their multiprocess mode.
+    Files are named by instance (pid + start time), and a process is alive while it holds
+    the flock on its <instance>.lock. Exited ones are folded into retired.json and removed,
+    so totals never go backwards and a reused pid starts from a file of its own.
+    """
+    def __init__(self, directory=None):
+        self._metrics = []
+        self._lock = threading.Lock()
+        self.directory = directory
+        self._instance = None # (pid, instance id)
+        self._alive_file = None
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def instance(self):
+        """This process's snapshot name; a new one after a fork."""
+        pid = os.getpid()
+        if self._instance is None or self._instance[0] != pid:
+            if self._alive_file is not None:
+                self._alive_file.close() # The parent's lock, inherited across the fork
+                self._alive_file = None
+            self._instance = (pid, f"{pid}-{time.time_ns():x}")
+        return self._instance[1]
+
+    def _path(self, name, ext=".json"):
+        return os.path.join(self.directory, name + ext)
+
+    def _hold_alive_lock(self):
+        """Exclusive flock on <instance>.lock for the life of the process (the OS drops it at exit)."""
+        instance = self.instance()
+        if fcntl is None or self._alive_file is not None:
+            return
+        handle = open(self._path(instance, ".lock"), "a")
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._alive_file = handle
+
+    def export(self):
+        """Writes this process's snapshot to <directory>/<instance>.json (atomic replace)."""
+        if not self.directory:
+            return
+        with self._lock:
+            metrics = list(self._metrics)
+        snapshot = {m.name: m.export() for m in metrics}
+        os.makedirs(self.directory, exist_ok=True)
+        self._hold_alive_lock()
+        path = self._path(self.instance())
+        with open(path + ".tmp", "w") as f:
+            json.dump(snapshot, f)
+        os.replace(path + ".tmp", path)
+
+    def start_export(self, interval=METRICS_EXPORT_INTERVAL):
+        """Exports every `interval` seconds from a daemon thread, and once more at exit (no-op in single-process mode)."""
+        if not self.directory:
+            return
+        def run():
+            while True:
+                try:
+                    self.export()
+                except OSError:
+                    pass # Next round
+                time.sleep(interval)
+        threading.Thread(target=run, name="metrics-export", daemon=True).start()
+        atexit.register(self.export)
+
+    def _load(self, name):
+        try:
+            with open(self._path(name)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None # Missing, or being replaced: skip this scrape
+
+    def _write(self, name, data):
+        path = self._path(name)
+        with open(path + ".tmp", "w") as f:
+            json.dump(data, f)
+        os.replace(path + ".tmp", path)
+
+    def retire_dead(self):
+        """
+        Folds the counters and histograms of exited processes (their lock is free) into
+        retired.json and deletes their files; their gauges are dropped. Returns the count.
+        """
+        if fcntl is None or not os.path.isdir(self.directory):
+            return 0
+        with self._lock:
+            mergeable = {m.name: m for m in self._metrics if m.kind != "gauge"}
+        retired_count = 0
+        with open(self._path(RETIRED, ".lock"), "a") as guard:
+            fcntl.flock(guard.fileno(), fcntl.LOCK_EX) # One retirer at a time
+            retired = self._load(RETIRED) or {"folded": [], "metrics": {}}
+            for path in glob.glob(self._path("*", ".lock")):
+                name = os.path.basename(path)[:-len(".lock")]
+                if name in (RETIRED, self.instance()):
+                    continue
+                with open(path, "a") as probe:
+                    try:
+                        fcntl.flock(probe.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except OSError:
+                        continue # Held: alive
+                    if name not in retired["folded"]: # A crash after the write below must not fold twice
+                        for metric_name, rows in (self._load(name) or {}).items():
+                            metric = mergeable.get(metric_name)
+                            if metric is not None:
+                                retired["metrics"][metric_name] = metric.merge([retired["metrics"].get(metric_name, []), rows])
+                        retired["folded"].append(name)
+                        self._write(RETIRED, retired)
+                    for ext in (".json", ".lock"):
+                        try:
+                            os.remove(self._path(name, ext))
+                        except FileNotFoundError:
+                            pass
+                    retired_count += 1
+            live = {os.path.basename(p)[:-len(".lock")] for p in glob.glob(self._path("*", ".lock"))}
+            if retired_count and set(retired["folded"]) - live:
+                retired["folded"] = [n for n in retired["folded"] if n in live] # Files gone: nothing left to re-fold
+                self._write(RETIRED, retired)
+        return retired_count
+
+    def _others(self):
+        """[(alive, snapshot)] for the other live processes, plus the retired totals."""
+        try:
+            self.retire_dead()
+        except OSError:
+            pass # Next scrape
+        own = self.instance()
+        others = []
+        for path in glob.glob(self._path("*")):
+            name = os.path.basename(path)[:-len(".json")]
+            if name == own:
+                continue
+            snapshot = self._load(name)
+            if snapshot is None:
+                continue
+            if name == RETIRED:
+                others.append((False, snapshot["metrics"]))
+            else:
+                others.append((True, snapshot))
+        return others
+
+    def render(self):
+        """Prometheus text exposition format (0.0.4)."""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics)
+        others = self._others() if self.directory else []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            if metric.kind == "gauge":
+                exported = [snap.get(metric.name, []) for alive, snap in others if alive]
+            else:
+                exported = [snap.get(metric.name, []) for _, snap in others]
+            lines.extend(metric.samples(exported))
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry(METRICS_DIR)
+
+class _Metric:
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, *values, amount=1):
+        self.labels(*values).inc(amount)
+
+    def export(self):
+        return [[list(values), child.value] for values, child in list(self._children.items())]
+
+    def merge(self, exported):
+        """Sums exported snapshots (lists of rows) into one."""
+        totals = {}
+        for rows in exported:
+            for values, value in rows:
+                totals[tuple(values)] = totals.get(tuple(values), 0) + value
+        return [[list(values), value] for values, value in totals.items()]
+
+    def samples(self, exported=()):
+        for values, value in self.merge([self.export(), *exported]):
+            yield f"{self.name}{_labels(self.labelnames, values)} {_number(value)}"
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value, *values):
+        self.labels(*values).observe(value)
+
+    def export(self):
+        rows = []
+        for values, child in list(self._children.items()):
+            with child._lock:
+                rows.append([list(values), list(child.counts), child.sum, child.count])
+        return rows
+
+    def merge(self, exported):
+        """Sums exported snapshots (lists of rows) into one."""
+        merged = {}
+        for rows in exported:
+            for values, counts, total, count in rows:
+                entry = merged.setdefault(tuple(values), [[0] * len(counts), 0.0, 0])
+                entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                entry[1] += total
+                entry[2] += count
+        return [[list(values), counts, total, count] for values, (counts, total, count) in merged.items()]
+
+    def samples(self, exported=()):
+        for values, counts, total, count in self.merge([self.export(), *exported]):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="%s"' % _number(bound)
+                yield f"{self.name}_bucket{_labels(self.labelnames, values, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, values)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, values)} {count}"
+
+class Gauge(_Metric):
+    """
+    Read at scrape time: `collect()` returns a number, or {label values tuple: number}.
+    multiprocess: how values from other live processes combine with this one's:
+    "local" (same everywhere, e.g. read from the DB), "sum" (per-process queues) or "max".
+    """
+    kind = "gauge"
+
+    def __init__(self, name, help, collect, labelnames=(), registry=REGISTRY, multiprocess="local"):
+        self.collect = collect
+        self.multiprocess = multiprocess
+        super().__init__(name, help, labelnames, registry)
+
+    def _values(self):
+        value = self.collect()
+        if isinstance(value, dict):
+            return {tuple(values): number for values, number in value.items()}
+        return {(): value}
+
+    def export(self):
+        if self.multiprocess == "local":
+            return []
+        try:
+            return [[list(values), number] for values, number in self._values().items()]
+        except Exception:
+            return []
+
+    def samples(self, exported=()):
+        try:
+            values = self._values()
+        except Exception:
+            return # A failing collector must not break the scrape
+        if self.multiprocess != "local":
+            combine = max if self.multiprocess == "max" else (lambda a, b: a + b)
+            for rows in exported:
+                for labels, number in rows:
+                    key = tuple(labels)
+                    values[key] = combine(values[key], number) if key in values else number
+        for labels, number in values.items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(number)}"
+
+# Pipeline instrumentation
+# Error rate per stage: milo_stage_errors_total / milo_stage_duration_seconds_count
+# (stages llm_* are the OpenAI calls, twilio_send the Twilio API).
+STAGE_SECONDS = Histogram("milo_stage_duration_seconds", "Latency per pipeline stage.", ["stage"])
+STAGE_ERRORS = Counter("milo_stage_errors_total", "Exceptions raised per pipeline stage.", ["stage"])
+ENRICH_ROUTES = Counter("milo_enrich_routes_total", "Inbound messages by enrichment outcome.", ["route"])
+INGEST_DEDUP = Counter("milo_ingest_total", "Inbound webhooks by dedup outcome (new, duplicate_memory, duplicate_db).", ["result"])
+UPSTREAM_ATTEMPTS = Counter("milo_upstream_attempts_total", "External API attempts by outcome (ok, retry, failed, rejected, hedged).",
+                            ["upstream", "outcome"])
+APPROVAL_TO_SEND = Histogram("milo_approval_to_send_seconds", "Owner approval to Twilio send.",
+                             buckets=(0.1, 0.5, 1, 2.5, 5, 15, 30, 60, 120, 300, 900))
+
+class timed:
+    """
+    Times a stage into STAGE_SECONDS (and STAGE_ERRORS on exception).
+    Use as `with timed("ingest"):` or as a decorator `@timed("ingest")`.
+    """
+    __slots__ = ("stage", "_start")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        STAGE_SECONDS.observe(time.perf_counter() - self._start, self.stage)
+        if exc_type is not None:
+            STAGE_ERRORS.inc(self.stage)
+        return False
+
+    def __call__(self, fn):
+        stage = self.stage
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+
+def render_metrics():
+    return REGISTRY.render()
@@ -0,0 +1,110 @@
+import re
+import unicodedata
+
+# Whole-message opt-out keywords (carrier standard + Spanish equivalents)
+OPT_OUT_RE = re.compile(r"^\s*(stop|stopall|stop all|unsubscribe|cancel|end|quit|optout|opt out|revoke|baja|alto)\s*[.!]*\s*$", re.IGNORECASE)
+
+# Phrases that always end in NEEDS_REVIEW (checked in order, first match wins).
+# Only unambiguous threats, disputes, demands and medical emergencies: a bare "lawyer",
+# "credit card", "refund", "manager", "urgent" or "emergency" also shows up in ordinary
+# booking questions and is left to classify_message.
+RISK_PATTERNS = [
+    ("THREAT", re.compile(r"\b(kill you|i will kill|i'll kill|hurt you|shoot you|burn (it|this place) down|te voy a matar|te mato)\b", re.IGNORECASE)),
+    ("LEGAL", re.compile(r"\b(sue you|suing you|(going to|gonna|will|i'll) sue|(file|filing) a lawsuit|legal action|small claims|take you to court|"
+                         r"(call(ing)?|contact(ing)?|talk(ing)? to|hear from) my (lawyer|attorney)|my (lawyer|attorney) will|"
+                         r"(los|te|la|lo) voy a demandar|vamos a demandar|demanda judicial|acci[oó]n legal|hablar con mi abogad[oa])\b", re.IGNORECASE)),
+    ("PAYMENT", re.compile(r"\b(chargebacks?|charged (me )?twice|double charged|dispute (the|this|a|your) charge|disputing (the|this) charge|"
+                           r"unauthori[sz]ed charge|cobro doble|me cobraron dos veces|cargo no autorizado)\b", re.IGNORECASE)),
+    ("REFUND", re.compile(r"\b((want|demand|need) (a|my) (full )?refund|refund (me|my money)|give me (a|my) refund|(want|give me) my money back|"
+                          r"quiero (un|mi) reembolso|devu[eé]lvanme)\b", re.IGNORECASE)),
+    ("MEDICAL", re.compile(r"\b(medical emergency|(call(ed|ing)?|dial(ed|ing)?) 911|ambulance|overdos(e|ed|ing)|heart attack|can'?t breathe|"
+                           r"emergencia m[eé]dica|llam(a|e|en|ar|ando) al 911|ambulancia|sobredosis|ataque al coraz[oó]n|no puedo respirar)\b", re.IGNORECASE)),
+]
+
+# Frequent function words per language (word 1-gram profiles) for Latin-script text
+STOPWORDS = {
+    "EN": {"the", "and", "you", "your", "is", "are", "what", "can", "for", "to", "do", "have", "how", "my", "it", "we", "this", "that", "with", "hi", "hello", "thanks", "please"},
+    "ES": {"el", "la", "los", "las", "que", "de", "es", "en", "por", "para", "con", "una", "un", "y", "hola", "gracias", "cuánto", "cuando", "dónde", "tiene", "puedo", "usted", "mi", "su"},
+    "FR": {"le", "les", "des", "est", "et", "je", "vous", "nous", "pour", "avec", "une", "bonjour", "merci", "combien", "quand", "ou", "pas", "ce", "dans", "sur", "c'est"},
+    "PT": {"os", "as", "não", "você", "obrigado", "obrigada", "olá", "quanto", "quando", "onde", "tem", "posso", "com", "uma", "um", "é", "da", "do", "seu", "sua"},
+    "DE": {"der", "die", "das", "und", "ist", "ich", "sie", "nicht", "mit", "für", "ein", "eine", "hallo", "danke", "wie", "wann", "wo", "haben", "bitte", "zu"},
+    "IT": {"il", "gli", "di", "che", "è", "non", "per", "con", "una", "ciao", "grazie", "quanto", "quando", "dove", "ho", "sono", "mi", "ti", "della"},
+}
+
+WORD_RE = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)?", re.UNICODE)
+
+MIN_SCRIPT_LETTERS = 3
+MIN_LATIN_WORDS = 4
+
+def detect_script(text):
+    """
+    Returns (dominant_script, share) over letters, e.g. ("CYRILLIC", 0.93).
+    """
+    counts = {}
+    total = 0
+    for ch in text:
+        if not ch.isalpha():
+            continue
+        try:
+            script = unicodedata.name(ch).split(" ", 1)[0]
+        except ValueError:
+            continue
+        if script in ("CJK", "HIRAGANA", "KATAKANA"):
+            script = "CJK"
+        counts[script] = counts.get(script, 0) + 1
+        total += 1
+    if not total:
+        return None, 0.0
+    script = max(counts, key=counts.get)
+    return script, counts[script] / total
+
+def detect_latin_language(text):
+    """
+    Scores Latin-script text against the stopword profiles.
+    Returns a language code only when one non EN/ES language clearly wins, else None.
+    """
+    words = [w.lower() for w in WORD_RE.findall(text)]
+    if len(words) < MIN_LATIN_WORDS:
+        return None
+    scores = {lang: sum(1 for w in words if w in vocab) for lang, vocab in STOPWORDS.items()}
+    best = max(scores, key=scores.get)
+    supported = max(scores["EN"], scores["ES"])
+    if best in ("EN", "ES") or scores[best] < 3 or scores[best] < 2 * supported:
+        return None
+    return best
+
+def preclassify(body, max_chars=1000):
+    """
+    Offline routing for messages whose outcome is certain without an LLM.
+    Returns a NEEDS_REVIEW reason, or None when the message is ambiguous
+    and should fall through to classify_message.
+    """
+    text = body or ""
+
+    # Length / Emptiness
+    if not any(ch.isalnum() for ch in text):
+        return "No text content"
+    if len(text) > max_chars:
+        return f"Message too long ({len(text)} chars)"
+
+    # Opt-out
+    match = OPT_OUT_RE.match(text)
+    if match:
+        return f"Opt-out keyword ({match.group(1).upper()})"
+
+    # Risk keywords
+    for reason, pattern in RISK_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            return f"Risk HIGH ({reason}: '{match.group(0)}')"
+
+    # Language: non-Latin script, then Latin stopword profiles
+    script, share = detect_script(text)
+    letters = sum(1 for ch in text if ch.isalpha())
+    if script and script != "LATIN" and share >= 0.5 and letters >= MIN_SCRIPT_LETTERS:
+        return f"Language OTHER ({script} script)"
+    lang = detect_latin_language(text)
+    if lang:
+        return f"Language {lang} (Local detection)"
+
+    return None
@@ -0,0 +1,103 @@
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError: # Windows: no advisory locks, the budget stays per process
+    fcntl = None
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, holding at most `burst`.
+    Raises ValueError unless rate > 0 and burst >= 1 (a token could never be taken).
+    """
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(1.0, rate))
+        if self.rate <= 0 or self.capacity < 1:
+            raise ValueError(f"Token bucket needs rate > 0 and burst >= 1 (got rate={rate}, burst={burst})")
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def acquire(self):
+        """Blocks until a token is available."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+class SharedTokenBucket(TokenBucket):
+    """
+    Token bucket shared by every process opening the same state file (e.g. all gunicorn
+    workers sending from one number). Tokens and the wall-clock time of the last refill
+    live in the file, read and rewritten under an exclusive flock.
+    """
+    def __init__(self, path, rate, burst=None):
+        super().__init__(rate, burst)
+        self.path = path
+
+    def _take(self):
+        """Takes a token; returns 0, or the seconds to wait before one is available."""
+        with self._lock, open(self.path, "a+") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX) # Released on close
+            f.seek(0)
+            now = time.time()
+            try:
+                tokens, updated = (float(v) for v in f.read().split())
+            except ValueError: # New or unreadable file: start full
+                tokens, updated = self.capacity, now
+            tokens = min(self.capacity, tokens + max(0.0, now - updated) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            f.seek(0)
+            f.truncate()
+            f.write(f"{tokens} {now}")
+            return wait
+
+    def try_acquire(self):
+        return self._take() == 0
+
+    def acquire(self):
+        """Blocks until a token is available."""
+        while True:
+            wait = self._take()
+            if not wait:
+                return
+            time.sleep(wait)
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+def bucket_for(key, rate, burst=None, path=None):
+    """
+    Shared bucket per key (e.g. per sending number). Rebuilt if the configured rate changes.
+    With `path`, the budget is shared with other processes through that state file.
+    """
+    shared = path is not None and fcntl is not None
+    with _buckets_lock:
+        bucket = _buckets.get((key, path))
+        if bucket is None or bucket.rate != float(rate) or (burst is not None and bucket.capacity != float(burst)):
+            bucket = SharedTokenBucket(path, rate, burst) if shared else TokenBucket(rate, burst)
+            _buckets[(key, path)] = bucket
+        return bucket
@@ -0,0 +1,206 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from execution.utils.logging import get_logger
+from execution.utils.metrics import UPSTREAM_ATTEMPTS
+
+logger = get_logger(__name__)
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+def is_transient(error):
+    """
+    Timeouts, connection errors, 408/429 and 5xx are worth retrying (and count
+    against the breaker). Anything else is the request's own fault.
+    """
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status in (408, 409, 429) or status >= 500
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return type(error).__name__ in ("APITimeoutError", "APIConnectionError", "Timeout", "ReadTimeout", "ConnectTimeout")
+
+class CircuitBreaker:
+    """
+    CLOSED -> OPEN after `failure_threshold` consecutive transient failures.
+    OPEN fails fast for `reset_timeout` seconds, then HALF_OPEN lets one probe through:
+    success closes the circuit, failure re-opens it.
+    """
+    CLOSED, OPEN, HALF_OPEN = "CLOSED", "OPEN", "HALF_OPEN"
+
+    def __init__(self, failure_threshold, reset_timeout, on_open=None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.on_open = on_open
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("Circuit closed (upstream healthy again)")
+            self.state, self.failures, self._probing = self.CLOSED, 0, False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            tripped = self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold)
+            was_closed = self.state == self.CLOSED
+            if tripped:
+                self.state, self.opened_at, self._probing = self.OPEN, time.monotonic(), False
+        if tripped:
+            logger.warning(f"Circuit OPEN after {self.failures} failures; failing fast for {self.reset_timeout}s")
+            if was_closed and self.on_open:
+                try:
+                    self.on_open()
+                except Exception as e:
+                    logger.error(f"Circuit on_open hook failed: {e}")
+
+class AdaptiveTimeout:
+    """
+    Timeout = `multiplier` x the `percentile` of recent successful latencies,
+    clamped to [minimum, maximum]. Uses `initial` until `min_samples` are in.
+    """
+    def __init__(self, initial, minimum, maximum, percentile=0.99, multiplier=2.0, window=200, min_samples=20):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q):
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def current(self):
+        observed = self.quantile(self.percentile)
+        if observed is None:
+            return self.initial
+        return max(self.minimum, min(self.maximum, observed * self.multiplier))
+
+class Resilient:
+    """
+    Wraps calls to one upstream: circuit breaker, adaptive per-operation timeouts,
+    jittered exponential backoff on transient errors, and (optionally) a hedged
+    second request once the first is slower than the hedge percentile.
+    """
+    def __init__(self, name, breaker, timeouts, retries=2, backoff_base=0.5, backoff_max=4.0,
+                 hedge=False, hedge_percentile=0.95, hedge_workers=8, sleep=time.sleep):
+        self.name = name
+        self.breaker = breaker
+        self.timeouts = timeouts # callable() -> AdaptiveTimeout, one per operation
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_workers = hedge_workers
+        self._sleep = sleep
+        self._policies = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def policy(self, operation):
+        with self._lock:
+            if operation not in self._policies:
+                self._policies[operation] = self.timeouts()
+            return self._policies[operation]
+
+    def call(self, operation, fn):
+        """
+        Runs fn(timeout) with retries. Raises CircuitOpenError while the circuit is open,
+        otherwise the last error once retries are exhausted.
+        """
+        policy = self.policy(operation)
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                UPSTREAM_ATTEMPTS.inc(self.name, "rejected")
+                raise CircuitOpenError(f"{self.name} circuit open")
+            timeout = policy.current()
+            started = time.monotonic()
+            try:
+                result = self._hedged(fn, timeout, policy) if self.hedge else fn(timeout)
+            except Exception as e:
+                if not is_transient(e):
+                    self.breaker.record_success() # It answered; the request itself was bad
+                    UPSTREAM_ATTEMPTS.inc(self.name, "failed")
+                    raise
+                self.breaker.record_failure()
+                if attempt == self.retries:
+                    UPSTREAM_ATTEMPTS.inc(self.name, "failed")
+                    raise
+                UPSTREAM_ATTEMPTS.inc(self.name, "retry")
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt))) # Full jitter
+                logger.warning(f"{self.name} {operation} failed ({type(e).__name__}: {e}); retry {attempt + 1}/{self.retries} in {delay:.2f}s")
+                self._sleep(delay)
+                continue
+            policy.observe(time.monotonic() - started)
+            self.breaker.record_success()
+            UPSTREAM_ATTEMPTS.inc(self.name, "ok")
+            return result
+
+    def _hedged(self, fn, timeout, policy):
+        """
+        First request, plus a second one if the first has not answered within the hedge
+        percentile. The first success wins; the loser runs to completion in the background
+        (a blocking HTTP call cannot be cancelled), so hedging costs extra requests.
+        """
+        hedge_after = policy.quantile(self.hedge_percentile)
+        if hedge_after is None or hedge_after >= timeout:
+            return fn(timeout)
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.hedge_workers, thread_name_prefix=f"{self.name}-hedge")
+            executor = self._executor
+        pending = {executor.submit(fn, timeout)}
+        done, pending = wait(pending, timeout=hedge_after)
+        if not done:
+            UPSTREAM_ATTEMPTS.inc(self.name, "hedged")
+            pending.add(executor.submit(fn, timeout))
+        error = None
+        while True:
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+            if not pending:
+                raise error
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+    def snapshot(self):
+        """State for /health."""
+        with self._lock:
+            policies = dict(self._policies)
+        return {
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "timeouts": {op: round(p.current(), 2) for op, p in policies.items()},
+        }
@@ -0,0 +1,85 @@
+import queue
+import threading
+import zlib
+from execution.utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+_STOP = object()
+
+class KeyedWorkerPool:
+    """
+    Fixed pool of worker threads, one bounded queue per worker.
+    Items are routed by key (e.g. thread_id), so items sharing a key are
+    handled by the same worker in submission order.
+    """
+    def __init__(self, name, handler, workers, queue_size, submit_timeout=0.0):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self.queue_size = queue_size
+        self.submit_timeout = submit_timeout
+        self._queues = []
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._queues = [queue.Queue(maxsize=self.queue_size) for _ in range(self.workers)]
+            for i, q in enumerate(self._queues):
+                t = threading.Thread(target=self._run, args=(q,), name=f"{self.name}-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+        logger.info(f"Worker pool {self.name} started ({self.workers} workers, queue {self.queue_size} each)")
+
+    def running(self):
+        return bool(self._threads)
+
+    def submit(self, key, item):
+        """
+        Enqueues item on the worker that owns key.
+        Returns False if that worker's queue stays full for submit_timeout (backpressure).
+        """
+        if not self._threads:
+            self.start()
+        q = self._queues[zlib.crc32(str(key).encode()) % self.workers]
+        try:
+            if self.submit_timeout:
+                q.put(item, timeout=self.submit_timeout)
+            else:
+                q.put_nowait(item)
+            return True
+        except queue.Full:
+            logger.warning(f"Worker pool {self.name} saturated. Shedding {item}.")
+            return False
+
+    def depth(self):
+        return sum(q.qsize() for q in self._queues)
+
+    def stop(self, timeout=None):
+        with self._lock:
+            for q in self._queues:
+                q.put(_STOP)
+            for t in self._threads:
+                t.join(timeout)
+            self._queues = []
+            self._threads = []
+
+    def _run(self, q):
+        while True:
+            item = q.get()
+            try:
+                if item is _STOP:
+                    return
+                self.handler(item)
+            except Exception as e:
+                logger.error(f"Worker pool {self.name} handler error for {item}: {e}")
+            finally:
+                q.task_done()
+
+    def join(self):
+        """Blocks until every queued item has been handled."""
+        for q in list(self._queues):
+            q.join()